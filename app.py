@@ -1,7 +1,5 @@
-import json
-import os
 from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QStackedWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from panels.user_panel import UserPanel
 from panels.admin_login import AdminLogin
 from panels.admin_panel import AdminPanel
@@ -9,6 +7,16 @@ from panels.edit_panel import EditPanel
 from panels.keyboard import Keyboard
 from panels.change_password_panel import ChangePasswordPanel
 from panels.items_list_panel import ItemsListPanel
+from panels.sales_panel import SalesPanel
+from panels.self_test_panel import SelfTestPanel
+from item_store import ItemStore
+from planogram import Planogram
+from ledger import Ledger
+from rollups import SalesRollup
+from catalog import Catalog
+from catalog_watcher import CatalogWatcher
+import hardware
+import metrics
 
 class VendingMachineApp(QMainWindow):
     def __init__(self):
@@ -18,7 +26,18 @@ class VendingMachineApp(QMainWindow):
         """
         super().__init__()
         self.items_file = "vending_items.json"
+        self.db_file = "vending_items.db"
+        self.planogram = Planogram.load("planogram.json")
+        self.hardware_config = hardware.load_config("hardware.json")
+        self.clock = hardware.create_clock(self.hardware_config)
+        self.store = ItemStore(self.db_file, json_file=self.items_file)
+        self.catalog = Catalog(self.store, self.planogram, self)
         self.load_items()
+        # Hot-reload catalog files pushed by the back office
+        self.catalog_watcher = CatalogWatcher(self.catalog, self.items_file, parent=self)
+        # Append-only record of payments and dispense outcomes
+        self.ledger = Ledger("ledger")
+        self.sales_rollup = SalesRollup("ledger/rollups.db", self.ledger)
         self.current_input = ""
         self.selected_items = []
         self.total_price = 0
@@ -29,8 +48,17 @@ class VendingMachineApp(QMainWindow):
         self.admin_panel = AdminPanel(self)
         self.edit_panel = EditPanel(self)
         self.keyboard = Keyboard(self)
-        self.change_password_panel = ChangePasswordPanel(self, items_file=self.items_file)
-        self.items_list_panel = ItemsListPanel(self, items_file=self.items_file)
+        self.change_password_panel = ChangePasswordPanel(self)
+        self.items_list_panel = ItemsListPanel(self)
+        self.sales_panel = SalesPanel(self)
+        self.self_test_panel = SelfTestPanel(self)
+
+        # Publish latency and payment timeout metrics for monitoring
+        self.metrics_file = "metrics.json"
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(60_000)
+        self.metrics_timer.timeout.connect(self.export_metrics)
+        self.metrics_timer.start()
 
         self.setup_ui()
         
@@ -62,6 +90,8 @@ class VendingMachineApp(QMainWindow):
         self.stacked_widget.addWidget(self.keyboard)
         self.stacked_widget.addWidget(self.change_password_panel)
         self.stacked_widget.addWidget(self.items_list_panel)
+        self.stacked_widget.addWidget(self.sales_panel)
+        self.stacked_widget.addWidget(self.self_test_panel)
         
         # Set initial screen to user panel
         self.stacked_widget.setCurrentWidget(self.user_panel)
@@ -123,40 +153,59 @@ class VendingMachineApp(QMainWindow):
     
     def load_items(self):
         """
-        Load vending machine items from a JSON file. If the file does not exist,
-        create a default set of items including the admin password.
+        Load vending machine items into the shared catalog. Slots of the
+        planogram that are not stored yet (first start, or a larger planogram)
+        are created empty, along with the default admin password.
         """
-        self.items_file = "vending_items.json"
         try:
-            if os.path.exists(self.items_file):
-                with open(self.items_file, 'r') as f:
-                    self.items = json.load(f)
-            else:
-                # Initialize default items if file is missing
-                self.items = {"admin_password": "1234"}
-                rows = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-                for i in range(1, 33):
-                    row = rows[(i-1)//4]
-                    col = (i-1)%4 + 1
-                    self.items[str(i)] = {
-                        "name": "",
-                        "price": 0,
-                        "location": f"{row}{col}"
-                    }
-                self.save_items()
+            items = self.store.load_items()
+            missing = {
+                code: item for code, item in self.planogram.default_items().items()
+                if code not in items
+            }
+            if "admin_password" not in items:
+                missing["admin_password"] = "1234"
+            if missing:
+                self.store.save_items(missing)
+            self.catalog.reload()
+            # Keep a last-known-good copy for crash recovery
+            self.store.snapshot()
         except Exception as e:
             print(f"Error loading items: {str(e)}")
-            self.items = {}
     
-    def save_items(self):
+    def export_metrics(self):
+        """Write the current metrics to the metrics file."""
+        try:
+            metrics.export(self.metrics_file)
+        except OSError as e:
+            print(f"Failed to export metrics: {str(e)}")
+
+    def closeEvent(self, event):
         """
-        Save vending machine items to the JSON file.
+        Stop the catalog watcher and any self-test, cancel pending card
+        payments, drain the dispense queue, release the relay hardware,
+        report and export the metrics while the card reader's queue can
+        still be read, release the card reader, flush the ledger, then
+        back up and close the item store when the application exits.
         """
+        self.catalog_watcher.stop()
+        self.self_test_panel.stop()
+        # Before the dispense queue, which still takes a cart paid meanwhile
+        self.user_panel.payment_queue.stop()
+        self.user_panel.dispense_queue.stop()
+        self.user_panel.relay_controller.close()
+        for line in metrics.format_report():
+            print(line)
+        self.export_metrics()
+        self.user_panel.card_reader.close()
+        self.ledger.close()
+        self.sales_rollup.close()
         try:
-            with open(self.items_file, 'w') as f:
-                json.dump(self.items, f, indent=4)
+            self.store.snapshot()
         except Exception as e:
-            print(f"Failed to save items: {str(e)}")
+            print(f"Failed to back up items: {str(e)}")
+        self.store.close()
+        super().closeEvent(event)
     
     def switch_screen(self, screen):
         """
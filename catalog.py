@@ -0,0 +1,371 @@
+"""
+Shared in-memory catalog of vending machine items.
+
+The catalog is loaded once from the item store and then owned by a single
+`Catalog` object. All panels read from it instead of hitting the disk, and
+every modification goes through it so the store and the in-memory copy
+never drift apart. Each change bumps a version counter and emits
+`changed` with only the slots that were touched.
+
+Slots are kept as compact `Slot` objects keyed by their integer code. The
+relay (matrix, row, col) of every slot is resolved once from the planogram
+when its location is set, so the dispensing path never parses location
+strings.
+"""
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import pulse_calibration
+import slot_health
+
+
+class Slot:
+    """
+    A single vending slot.
+
+    Uses __slots__ so each slot is a small fixed-layout object instead of a
+    loose dict. `matrix`, `row` and `col` are the precomputed relay
+    coordinates (None if the location is not part of the planogram).
+
+    `stock` is None when the slot's stock is not tracked. `reserved` counts
+    units sitting in a customer's cart and is never persisted.
+
+    `pulse_ms`, `drop_ms` and `drop_dev_ms` are the relay pulse profile
+    learned by pulse_calibration; all None until the slot has vended with
+    a drop sensor.
+
+    `attempts`, `timeouts`, `fail_streak` and `avg_pulse_ms` are the vend
+    health counters kept by slot_health. An `out_of_service` slot is not
+    sold until an admin puts it back in service.
+    """
+    __slots__ = ("code", "name", "price", "location", "matrix", "row", "col",
+                 "capacity", "stock", "reserved", "pulse_ms", "drop_ms", "drop_dev_ms",
+                 "attempts", "timeouts", "fail_streak", "avg_pulse_ms", "out_of_service")
+
+    def __init__(self, code, name="", price=0, location="", coords=None):
+        self.code = code
+        self.name = name
+        self.price = price
+        self.capacity = 0
+        self.stock = None
+        self.reserved = 0
+        self.pulse_ms = None
+        self.drop_ms = None
+        self.drop_dev_ms = None
+        self.attempts = 0
+        self.timeouts = 0
+        self.fail_streak = 0
+        self.avg_pulse_ms = None
+        self.out_of_service = False
+        self.set_location(location, coords)
+
+    def set_location(self, location, coords):
+        """Set the location and its (matrix, row, col) relay coordinates."""
+        self.location = location
+        self.matrix, self.row, self.col = coords or (None, None, None)
+
+    def is_available(self):
+        """Return True if the slot holds a named product with a price."""
+        return bool(self.name) and self.price > 0
+
+    def available_stock(self):
+        """Return the units that can still be added to a cart, or None if untracked."""
+        if self.stock is None:
+            return None
+        return self.stock - self.reserved
+
+
+class Catalog(QObject):
+    """
+    Single owner of the item data shown and sold by the machine.
+
+    Signals:
+        changed(int, dict): Emitted after every modification with the new
+                            version number and a dict of {code: Slot} for
+                            the changed slots only. A removed slot maps to None.
+    """
+    changed = pyqtSignal(int, dict)
+
+    # Persisted slot fields and the type each one is coerced to
+    FIELD_TYPES = {"name": str, "price": int, "location": str, "capacity": int, "stock": int,
+                   "pulse_ms": int, "drop_ms": int, "drop_dev_ms": int,
+                   "attempts": int, "timeouts": int, "fail_streak": int, "avg_pulse_ms": int,
+                   "out_of_service": bool}
+
+    # Fields written after every vend checked by the drop sensor
+    CALIBRATION_FIELDS = ("pulse_ms", "drop_ms", "drop_dev_ms",
+                          "attempts", "timeouts", "fail_streak", "avg_pulse_ms", "out_of_service")
+
+    def __init__(self, store, planogram, parent=None):
+        """
+        Initialize the catalog.
+
+        Args:
+            store (ItemStore): Persistent storage backing the catalog.
+            planogram (Planogram): Slot layout used to resolve relay coordinates.
+            parent (QObject, optional): Qt parent object.
+        """
+        super().__init__(parent)
+        self.store = store
+        self.planogram = planogram
+        self.version = 0
+        self.admin_password = "1234"
+        self._slots = {}        # code (int) -> Slot
+
+    def reload(self):
+        """
+        Re-read the whole catalog from the store and notify about any
+        slots that differ from the in-memory copy.
+        """
+        data = self.store.load_items()
+        self.admin_password = str(data.pop("admin_password", self.admin_password))
+        self._apply(self._parse(data), replace=True)
+
+    @classmethod
+    def _parse(cls, data, fields=None):
+        """
+        Convert legacy JSON layout items to {code: {field: value}}.
+
+        Only fields present in each item (and listed in `fields`, if given)
+        are returned, so partial items only touch what they specify.
+        """
+        fields = fields or cls.FIELD_TYPES
+        parsed = {}
+        for code, item in data.items():
+            if not code.isdigit():
+                continue
+            parsed[int(code)] = {
+                name: None if item[name] is None else cls.FIELD_TYPES[name](item[name])
+                for name in fields if name in item
+            }
+        return parsed
+
+    def _apply(self, items, replace=False):
+        """
+        Merge items into memory and emit `changed` for the slots that differ.
+
+        Existing Slot objects are updated in place, so references held by
+        other components stay valid.
+
+        Args:
+            items (dict): {code: {field: value}} to merge.
+            replace (bool): If True, slots missing from `items` are removed.
+
+        Returns:
+            dict: The changed slots, as emitted.
+        """
+        changed = {}
+        for code, fields in items.items():
+            slot = self._slots.get(code)
+            if slot is None:
+                slot = self._slots[code] = Slot(code)
+                changed[code] = slot
+            for name, value in fields.items():
+                if getattr(slot, name) == value:
+                    continue
+                if name == "location":
+                    slot.set_location(value, self.planogram.coords(value))
+                else:
+                    setattr(slot, name, value)
+                changed[code] = slot
+        if replace:
+            for code in set(self._slots) - set(items):
+                del self._slots[code]
+                changed[code] = None
+
+        self._notify(changed)
+        return changed
+
+    def _notify(self, changed):
+        """Bump the version and emit `changed` if anything changed."""
+        if changed:
+            self.version += 1
+            self.changed.emit(self.version, changed)
+
+    def get(self, code):
+        """
+        Return the Slot for an integer item code, or None if unknown.
+
+        The returned Slot is shared; callers must not modify it.
+        """
+        return self._slots.get(code)
+
+    def locations(self):
+        """Return {code: location} for every slot that has a location."""
+        return {code: slot.location for code, slot in self._slots.items() if slot.location}
+
+    def codes(self):
+        """Return all item codes in numeric order."""
+        return sorted(self._slots)
+
+    def update_item(self, code, **fields):
+        """
+        Update fields of one item, persist the row and notify listeners.
+
+        Args:
+            code (int): Item code.
+            **fields: Any of name, price, location, capacity, stock.
+
+        Returns:
+            bool: True if the item exists and was updated.
+        """
+        if code not in self._slots:
+            return False
+        if not self.store.update_item(code, **fields):
+            return False
+
+        self._apply({code: fields})
+        return True
+
+    def import_items(self, data):
+        """
+        Merge an externally supplied catalog (legacy JSON layout).
+
+        Only slots whose name, price, location or capacity differ from the
+        in-memory copy are written to the store, in a single transaction.
+        Slots not present in `data` are left untouched, and stock levels
+        are never taken from an imported file.
+
+        Args:
+            data (dict): Catalog in the legacy JSON layout.
+
+        Returns:
+            dict: The changed slots.
+        """
+        items = self._parse(data, fields=("name", "price", "location", "capacity"))
+        changed = {
+            code: fields for code, fields in items.items()
+            if code not in self._slots
+            or any(getattr(self._slots[code], name) != value for name, value in fields.items())
+        }
+        if changed:
+            self.store.save_items({str(code): fields for code, fields in changed.items()})
+        if "admin_password" in data and str(data["admin_password"]) != self.admin_password:
+            self.set_admin_password(data["admin_password"])
+        return self._apply(changed)
+
+    def reserve(self, code):
+        """
+        Reserve one unit of a slot for a customer's cart.
+
+        Reservations live in memory only; nothing is written to disk.
+
+        Args:
+            code (int): Item code.
+
+        Returns:
+            bool: False if the slot is sold out, True otherwise.
+        """
+        slot = self._slots.get(code)
+        if slot is None:
+            return False
+        if slot.stock is not None and slot.available_stock() <= 0:
+            return False
+        slot.reserved += 1
+        return True
+
+    def release(self, slots):
+        """
+        Return reserved units to the available stock (cart item removed,
+        cart abandoned or payment cancelled).
+
+        Args:
+            slots (list of Slot): One entry per reserved unit.
+        """
+        for slot in slots:
+            if slot.reserved > 0:
+                slot.reserved -= 1
+
+    def commit_dispensed(self, reserved, dispensed, timings=None, max_pulse=None):
+        """
+        Settle a finished purchase with a single store write.
+
+        All reservations of the purchase are released, the stock of every
+        slot that actually dispensed is decremented and the pulse profiles
+        and health counters are updated from the drop-sensor timings. A slot
+        that keeps timing out is taken out of service.
+
+        Args:
+            reserved (list of Slot): The reserved units of the purchase.
+            dispensed (list of Slot): The units confirmed as dispensed.
+            timings (list of tuple, optional): (code, seconds, dropped) per
+                                               activation, see pulse_calibration.
+            max_pulse (float, optional): The relay controller's drop timeout
+                                         (seconds), which caps the pulse limits.
+        """
+        self.release(reserved)
+
+        stocked = {}
+        for slot in dispensed:
+            if slot.stock is not None and slot.stock > 0:
+                slot.stock -= 1
+                stocked[slot.code] = slot
+
+        max_pulse_ms = round(max_pulse * 1000) if max_pulse else pulse_calibration.MAX_PULSE_MS
+        calibrated = {}
+        for code, seconds, dropped in timings or []:
+            slot = self._slots.get(code)
+            if slot is None:
+                continue
+            slot.drop_ms, slot.drop_dev_ms, slot.pulse_ms = pulse_calibration.update_profile(
+                slot.drop_ms, slot.drop_dev_ms, slot.pulse_ms, seconds, dropped, max_pulse_ms
+            )
+            slot.attempts, slot.timeouts, slot.fail_streak, slot.avg_pulse_ms, failing = \
+                slot_health.update_health(slot.attempts, slot.timeouts, slot.fail_streak,
+                                          slot.avg_pulse_ms, seconds, dropped)
+            if failing and not slot.out_of_service:
+                slot.out_of_service = True
+                print(f"Slot {slot.location or code} taken out of service after "
+                      f"{slot.fail_streak} failed vends in a row")
+            calibrated[code] = slot
+
+        with self.store.transaction():
+            if stocked:
+                self.store.set_stock({code: slot.stock for code, slot in stocked.items()})
+            if calibrated:
+                self.store.save_items({
+                    str(code): {field: getattr(slot, field) for field in self.CALIBRATION_FIELDS}
+                    for code, slot in calibrated.items()
+                })
+        self._notify({**stocked, **calibrated})
+
+    def set_in_service(self, code, in_service=True):
+        """
+        Put a slot back in service (after clearing a jam) or take it out.
+
+        Putting a slot back in service restarts its failure streak.
+
+        Args:
+            code (int): Item code.
+            in_service (bool): Whether the slot may be sold.
+
+        Returns:
+            bool: True if the item exists and was updated.
+        """
+        fields = {"out_of_service": not in_service}
+        if in_service:
+            fields["fail_streak"] = 0
+        return self.update_item(code, **fields)
+
+    def restock_all(self):
+        """
+        Refill every slot with a configured capacity, in one transaction.
+
+        Returns:
+            int: Number of slots whose stock changed.
+        """
+        changed = {
+            code: slot for code, slot in self._slots.items()
+            if slot.capacity > 0 and slot.stock != slot.capacity
+        }
+        if changed:
+            self.store.set_stock({code: slot.capacity for code, slot in changed.items()})
+            for slot in changed.values():
+                slot.stock = slot.capacity
+        self._notify(changed)
+        return len(changed)
+
+    def set_admin_password(self, password):
+        """Persist a new admin password."""
+        self.store.set_setting("admin_password", password)
+        self.admin_password = str(password)
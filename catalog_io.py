@@ -0,0 +1,325 @@
+"""
+Bulk import and export of planogram slots and prices.
+
+Supported formats (chosen by file extension):
+    .csv    Header row with: code, name, price[, location][, capacity]
+    .jsonl  One JSON object per line with the same keys
+    .json   Either the legacy `vending_items.json` layout or a list of
+            row objects
+
+Rows are streamed and validated against the planogram one at a time. A
+file with any invalid row is rejected as a whole; a valid file is applied
+with a single store transaction.
+
+Command line usage:
+
+    python catalog_io.py import prices.csv
+    python catalog_io.py export catalog.csv
+
+`import` validates the file against the item database and the rows
+already waiting in the watched catalog file (`vending_items.json`), merges
+the rows into that file and replaces it with an atomic rename, so an
+earlier drop the machine has not applied yet is kept. The running machine
+hot-reloads it; a stopped machine picks it up on its next start.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from utils import atomic_write_json, fsync_replace
+
+
+FIELDS = ["code", "name", "price", "location", "capacity"]
+
+# Number of row errors reported before giving up on a file
+MAX_ERRORS = 20
+
+
+def read_rows(path):
+    """
+    Stream raw rows from an import file.
+
+    Args:
+        path (str): CSV, JSONL or JSON file.
+
+    Yields:
+        tuple: (line or entry number, row dict)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+    elif ext == ".jsonl":
+        with open(path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+    elif ext == ".json":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        yield from json_rows(data)
+    else:
+        raise ValueError(f"Unsupported file type: {ext or path}")
+
+
+def json_rows(data):
+    """
+    Yield numbered rows from parsed JSON: either the legacy layout keyed by
+    item code or a list of row objects.
+    """
+    if isinstance(data, dict):
+        data = [dict(item, code=code) for code, item in data.items() if code.isdigit()]
+    for number, row in enumerate(data, start=1):
+        yield number, row
+
+
+def validate_row(row, planogram):
+    """
+    Normalize one row and check it against the planogram.
+
+    Args:
+        row (dict): Raw row with at least `code`.
+        planogram (Planogram): Layout the row must fit.
+
+    Returns:
+        dict: Row with integer code and only the fields it specified.
+
+    Raises:
+        ValueError: If the row is invalid.
+    """
+    try:
+        code = int(str(row.get("code", "")).strip())
+    except ValueError:
+        raise ValueError(f"invalid code {row.get('code')!r}")
+    if planogram.location_for_code(code) is None:
+        raise ValueError(f"code {code} is outside the planogram (1-{planogram.slot_count})")
+
+    item = {"code": code}
+    if row.get("name") is not None:
+        item["name"] = str(row["name"]).strip()
+    for field in ("price", "capacity"):
+        value = row.get(field)
+        if value is None or str(value).strip() == "":
+            continue
+        try:
+            item[field] = int(str(value).strip())
+        except ValueError:
+            raise ValueError(f"invalid {field} {value!r}")
+        if item[field] < 0:
+            raise ValueError(f"{field} must not be negative")
+    location = str(row.get("location") or "").strip().upper()
+    if location:
+        if planogram.coords(location) is None:
+            raise ValueError(f"location {location} is not part of the planogram")
+        item["location"] = location
+    return item
+
+
+def load_import(path, planogram, existing=None):
+    """
+    Stream and validate a whole import file.
+
+    Args:
+        path (str): Import file.
+        planogram (Planogram): Layout to validate against.
+        existing (dict, optional): See validate_rows().
+
+    Returns:
+        tuple: See validate_rows().
+    """
+    return validate_rows(read_rows(path), planogram, existing)
+
+
+def validate_rows(rows, planogram, existing=None):
+    """
+    Validate a stream of rows.
+
+    A location may be used by one slot only, counting both the rows and
+    the existing slots whose location the rows leave as it is.
+
+    Args:
+        rows (iterable): (row number, row dict) pairs.
+        planogram (Planogram): Layout to validate against.
+        existing (dict, optional): {code (int): location} of the slots
+                                   already in the catalog.
+
+    Returns:
+        tuple: (items, errors) where items is a legacy-layout dict
+               {"code": {field: value}} and errors a list of messages.
+               Items must only be applied if errors is empty.
+    """
+    items = {}
+    errors = []
+    located = {}   # location -> (row number, code) of the row that sets it
+    for number, row in rows:
+        try:
+            item = validate_row(row, planogram)
+        except ValueError as e:
+            errors.append(f"Row {number}: {e}")
+            if len(errors) >= MAX_ERRORS:
+                errors.append("Too many errors, stopped reading")
+                break
+            continue
+        code = str(item.pop("code"))
+        if code in items:
+            errors.append(f"Row {number}: code {code} appears more than once")
+            continue
+        location = item.get("location")
+        if location in located:
+            errors.append(f"Row {number}: location {location} is already used by code {located[location][1]}")
+            continue
+        if location:
+            located[location] = (number, code)
+        items[code] = item
+
+    # Existing slots keep their location unless a row sets a new one
+    kept = {location: str(code) for code, location in (existing or {}).items()
+            if "location" not in items.get(str(code), {})}
+    for location, (number, code) in located.items():
+        if kept.get(location, code) != code:
+            errors.append(f"Row {number}: location {location} is already used by code {kept[location]}")
+    return items, errors
+
+
+def import_file(path, catalog):
+    """
+    Validate an import file and apply it to the catalog in one transaction.
+
+    Args:
+        path (str): Import file.
+        catalog (Catalog): Catalog to update.
+
+    Returns:
+        tuple: (number of changed slots, list of errors). Nothing is
+               written if the error list is not empty.
+    """
+    items, errors = load_import(path, catalog.planogram, catalog.locations())
+    if errors:
+        return 0, errors
+    return len(catalog.import_items(items)), []
+
+
+def export_file(path, catalog):
+    """
+    Stream every slot of the catalog to a CSV, JSONL or JSON file, written
+    atomically via temp-file-plus-rename.
+
+    Args:
+        path (str): Destination file; the format follows its extension.
+        catalog (Catalog): Catalog to export.
+
+    Returns:
+        int: Number of exported slots.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in (".csv", ".jsonl", ".json"):
+        raise ValueError(f"Unsupported file type: {ext or path}")
+    codes = catalog.codes()
+    if ext == ".json":
+        atomic_write_json(path, {str(code): _export_row(catalog.get(code)) for code in codes})
+        return len(codes)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        if ext == ".csv":
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for code in codes:
+                writer.writerow(dict(_export_row(catalog.get(code)), code=code))
+        else:
+            for code in codes:
+                f.write(json.dumps(dict(_export_row(catalog.get(code)), code=code), ensure_ascii=False) + "\n")
+    fsync_replace(tmp_path, path)
+    return len(codes)
+
+
+def _pending_items(path):
+    """Return the rows waiting in the watched catalog file, or {} if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: top-level JSON value must be an object")
+    return data
+
+
+def _stored_locations(db_path):
+    """Return {code: location} of the item database, or None if there is none."""
+    if not os.path.exists(db_path):
+        return None
+    from item_store import ItemStore
+
+    store = ItemStore(db_path)
+    items = store.load_items()
+    store.close()
+    return {int(code): item["location"] for code, item in items.items()
+            if code.isdigit() and item.get("location")}
+
+
+def _export_row(slot):
+    """Return the exported fields of one slot."""
+    return {"name": slot.name, "price": slot.price, "location": slot.location, "capacity": slot.capacity}
+
+
+def main(argv=None):
+    """Command line entry point."""
+    from planogram import Planogram
+
+    parser = argparse.ArgumentParser(description="Bulk import/export of vending machine slots and prices.")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("file", help="CSV, JSONL or JSON file")
+    parser.add_argument("--planogram", default="planogram.json")
+    parser.add_argument("--catalog-file", default="vending_items.json",
+                        help="Watched catalog file that imports are dropped into")
+    parser.add_argument("--db", default="vending_items.db",
+                        help="Item database to export from and to check imported locations against")
+    args = parser.parse_args(argv)
+
+    planogram = Planogram.load(args.planogram)
+
+    if args.action == "import":
+        try:
+            pending = _pending_items(args.catalog_file)
+        except ValueError as e:
+            print(f"Cannot merge into {args.catalog_file}: {e}", file=sys.stderr)
+            return 1
+        stored = _stored_locations(args.db)
+        # Rows not applied yet will move their slots before this file's rows do
+        existing = dict(stored or {})
+        existing.update(
+            (int(code), str(item["location"]).strip().upper()) for code, item in pending.items()
+            if code.isdigit() and isinstance(item, dict) and item.get("location")
+        )
+        items, errors = load_import(args.file, planogram, existing)
+        if errors:
+            print("\n".join(errors), file=sys.stderr)
+            return 1
+        for code, item in items.items():
+            pending.setdefault(code, {}).update(item)
+        atomic_write_json(args.catalog_file, pending)
+        print(f"Validated {len(items)} row(s) and merged them into {args.catalog_file}")
+        if stored is None:
+            print(f"No item database at {args.db}: locations used by the machine's slots "
+                  f"are only checked when the machine loads the file")
+        return 0
+
+    from item_store import ItemStore
+    from catalog import Catalog
+
+    store = ItemStore(args.db)
+    catalog = Catalog(store, planogram)
+    catalog.reload()
+    count = export_file(args.file, catalog)
+    store.close()
+    print(f"Exported {count} slot(s) to {args.file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Hot-reload of `vending_items.json` pushed by the back office.
+
+`CatalogWatcher` watches the file (inotify via QFileSystemWatcher on Linux),
+debounces bursts of writes, parses and validates the new file against the
+planogram in a background thread and hands it to the shared catalog, which
+applies only the slots that changed.
+"""
+
+import json
+import os
+
+from PyQt5.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+
+from catalog_io import json_rows, validate_rows
+
+
+class CatalogFileReader(QObject):
+    """
+    Worker that reads, parses and validates the catalog file off the UI thread.
+    """
+    loaded = pyqtSignal(dict, str)   # Validated data and file signature
+    failed = pyqtSignal(str)         # Error message
+
+    def __init__(self, planogram):
+        super().__init__()
+        self.planogram = planogram
+
+    def read(self, path, existing):
+        """
+        Parse and validate the JSON file at `path` and emit the result.
+
+        Args:
+            path (str): Catalog file.
+            existing (dict): {code: location} of the catalog's slots.
+        """
+        try:
+            signature = file_signature(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("top-level JSON value must be an object")
+            items, errors = validate_rows(json_rows(data), self.planogram, existing)
+            if errors:
+                raise ValueError("; ".join(errors))
+            if "admin_password" in data:
+                items["admin_password"] = data["admin_password"]
+            self.loaded.emit(items, signature)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+def file_signature(path):
+    """Return a cheap change signature (mtime and size) for a file, or '' if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+class CatalogWatcher(QObject):
+    """
+    Watch the catalog JSON file and merge changes into the catalog.
+
+    The directory is watched as well as the file, because the back office
+    usually replaces the file by renaming a new one over it, which drops
+    the watch on the old inode.
+    """
+    read_requested = pyqtSignal(str, object)   # Path and the catalog's {code: location}
+
+    # Setting key used to remember the last imported file version
+    SIGNATURE_KEY = "catalog_file_signature"
+
+    def __init__(self, catalog, path, debounce_ms=500, parent=None):
+        """
+        Initialize the watcher.
+
+        Args:
+            catalog (Catalog): Shared catalog to update.
+            path (str): Path of the JSON file to watch.
+            debounce_ms (int): Quiet period after the last write before reloading.
+            parent (QObject, optional): Qt parent object.
+        """
+        super().__init__(parent)
+        self.catalog = catalog
+        self.path = os.path.abspath(path)
+
+        # Debounce timer: restarted on every file event
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(debounce_ms)
+        self.debounce_timer.timeout.connect(self.reload)
+
+        # Background reader thread, reused for every reload
+        self._thread = QThread()
+        self._reader = CatalogFileReader(catalog.planogram)
+        self._reader.moveToThread(self._thread)
+        self.read_requested.connect(self._reader.read)
+        self._reader.loaded.connect(self._on_loaded)
+        self._reader.failed.connect(self._on_failed)
+        self._thread.start()
+
+        self.fs_watcher = QFileSystemWatcher(self)
+        self.fs_watcher.fileChanged.connect(self._on_fs_event)
+        self.fs_watcher.directoryChanged.connect(self._on_fs_event)
+        self._watch()
+
+        # Pick up a file pushed while the application was not running
+        stored = self.catalog.store.get_setting(self.SIGNATURE_KEY)
+        current = file_signature(self.path)
+        if stored is None:
+            self.catalog.store.set_setting(self.SIGNATURE_KEY, current)
+        elif current and current != stored:
+            self.debounce_timer.start()
+
+    def _watch(self):
+        """(Re-)register the file and its directory with the file system watcher."""
+        directory = os.path.dirname(self.path)
+        if directory not in self.fs_watcher.directories():
+            self.fs_watcher.addPath(directory)
+        if os.path.exists(self.path) and self.path not in self.fs_watcher.files():
+            self.fs_watcher.addPath(self.path)
+
+    def _on_fs_event(self, path):
+        """Restart the debounce timer on every change notification."""
+        self._watch()
+        if file_signature(self.path) != self.catalog.store.get_setting(self.SIGNATURE_KEY):
+            self.debounce_timer.start()
+
+    def reload(self):
+        """Ask the background reader to parse the file."""
+        if os.path.exists(self.path):
+            # Snapshot the locations here; the catalog is only touched on the UI thread
+            self.read_requested.emit(self.path, self.catalog.locations())
+
+    def _on_loaded(self, data, signature):
+        """Merge freshly parsed data into the catalog (runs on the UI thread)."""
+        try:
+            changed = self.catalog.import_items(data)
+            self.catalog.store.set_setting(self.SIGNATURE_KEY, signature)
+            if changed:
+                print(f"Catalog reloaded: {len(changed)} slot(s) changed")
+        except Exception as e:
+            self._on_failed(str(e))
+
+    def _on_failed(self, message):
+        """Keep the current catalog when the pushed file cannot be used."""
+        print(f"Failed to reload catalog file: {message}")
+
+    def stop(self):
+        """Stop watching and shut down the reader thread."""
+        self.debounce_timer.stop()
+        self.fs_watcher.removePaths(self.fs_watcher.files() + self.fs_watcher.directories())
+        self._thread.quit()
+        self._thread.wait()
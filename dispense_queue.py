@@ -0,0 +1,192 @@
+"""
+Dispense job queue.
+
+A single `DispenseQueue` owns the relay hardware. Paid purchases are
+submitted as jobs and run one at a time, in submission order, on a
+dedicated worker thread, so the user panel can take the next customer's
+selection and payment while earlier jobs are still dropping products.
+Each job streams its status messages under its job ID and can be
+cancelled while it is queued or between two items while it runs. Other
+relay work, such as the self-test sweep, runs as a task on the same
+thread, so only one thing ever drives the relays.
+"""
+
+import itertools
+import threading
+import time
+
+from PyQt5.QtCore import QCoreApplication, QObject, QThread, pyqtSignal
+
+
+class DispenseJob:
+    """
+    One paid purchase waiting for, or going through, the relay.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
+    def __init__(self, job_id, items, transaction_id=None):
+        """
+        Args:
+            job_id (int): Sequential job ID.
+            items (list of Slot): Slots to dispense, one entry per unit.
+            transaction_id (str, optional): Payment the job belongs to.
+        """
+        self.id = job_id
+        self.items = list(items)
+        self.transaction_id = transaction_id
+        # Names and prices as paid, in case the catalog changes while queued
+        self.receipt = [{"code": slot.code, "name": slot.name, "price": slot.price} for slot in items]
+        self.state = self.QUEUED
+        self.errors = []
+        self.timings = []   # (code, seconds, dropped) per relay activation
+        self.submitted_at = time.time()
+        self.cancel_event = threading.Event()
+
+
+class DispenseWorker(QObject):
+    """
+    Worker that runs dispense jobs on the hardware thread.
+    """
+    status = pyqtSignal(int, str)           # Job ID and relay status message
+    finished = pyqtSignal(int, list, list)  # Job ID, selected and actually dispensed slots
+
+    def __init__(self, relay_controller):
+        super().__init__()
+        self.relay_controller = relay_controller
+
+    def run(self, job):
+        """Execute one job via the relay controller; None stops the thread."""
+        if job is None:
+            QThread.currentThread().quit()
+            return
+        if job.cancel_event.is_set():
+            job.state = DispenseJob.CANCELLED
+            self.finished.emit(job.id, job.items, [])
+            return
+
+        job.state = DispenseJob.RUNNING
+
+        def status_callback(msg):
+            self.status.emit(job.id, msg)
+
+        try:
+            dispensed = self.relay_controller.dispense(job.items, status_callback, job.cancel_event, job.timings)
+        except Exception as e:
+            status_callback(f"Error dispensing: {e}")
+            dispensed = []
+        job.state = DispenseJob.CANCELLED if job.cancel_event.is_set() else DispenseJob.DONE
+        self.finished.emit(job.id, job.items, dispensed or [])
+
+    def run_task(self, task):
+        """Run a callable that drives the relays between two jobs."""
+        task()
+
+
+class DispenseQueue(QObject):
+    """
+    FIFO queue of dispense jobs served by one long-lived hardware thread.
+    """
+    job_requested = pyqtSignal(object)
+    task_requested = pyqtSignal(object)
+    job_status = pyqtSignal(int, str)           # Job ID and status message
+    job_finished = pyqtSignal(int, list, list)  # Job ID, selected and dispensed slots
+
+    def __init__(self, relay_controller, parent=None):
+        """
+        Start the hardware thread.
+
+        Args:
+            relay_controller: Controller whose `dispense` drives the relays.
+            parent (QObject, optional): Qt parent object.
+        """
+        super().__init__(parent)
+        self.jobs = {}   # Job ID -> DispenseJob, until the job has finished
+        self._ids = itertools.count(1)
+
+        # Jobs are delivered to the worker through its thread's event queue,
+        # which runs them one at a time in submission order
+        self._thread = QThread()
+        self._worker = DispenseWorker(relay_controller)
+        self._worker.moveToThread(self._thread)
+        self.job_requested.connect(self._worker.run)
+        self.task_requested.connect(self._worker.run_task)
+        self._worker.status.connect(self._on_status)
+        self._worker.finished.connect(self._on_finished)
+        self._thread.start()
+
+    def submit(self, items, transaction_id=None):
+        """
+        Queue a purchase for dispensing.
+
+        Args:
+            items (list of Slot): Slots to dispense, one entry per unit.
+            transaction_id (str, optional): Payment the job belongs to.
+
+        Returns:
+            DispenseJob: The queued job.
+        """
+        job = DispenseJob(next(self._ids), items, transaction_id)
+        self.jobs[job.id] = job
+        self.job_requested.emit(job)
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job dispenses nothing; a running job stops
+        before its next item.
+
+        Returns:
+            bool: False if the job is unknown or already finished.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def run_task(self, task):
+        """
+        Run other relay work on the hardware thread, after the jobs queued
+        before it and before any submitted later.
+
+        Args:
+            task (callable): Called without arguments; it reports back
+                             through its own signals.
+        """
+        self.task_requested.emit(task)
+
+    def pending(self):
+        """Return the unfinished jobs, oldest first."""
+        return sorted(self.jobs.values(), key=lambda job: job.id)
+
+    def _on_status(self, job_id, msg):
+        """Keep error messages on the job and forward the status (UI thread)."""
+        job = self.jobs.get(job_id)
+        if job is not None and msg.startswith("Error"):
+            job.errors.append(msg)
+        self.job_status.emit(job_id, msg)
+
+    def _on_finished(self, job_id, selected, dispensed):
+        """Forget the finished job and forward the result (UI thread)."""
+        self.job_finished.emit(job_id, selected, dispensed)
+        self.jobs.pop(job_id, None)
+
+    def stop(self, cancel_pending=False):
+        """
+        Stop the hardware thread after the queued jobs have drained.
+
+        Args:
+            cancel_pending (bool): Cancel the queued jobs instead of running them.
+        """
+        if cancel_pending:
+            for job in self.jobs.values():
+                job.cancel_event.set()
+        # The sentinel is queued behind the pending jobs
+        self.job_requested.emit(None)
+        self._thread.wait()
+        # Deliver the results of the drained jobs before the caller shuts down
+        QCoreApplication.sendPostedEvents()
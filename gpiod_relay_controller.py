@@ -0,0 +1,156 @@
+"""
+Relay controller backend for the Linux GPIO character device (libgpiod v2).
+
+Used on boards where RPi.GPIO is unavailable (e.g. Raspberry Pi 5). All
+row and column lines of a matrix are held in one bulk line request, and
+every write of RelayMatrix (only the lines that change) is a single
+`set_values` call. The drop sensor is read from the kernel's edge event
+queue with a timeout, without a callback thread.
+"""
+
+from datetime import timedelta
+
+import gpiod
+from gpiod.line import Bias, Direction, Edge, Value
+
+from relay_controller import DropSensor, RelayController, RelayMatrix
+
+
+# RelayMatrix pin levels as gpiod line values
+LEVELS = {0: Value.INACTIVE, 1: Value.ACTIVE}
+
+
+class GpiodDropSensor(DropSensor):
+    """
+    IR drop sensor read through gpiod edge events.
+    """
+
+    def __init__(self, pin, chip, bouncetime_ms=20):
+        """
+        Args:
+            pin (int): Line offset of the IR receiver output (idle high).
+            chip (str): GPIO chip device, e.g. "/dev/gpiochip0".
+            bouncetime_ms (int): Debounce period in milliseconds.
+        """
+        self.chip = chip
+        self._request = None
+        super().__init__(pin, bouncetime_ms)
+
+    def setup(self):
+        """(Re-)request the sensor line with falling-edge detection."""
+        self.cleanup()
+        self._request = gpiod.request_lines(
+            self.chip,
+            consumer="vending-drop-sensor",
+            config={self.pin: gpiod.LineSettings(
+                direction=Direction.INPUT,
+                edge_detection=Edge.FALLING,
+                bias=Bias.PULL_UP,
+                debounce_period=timedelta(milliseconds=self.bouncetime_ms)
+            )}
+        )
+
+    def is_ready(self):
+        """True while the line request is still usable."""
+        try:
+            return self._request is not None and self._request.get_value(self.pin) is not None
+        except Exception:
+            return False
+
+    def arm(self):
+        """Discard edge events left over from before the relay was switched on."""
+        while self._request.wait_edge_events(0):
+            self._request.read_edge_events()
+
+    def wait(self, timeout):
+        """
+        Wait for the product to break the beam.
+
+        Returns:
+            bool: True if an edge arrived within `timeout` seconds.
+        """
+        return self._request.wait_edge_events(timeout)
+
+    def cleanup(self):
+        """Release the line request."""
+        if self._request is not None:
+            try:
+                self._request.release()
+            except Exception:
+                pass
+            self._request = None
+
+
+class GpiodRelayMatrix(RelayMatrix):
+    """
+    Relay matrix driven through one bulk gpiod line request.
+    """
+
+    def __init__(self, row_pins, col_pins, chip, **kwargs):
+        """
+        Args:
+            row_pins (list of int): Line offsets of the rows.
+            col_pins (list of int): Line offsets of the columns.
+            chip (str): GPIO chip device, e.g. "/dev/gpiochip0".
+            **kwargs: pulse_time, drop_sensor and drop_timeout, see RelayMatrix.
+        """
+        self.chip = chip
+        self._request = None
+        super().__init__(row_pins, col_pins, **kwargs)
+
+    def setup(self):
+        """(Re-)request all row and column lines as outputs, switched off."""
+        self.cleanup()
+        pins = self.row_pins + self.col_pins
+        self._request = gpiod.request_lines(
+            self.chip,
+            consumer="vending-relays",
+            config={tuple(pins): gpiod.LineSettings(
+                direction=Direction.OUTPUT, output_value=Value.INACTIVE
+            )}
+        )
+        self._levels = dict.fromkeys(pins, 0)
+
+    def is_ready(self):
+        """True while the line request is still usable."""
+        try:
+            return self._request is not None and len(self._request.get_values()) == len(self._levels)
+        except Exception:
+            return False
+
+    def _output(self, levels):
+        """Set several lines with one bulk write."""
+        self._request.set_values({pin: LEVELS[level] for pin, level in levels.items()})
+
+    def cleanup(self):
+        """Switch everything off and release the line request."""
+        if self._request is not None:
+            try:
+                self._reset(force=True)
+                self._request.release()
+            except Exception:
+                pass
+            self._request = None
+
+
+class GpiodRelayController(RelayController):
+    """
+    RelayController using the gpiod character device instead of RPi.GPIO.
+    """
+
+    def __init__(self, item_lookup_func, chip="/dev/gpiochip0", **kwargs):
+        """
+        Args:
+            item_lookup_func (callable): Returns the Slot for an integer item code.
+            chip (str): GPIO chip device holding the relay and sensor lines.
+            **kwargs: matrix_pins, sensor_pin, pulse_time and drop_timeout,
+                      see RelayController.
+        """
+        self.chip = chip
+        super().__init__(item_lookup_func, **kwargs)
+
+    def _make_sensor(self, pin):
+        return GpiodDropSensor(pin, self.chip)
+
+    def _make_matrix(self, row_pins, col_pins, **kwargs):
+        return GpiodRelayMatrix(row_pins, col_pins, self.chip, **kwargs)
@@ -0,0 +1,300 @@
+"""
+Hardware abstraction layer: relay and card reader backends chosen at startup.
+
+The backends and their settings are read from `hardware.json` if present:
+
+    {
+        "relay": {
+            "backend": "gpiod",
+            "chip": "/dev/gpiochip0",
+            "matrices": [
+                {"rows": [17, 27, 22, 23, 24, 25, 8, 7], "cols": [5, 6, 13, 19]}
+            ],
+            "sensor_pin": 26,
+            "pulse_time": 1.0,
+            "drop_timeout": 2.0,
+            "self_test_pulse": 0.1
+        },
+        "card_reader": {"backend": "mock", "payment_deadline": 60, "payment_retries": 2},
+        "simulation": {"clock": "scaled", "speed": 20}
+    }
+
+Relay backends: "rpi" (RPi.GPIO), "gpiod" (Linux GPIO character device),
+"mock" and "daemon"; card reader backends: "terminal" (persistent
+session to a payment terminal, see payment_terminal), "mock" and
+"daemon". The "daemon" backends forward to a separate hardware process
+over a Unix socket (optional "socket" path, see hardware_daemon). The
+pin map has one entry per planogram matrix, in the same order. Without
+the file both the relays and the card reader are mocked. The optional
+"simulation" section picks the clock of the mock backends (see
+sim_clock); real hardware always runs in real time. A payment is given
+up and reversed after "payment_deadline" seconds, and retried up to
+"payment_retries" times if the reader could not be reached. A
+"floor_limit" in the "card_reader" section turns on offline approval of
+charges up to that amount while the card issuer is unreachable (see
+offline_payments).
+
+Each backend can be timed on the target machine with:
+
+    python hardware.py benchmark --backend rpi --backend gpiod
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import metrics
+import sim_clock
+
+
+DEFAULT_CONFIG = {
+    "relay": {"backend": "mock"},
+    "card_reader": {"backend": "mock"},
+    "simulation": {"clock": "real"},
+}
+
+RELAY_BACKENDS = {}
+CARD_READER_BACKENDS = {}
+
+
+def relay_backend(name):
+    """Decorator registering a relay controller factory under `name`."""
+    def register(factory):
+        RELAY_BACKENDS[name] = factory
+        return factory
+    return register
+
+
+def card_reader_backend(name):
+    """Decorator registering a card reader factory under `name`."""
+    def register(factory):
+        CARD_READER_BACKENDS[name] = factory
+        return factory
+    return register
+
+
+def load_config(path="hardware.json"):
+    """
+    Load the hardware configuration, or the all-mock default if the file
+    does not exist.
+
+    Args:
+        path (str): Path to the configuration file.
+
+    Returns:
+        dict: Configuration with "relay", "card_reader" and "simulation" sections.
+    """
+    config = {section: dict(options) for section, options in DEFAULT_CONFIG.items()}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for section, options in json.load(f).items():
+                config.setdefault(section, {}).update(options)
+    return config
+
+
+def _options(config, *names):
+    """Return the subset of `config` holding the given keyword arguments."""
+    return {name: config[name] for name in names if name in config}
+
+
+def matrix_pins(config, planogram=None, default=None):
+    """
+    Read the relay pin map from a relay config section.
+
+    Args:
+        config (dict): The "relay" section.
+        planogram (Planogram, optional): Layout the pin map must match.
+        default (list of tuple, optional): The controller's built-in pin
+                                           map, checked against the
+                                           planogram when none is configured.
+
+    Returns:
+        list of tuple: (row_pins, col_pins) per matrix, or None to use the
+                       controller's built-in default.
+
+    Raises:
+        ValueError: If the pin map (or the default one) does not match the planogram.
+    """
+    if "matrices" in config:
+        pins = [([int(pin) for pin in m["rows"]], [int(pin) for pin in m["cols"]]) for m in config["matrices"]]
+        source = "Relay pin map"
+    else:
+        pins = None
+        source = "Default relay pin map (no \"matrices\" in hardware.json)"
+    if planogram is not None and (pins or default) is not None:
+        shapes = [(len(rows), len(cols)) for rows, cols in pins or default]
+        if shapes != planogram.shapes:
+            raise ValueError(f"{source} {shapes} does not match the planogram {planogram.shapes}")
+    return pins
+
+
+def create_clock(config):
+    """
+    Build the clock of the simulated backends from the "simulation" section.
+
+    Args:
+        config (dict): Full hardware configuration (see load_config()).
+    """
+    simulation = config["simulation"]
+    return sim_clock.create_clock(simulation.get("clock", "real"), float(simulation.get("speed", 1)))
+
+
+@relay_backend("mock")
+def _mock_relay(config, item_lookup, planogram=None, clock=None):
+    from mock_relay_controller import RelayController
+    return RelayController(item_lookup, clock=clock,
+                           **_options(config, "drop_time", "drop_timeout", "failure_rate"))
+
+
+@relay_backend("rpi")
+def _rpi_relay(config, item_lookup, planogram=None, clock=None):
+    from relay_controller import GPIO, RelayController
+    if GPIO is None:
+        raise ValueError("RPi.GPIO is not installed")
+    pins = matrix_pins(config, planogram, RelayController.DEFAULT_MATRIX_PINS)
+    return RelayController(item_lookup, matrix_pins=pins,
+                           **_options(config, "sensor_pin", "pulse_time", "drop_timeout"))
+
+
+@relay_backend("gpiod")
+def _gpiod_relay(config, item_lookup, planogram=None, clock=None):
+    from gpiod_relay_controller import GpiodRelayController
+    pins = matrix_pins(config, planogram, GpiodRelayController.DEFAULT_MATRIX_PINS)
+    return GpiodRelayController(item_lookup, matrix_pins=pins,
+                                **_options(config, "chip", "sensor_pin", "pulse_time", "drop_timeout"))
+
+
+@relay_backend("daemon")
+def _daemon_relay(config, item_lookup, planogram=None, clock=None):
+    from hardware_daemon import DEFAULT_SOCKET, RemoteRelayController
+    return RemoteRelayController(item_lookup, config.get("socket", DEFAULT_SOCKET),
+                                 **_options(config, "recover_timeout"))
+
+
+@card_reader_backend("mock")
+def _mock_card_reader(config, clock=None):
+    from mock_card_reader import CardReader
+    return CardReader(clock=clock)
+
+
+@card_reader_backend("terminal")
+def _terminal_card_reader(config, clock=None):
+    from payment_terminal import TerminalClient
+    return TerminalClient(**_options(config, "address", "timeout", "keepalive", "connect_timeout"))
+
+
+@card_reader_backend("daemon")
+def _daemon_card_reader(config, clock=None):
+    from hardware_daemon import DEFAULT_SOCKET, RemoteCardReader
+    return RemoteCardReader(config.get("socket", DEFAULT_SOCKET))
+
+
+def create_relay_controller(config, item_lookup, planogram=None, clock=None):
+    """
+    Build the relay controller selected by the configuration.
+
+    Args:
+        config (dict): Full hardware configuration (see load_config()).
+        item_lookup (callable): Returns the Slot for an integer item code.
+        planogram (Planogram, optional): Layout the pin map must match.
+        clock (optional): Clock for simulated backends (see create_clock()).
+
+    Raises:
+        ValueError: If the backend is unknown or its settings are invalid.
+    """
+    relay = config["relay"]
+    factory = RELAY_BACKENDS.get(relay.get("backend"))
+    if factory is None:
+        raise ValueError(f"Unknown relay backend {relay.get('backend')!r} "
+                         f"(available: {', '.join(sorted(RELAY_BACKENDS))})")
+    return factory(relay, item_lookup, planogram, clock)
+
+
+def create_card_reader(config, clock=None):
+    """
+    Build the card reader selected by the configuration.
+
+    Args:
+        config (dict): Full hardware configuration (see load_config()).
+        clock (optional): Clock for simulated backends (see create_clock()).
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    reader = config["card_reader"]
+    factory = CARD_READER_BACKENDS.get(reader.get("backend"))
+    if factory is None:
+        raise ValueError(f"Unknown card reader backend {reader.get('backend')!r} "
+                         f"(available: {', '.join(sorted(CARD_READER_BACKENDS))})")
+    card_reader = factory(reader, clock)
+    if not reader.get("floor_limit"):
+        return card_reader
+    from offline_payments import OfflineQueue, StoreAndForwardReader
+    queue = OfflineQueue(reader.get("offline_queue", "offline_queue.db"),
+                         int(reader.get("offline_max_entries", 200)), reader.get("offline_max_amount"))
+    return StoreAndForwardReader(card_reader, queue, int(reader["floor_limit"]),
+                                 **_options(reader, "batch_size", "forward_interval", "max_backoff"))
+
+
+def benchmark(name, controller, iterations=1000):
+    """
+    Time the driver operations of a relay backend that do not move a motor
+    (see the controller's `benchmark_ops`), e.g. switching every relay off,
+    the readiness check done before each activation and the batched pin
+    writes of one activation cycle.
+
+    Args:
+        name (str): Backend name used in the metric names.
+        controller: Relay controller built by create_relay_controller().
+        iterations (int): Number of timed calls per operation.
+
+    Returns:
+        dict: {metric name: summary} as returned by metrics.report().
+    """
+    names = []
+    for operation, call in controller.benchmark_ops().items():
+        stats = metrics.latency(f"benchmark.{name}.{operation}")
+        names.append(stats.name)
+        for _ in range(iterations):
+            start = time.perf_counter()
+            call()
+            stats.record(time.perf_counter() - start)
+    report = metrics.report()
+    return {metric: report[metric] for metric in names}
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Vending machine hardware backends.")
+    parser.add_argument("action", choices=["benchmark"])
+    parser.add_argument("--config", default="hardware.json")
+    parser.add_argument("--backend", action="append",
+                        help="Relay backend to benchmark (repeatable); defaults to the configured one")
+    parser.add_argument("-n", "--iterations", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    status = 0
+    for name in args.backend or [config["relay"]["backend"]]:
+        try:
+            controller = create_relay_controller(
+                dict(config, relay=dict(config["relay"], backend=name)), lambda code: None
+            )
+        except Exception as e:
+            print(f"{name}: unavailable ({e})", file=sys.stderr)
+            status = 1
+            continue
+        try:
+            for metric, s in benchmark(name, controller, args.iterations).items():
+                print(f"{metric}: mean={s['mean_ms'] * 1000:.1f} us p50={s['p50_ms'] * 1000:.1f} us "
+                      f"p95={s['p95_ms'] * 1000:.1f} us max={s['max_ms'] * 1000:.1f} us "
+                      f"jitter={s['jitter_ms'] * 1000:.1f} us")
+        finally:
+            controller.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,559 @@
+"""
+Hardware daemon: relays and card reader in their own process.
+
+The daemon owns the configured relay controller and card reader and
+serves them over a Unix domain socket, so coil timing never competes with
+the UI process for the interpreter lock, and either process can be
+restarted without the other. Start it with the hardware configuration of
+the real backends:
+
+    python hardware_daemon.py --config hardware-daemon.json
+
+and point the UI at it in its own hardware.json:
+
+    {"relay": {"backend": "daemon"}, "card_reader": {"backend": "daemon"}}
+
+Protocol: one JSON object per line in each direction.
+
+    request    {"id": 7, "op": "dispense", "args": {...}}
+    event      {"id": 7, "event": "status", "message": "Dispensing: ..."}
+    response   {"id": 7, "ok": true, "result": ...}
+               {"id": 7, "ok": false, "error": "..."}
+
+Operations: ping, is_ready, all_off, test_relay, dispense,
+dispense_result, cancel, charge, preauthorize, capture, void and reverse.
+Every request runs on its own thread, so a cancel or a payment is never
+stuck behind a dispense, but each device serves one request at a time;
+only reverse may reach the card reader while a payment is still in
+progress. A UI that disconnects mid-dispense does not stop the vend: the
+dispense carries a job key, and after reconnecting the UI asks for the
+outcome with dispense_result, which waits for the vend to finish. The
+daemon also prints the outcome of every dispense.
+"""
+
+import argparse
+import itertools
+from collections import OrderedDict
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+
+import hardware
+from planogram import Planogram
+
+
+DEFAULT_SOCKET = "/tmp/vending-hardware.sock"
+
+
+class SlotInfo:
+    """
+    The fields of a catalog Slot the relay backends need, as sent by the UI.
+    """
+    __slots__ = ("code", "name", "location", "matrix", "row", "col", "pulse_ms")
+
+    FIELDS = __slots__
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_slot(cls, slot):
+        """Return the wire form (dict) of a catalog Slot."""
+        return {name: getattr(slot, name) for name in cls.FIELDS}
+
+
+class _DispenseRun:
+    """A dispense the daemon ran or is running, kept so its outcome can be asked for again."""
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class HardwareDaemon:
+    """
+    Serves one relay controller and one card reader over a Unix socket.
+    """
+
+    # Number of finished dispenses whose outcome can still be asked for
+    KEPT_DISPENSES = 64
+
+    def __init__(self, config, planogram, socket_path=DEFAULT_SOCKET):
+        """
+        Build the configured backends.
+
+        Args:
+            config (dict): Hardware configuration (see hardware.load_config()).
+            planogram (Planogram): Layout the relay pin map must match.
+            socket_path (str): Path of the Unix socket to listen on.
+        """
+        self.socket_path = socket_path
+        clock = hardware.create_clock(config)
+        self._slots = {}   # code -> SlotInfo of the dispense in progress
+        self.relay_controller = hardware.create_relay_controller(config, self._slots.get, planogram, clock)
+        self.card_reader = hardware.create_card_reader(config, clock)
+        self._relay_lock = threading.Lock()
+        self._reader_lock = threading.Lock()
+        self._cancel_events = {}   # (connection, request id) -> threading.Event
+        self._dispenses = OrderedDict()   # job key -> _DispenseRun, oldest first
+        self._dispenses_lock = threading.Lock()
+        self._server = None
+
+    def serve_forever(self):
+        """Accept connections until shutdown() is called."""
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon._serve_connection(self.rfile, self.wfile)
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        print(f"Hardware daemon listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """Stop accepting requests (call from another thread or a signal handler)."""
+        if self._server:
+            threading.Thread(target=self._server.shutdown).start()
+
+    def close(self):
+        """Release the hardware: the relays, then the card reader."""
+        self.relay_controller.close()
+        self.card_reader.close()
+
+    def _serve_connection(self, rfile, wfile):
+        """Read requests from one client and run each on its own thread."""
+        write_lock = threading.Lock()
+
+        def send(message):
+            data = (json.dumps(message) + "\n").encode("utf-8")
+            with write_lock:
+                try:
+                    wfile.write(data)
+                    wfile.flush()
+                except OSError:
+                    pass   # Client gone; the request still runs to completion
+
+        for line in rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                send({"id": None, "ok": False, "error": f"Invalid request: {e}"})
+                continue
+            threading.Thread(target=self._handle, args=(wfile, request, send), daemon=True).start()
+
+    def _handle(self, connection, request, send):
+        """Run one request and send its events and response."""
+        request_id = request.get("id")
+        try:
+            result = self._dispatch(connection, request_id, request.get("op"), request.get("args") or {},
+                                    lambda message: send({"id": request_id, "event": "status", "message": message}))
+            send({"id": request_id, "ok": True, "result": result})
+        except Exception as e:
+            send({"id": request_id, "ok": False, "error": str(e)})
+
+    def _dispatch(self, connection, request_id, op, args, status_callback):
+        """Execute one operation and return its JSON-serialisable result."""
+        if op == "ping":
+            return "pong"
+        if op == "cancel":
+            event = self._cancel_events.get((connection, args.get("request")))
+            if event is not None:
+                event.set()
+            return event is not None
+        if op == "charge":
+            with self._reader_lock:
+                return self.card_reader.charge(args["amount"], args.get("client_txn_id"))
+        if op == "preauthorize":
+            with self._reader_lock:
+                return self.card_reader.preauthorize(args["amount"])
+        if op == "capture":
+            with self._reader_lock:
+                return self.card_reader.capture(args["auth_id"], args["amount"], args.get("client_txn_id"))
+        if op == "void":
+            with self._reader_lock:
+                return self.card_reader.void(args["auth_id"])
+        if op == "reverse":
+            # Not behind the reader lock: it cancels the payment holding it
+            return self.card_reader.reverse(args["client_txn_id"])
+        if op == "is_ready":
+            return self.relay_controller.is_ready()
+        if op == "all_off":
+            with self._relay_lock:
+                self.relay_controller.all_off()
+            return None
+        if op == "test_relay":
+            with self._relay_lock:
+                return list(self.relay_controller.test_relay(
+                    args["matrix"], args["row"], args["col"], args["pulse"]
+                ))
+        if op == "dispense":
+            return self._dispense((connection, request_id), args["items"], status_callback, args.get("job_key"))
+        if op == "dispense_result":
+            return self._dispense_result((connection, request_id), args["job_key"])
+        raise ValueError(f"Unknown operation {op!r}")
+
+    def _dispense(self, key, items, status_callback, job_key=None):
+        """
+        Dispense the items of one request; cancellable with the cancel op.
+        With a job key, the outcome can be fetched again with dispense_result.
+        """
+        infos = [SlotInfo(**item) for item in items]
+        run = _DispenseRun()
+        if job_key is not None:
+            with self._dispenses_lock:
+                self._dispenses[job_key] = run
+                while len(self._dispenses) > self.KEPT_DISPENSES:
+                    self._dispenses.popitem(last=False)
+        self._cancel_events[key] = run.cancel_event
+        timings = []
+        try:
+            with self._relay_lock:
+                self._slots.clear()
+                self._slots.update((info.code, info) for info in infos)
+                dispensed = self.relay_controller.dispense(infos, status_callback, run.cancel_event, timings)
+            dispensed_ids = {id(info) for info in dispensed}
+            run.result = {
+                "dispensed": [index for index, info in enumerate(infos) if id(info) in dispensed_ids],
+                "timings": timings
+            }
+        except Exception as e:
+            run.error = str(e)
+            raise
+        finally:
+            del self._cancel_events[key]
+            run.done.set()
+            # Kept in the daemon's log in case the UI never hears about it
+            outcome = run.error or f"{len(run.result['dispensed'])} of {len(infos)} item(s) dispensed"
+            print(f"Dispense {job_key or key[1]}: {outcome}")
+        return run.result
+
+    def _dispense_result(self, key, job_key):
+        """Wait for a dispense started under `job_key` and return its outcome."""
+        with self._dispenses_lock:
+            run = self._dispenses.get(job_key)
+        if run is None:
+            raise ValueError(f"Unknown dispense job {job_key}")
+        # A cancel sent for this request stops the vend it waits for
+        self._cancel_events[key] = run.cancel_event
+        try:
+            run.done.wait()
+        finally:
+            del self._cancel_events[key]
+        if run.error is not None:
+            raise RuntimeError(run.error)
+        return run.result
+
+
+class _Call:
+    """A request waiting for its response."""
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.done = threading.Event()
+        self.response = None
+
+
+class DaemonClient:
+    """
+    Connection to the hardware daemon, re-established on the next request
+    after either side restarted.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, connect_timeout=2.0):
+        """
+        Args:
+            socket_path (str): Path of the daemon's Unix socket.
+            connect_timeout (float): Longest wait for the connection (seconds).
+        """
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self._sock = None
+        self._ids = itertools.count(1)
+        self._pending = {}   # request id -> _Call
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the connection and start its reader thread (caller holds the lock)."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ConnectionError(f"Hardware daemon unavailable: {e}") from e
+        sock.settimeout(None)
+        self._sock = sock
+        threading.Thread(target=self._read, args=(sock,), name="hardware-daemon-client", daemon=True).start()
+
+    def _read(self, sock):
+        """Route events and responses to their waiting requests until the connection drops."""
+        try:
+            for line in sock.makefile("r", encoding="utf-8"):
+                message = json.loads(line)
+                call = self._pending.get(message.get("id"))
+                if call is None:
+                    continue
+                if "event" in message:
+                    if call.on_event:
+                        call.on_event(message)
+                else:
+                    call.response = message
+                    call.done.set()
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            sock.close()
+            # Requests still waiting will never get an answer on this connection
+            for call in self._pending.values():
+                if not call.done.is_set():
+                    call.response = {"ok": False, "error": "Connection to hardware daemon lost",
+                                     "lost": True}
+                    call.done.set()
+
+    def _send(self, message):
+        """Write one message, connecting first if needed."""
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                self._sock.sendall(data)
+            except OSError as e:
+                self._sock.close()
+                self._sock = None
+                raise ConnectionError(f"Hardware daemon unavailable: {e}") from e
+
+    def request(self, op, args=None, on_event=None, timeout=None, cancel_event=None):
+        """
+        Send a request and wait for its response.
+
+        Args:
+            op (str): Operation name.
+            args (dict, optional): Operation arguments.
+            on_event (callable, optional): Receives every event message of the request.
+            timeout (float, optional): Longest wait for the response (seconds).
+            cancel_event (threading.Event, optional): Once set, a cancel request
+                                                      is sent for this request.
+
+        Returns:
+            The operation's result.
+
+        Raises:
+            ConnectionError: If the daemon cannot be reached or the connection drops.
+            TimeoutError: If no response arrived within `timeout`.
+            RuntimeError: If the daemon reports an error.
+        """
+        request_id = next(self._ids)
+        call = _Call(on_event)
+        with self._lock:
+            self._pending[request_id] = call
+        try:
+            self._send({"id": request_id, "op": op, "args": args or {}})
+            waited, cancelled = 0.0, False
+            while not call.done.wait(0.05):
+                waited += 0.05
+                if cancel_event is not None and cancel_event.is_set() and not cancelled:
+                    self._send({"id": next(self._ids), "op": "cancel", "args": {"request": request_id}})
+                    cancelled = True
+                if timeout is not None and waited >= timeout:
+                    raise TimeoutError(f"Hardware daemon did not answer {op} within {timeout} s")
+        finally:
+            with self._lock:
+                del self._pending[request_id]
+        response = call.response
+        if response.get("lost"):
+            raise ConnectionError(response["error"])
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error"))
+        return response.get("result")
+
+    def close(self):
+        """Close the connection."""
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+
+class RemoteRelayController:
+    """
+    Relay controller backend forwarding every operation to the hardware daemon.
+    """
+
+    def __init__(self, item_lookup_func, socket_path=DEFAULT_SOCKET, recover_timeout=30.0):
+        """
+        Args:
+            item_lookup_func (callable): Returns the Slot for an integer item code.
+            socket_path (str): Path of the daemon's Unix socket.
+            recover_timeout (float): How long to keep reconnecting for the
+                                     outcome of a dispense whose connection dropped.
+        """
+        self.item_lookup_func = item_lookup_func
+        self.recover_timeout = recover_timeout
+        # Not known here; the daemon's controller caps every pulse itself
+        self.drop_timeout = None
+        self.client = DaemonClient(socket_path)
+
+    def dispense(self, selected_items, status_callback, cancel_event=None, timings=None):
+        """
+        Dispense items through the daemon; see relay_controller.RelayController.dispense.
+
+        If the connection drops mid-dispense the daemon still vends; the
+        outcome is then fetched under the job key once it can be reached.
+
+        Raises:
+            ConnectionError: If the daemon stays unreachable.
+            RuntimeError: If the daemon restarted and no longer knows the dispense.
+        """
+        items = [SlotInfo.from_slot(self.item_lookup_func(item.code) or item) for item in selected_items]
+        job_key = uuid.uuid4().hex
+        try:
+            result = self.client.request(
+                "dispense", {"items": items, "job_key": job_key},
+                on_event=lambda message: status_callback(message["message"]),
+                cancel_event=cancel_event
+            )
+        except ConnectionError:
+            status_callback("Hardware daemon connection lost, waiting for the dispense result...")
+            result = self._recover_dispense(job_key, cancel_event)
+        if timings is not None:
+            timings.extend(tuple(timing) for timing in result["timings"])
+        return [selected_items[index] for index in result["dispensed"]]
+
+    def _recover_dispense(self, job_key, cancel_event):
+        """Reconnect until the daemon reports the outcome of the dispense `job_key`."""
+        give_up = time.monotonic() + self.recover_timeout
+        while True:
+            try:
+                return self.client.request("dispense_result", {"job_key": job_key}, cancel_event=cancel_event)
+            except ConnectionError:
+                if time.monotonic() >= give_up:
+                    raise
+                time.sleep(0.5)
+
+    def test_relay(self, matrix, row, col, pulse):
+        """Pulse one relay for the self-test; see self_test."""
+        seconds, dropped = self.client.request(
+            "test_relay", {"matrix": matrix, "row": row, "col": col, "pulse": pulse}
+        )
+        return seconds, dropped
+
+    def all_off(self):
+        """Switch every relay off."""
+        self.client.request("all_off", timeout=5.0)
+
+    def is_ready(self):
+        """True if the daemon answers and its relay hardware is ready."""
+        try:
+            return bool(self.client.request("is_ready", timeout=2.0))
+        except (ConnectionError, TimeoutError, RuntimeError):
+            return False
+
+    def ping(self):
+        """Round trip to the daemon without touching the hardware."""
+        self.client.request("ping", timeout=2.0)
+
+    def benchmark_ops(self):
+        """Return the operations timed by `hardware.py benchmark`."""
+        return {"ping": self.ping, "all_off": self.all_off, "is_ready": self.is_ready}
+
+    def close(self):
+        """Disconnect; the daemon keeps the hardware."""
+        self.client.close()
+
+
+class RemoteCardReader:
+    """
+    Card reader backend forwarding payments to the hardware daemon.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        """
+        Args:
+            socket_path (str): Path of the daemon's Unix socket.
+        """
+        self.client = DaemonClient(socket_path)
+
+    def _payment(self, op, args, amount):
+        """Forward one payment operation, turning an unreachable daemon into a failed result."""
+        try:
+            return self.client.request(op, args)
+        except (ConnectionError, RuntimeError) as e:
+            return {"success": False, "message": f"Payment failed: {e}", "amount": amount,
+                    "error_code": "HARDWARE_UNAVAILABLE"}
+
+    def charge(self, amount, client_txn_id=None):
+        """
+        Charge a card through the daemon; see mock_card_reader.CardReader.charge.
+
+        Returns:
+            dict: The reader's result, or a failure if the daemon is unreachable.
+        """
+        return self._payment("charge", {"amount": amount, "client_txn_id": client_txn_id}, amount)
+
+    def preauthorize(self, amount):
+        """Reserve an amount on a card; see mock_card_reader.CardReader.preauthorize."""
+        return self._payment("preauthorize", {"amount": amount}, amount)
+
+    def capture(self, auth_id, amount, client_txn_id=None):
+        """Charge the final amount of a pre-authorization; see mock_card_reader.CardReader.capture."""
+        return self._payment("capture", {"auth_id": auth_id, "amount": amount, "client_txn_id": client_txn_id},
+                             amount)
+
+    def void(self, auth_id):
+        """Release an unused pre-authorization; see mock_card_reader.CardReader.void."""
+        return self._payment("void", {"auth_id": auth_id}, 0)
+
+    def reverse(self, client_txn_id):
+        """Cancel or refund the payment with this ID; see mock_card_reader.CardReader.reverse."""
+        return self._payment("reverse", {"client_txn_id": client_txn_id}, 0)
+
+    def close(self):
+        """Disconnect; the daemon keeps the hardware."""
+        self.client.close()
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Vending machine hardware daemon.")
+    parser.add_argument("--config", default="hardware-daemon.json",
+                        help="Hardware configuration of the real backends (hardware.json format)")
+    parser.add_argument("--planogram", default="planogram.json")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = parser.parse_args(argv)
+
+    config = hardware.load_config(args.config)
+    if "daemon" in (config["relay"].get("backend"), config["card_reader"].get("backend")):
+        parser.error("the daemon's own configuration cannot use the daemon backend")
+    daemon = HardwareDaemon(config, Planogram.load(args.planogram), args.socket)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
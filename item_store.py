@@ -0,0 +1,322 @@
+"""
+SQLite-backed storage for vending machine items and settings.
+
+Every slot is stored as its own row, indexed by item code and location,
+so editing a single item updates one row instead of rewriting the whole
+catalog file. On first start the existing `vending_items.json` is migrated
+into the database once.
+
+Writes go through SQLite's write-ahead journal and every commit is
+fsynced before it returns, so a power cut can only lose a change that
+was still being committed (never a stock decrement already recorded
+after a vend), and never truncates the catalog. On startup
+the database is checked and, if it is unreadable, restored from the last
+known good backup within milliseconds.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from utils import fsync_replace
+
+
+class ItemStore:
+    """
+    Persistent item storage for the vending machine.
+
+    Items are keyed by their numeric code. The admin password and any other
+    machine-wide values live in a small key/value `settings` table.
+
+    `stock` is NULL for slots whose stock is not tracked (e.g. after the
+    migration of an older database), which means "never sold out".
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            code     INTEGER PRIMARY KEY,
+            name     TEXT    NOT NULL DEFAULT '',
+            price    INTEGER NOT NULL DEFAULT 0,
+            location TEXT    NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_items_location ON items (location);
+        CREATE TABLE IF NOT EXISTS settings (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    # Columns added after the first release: name -> SQL definition
+    ADDED_COLUMNS = {
+        "capacity": "INTEGER NOT NULL DEFAULT 0",
+        "stock": "INTEGER",
+        # Relay pulse profile learned from drop-sensor times (NULL = not calibrated)
+        "pulse_ms": "INTEGER",
+        "drop_ms": "INTEGER",
+        "drop_dev_ms": "INTEGER",
+        # Vend health counters (see slot_health)
+        "attempts": "INTEGER NOT NULL DEFAULT 0",
+        "timeouts": "INTEGER NOT NULL DEFAULT 0",
+        "fail_streak": "INTEGER NOT NULL DEFAULT 0",
+        "avg_pulse_ms": "INTEGER",
+        "out_of_service": "INTEGER NOT NULL DEFAULT 0",
+    }
+
+    # Columns that may be changed through update_item()
+    ITEM_FIELDS = ("name", "price", "location", "capacity", "stock", "pulse_ms", "drop_ms", "drop_dev_ms",
+                   "attempts", "timeouts", "fail_streak", "avg_pulse_ms", "out_of_service")
+
+    def __init__(self, db_file="vending_items.db", json_file=None):
+        """
+        Open (or create) the item database.
+
+        Args:
+            db_file (str): Path to the SQLite database file.
+            json_file (str, optional): Legacy JSON catalog to migrate from
+                                       if the database has not been populated yet.
+        """
+        self.db_file = db_file
+        self.backup_file = f"{db_file}.bak"
+        self.conn = None
+        self._depth = 0  # Nesting level of transaction()
+
+        self.recover()
+        if json_file:
+            self.migrate_from_json(json_file)
+
+    def _open(self):
+        """Open the database in WAL mode and make sure the schema exists."""
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        # Commits are appended to the -wal journal and fsynced each time:
+        # the store sees about one write per purchase, and a committed
+        # stock decrement must survive a power cut or the machine oversells
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.executescript(self.SCHEMA)
+        self._add_missing_columns(conn)
+        return conn
+
+    def _add_missing_columns(self, conn):
+        """Upgrade an older database by adding columns introduced later."""
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(items)")}
+        for name, definition in self.ADDED_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE items ADD COLUMN {name} {definition}")
+        conn.commit()
+
+    def recover(self):
+        """
+        Open the database, replaying the journal, and verify it.
+
+        If the database cannot be opened or fails its integrity check, it is
+        moved aside and replaced by the last backup (or left empty so the
+        JSON migration runs again).
+
+        Returns:
+            bool: True if a restore was needed.
+        """
+        start = time.monotonic()
+        try:
+            self.conn = self._open()
+            if self.conn.execute("PRAGMA quick_check").fetchone()[0] == "ok":
+                return False
+        except sqlite3.DatabaseError as e:
+            print(f"Item store is corrupt: {e}")
+
+        if self.conn:
+            self.conn.close()
+        suffix = time.strftime("%Y%m%d%H%M%S")
+        for path in (self.db_file, f"{self.db_file}-wal", f"{self.db_file}-shm"):
+            if os.path.exists(path):
+                os.replace(path, f"{path}.corrupt-{suffix}")
+
+        if os.path.exists(self.backup_file):
+            shutil.copyfile(self.backup_file, f"{self.db_file}.tmp")
+            fsync_replace(f"{self.db_file}.tmp", self.db_file)
+        self.conn = self._open()
+        print(f"Item store restored in {(time.monotonic() - start) * 1000:.1f} ms")
+        return True
+
+    def snapshot(self):
+        """
+        Write a consistent copy of the database to the backup file using
+        temp-file-plus-rename, so a crash mid-backup keeps the old one.
+        """
+        tmp_path = f"{self.backup_file}.tmp"
+        dest = sqlite3.connect(tmp_path)
+        try:
+            self.conn.backup(dest)
+        finally:
+            dest.close()
+        fsync_replace(tmp_path, self.backup_file)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into a single commit.
+
+        Transactions may be nested; only the outermost one commits, and any
+        exception rolls the whole group back.
+        """
+        self._depth += 1
+        try:
+            yield self.conn
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.rollback()
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self.conn.commit()
+
+    def migrate_from_json(self, json_file):
+        """
+        Import items and settings from the legacy JSON file, once.
+
+        The migration is skipped if it already ran or if the database
+        already contains items.
+
+        Args:
+            json_file (str): Path to the legacy `vending_items.json`.
+
+        Returns:
+            bool: True if data was imported.
+        """
+        if self.get_setting("migrated_from_json") is not None:
+            return False
+        if self.item_count() > 0 or not os.path.exists(json_file):
+            return False
+
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.save_items(data)
+        self.set_setting("migrated_from_json", json_file)
+        return True
+
+    def item_count(self):
+        """Return the number of stored slots."""
+        return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def load_items(self):
+        """
+        Load all items and the admin password.
+
+        Returns:
+            dict: Same layout as the legacy JSON file, i.e.
+                  {"admin_password": "...",
+                   "1": {"name", "price", "location", "capacity", "stock",
+                         "pulse_ms", "drop_ms", "drop_dev_ms", "attempts", "timeouts",
+                         "fail_streak", "avg_pulse_ms", "out_of_service"}, ...}
+        """
+        items = {}
+        password = self.get_setting("admin_password")
+        if password is not None:
+            items["admin_password"] = password
+
+        for row in self.conn.execute(
+            f"SELECT code, {', '.join(self.ITEM_FIELDS)} FROM items ORDER BY code"
+        ):
+            items[str(row["code"])] = {field: row[field] for field in self.ITEM_FIELDS}
+        return items
+
+    def save_items(self, items):
+        """
+        Write a catalog (or part of one) in a single transaction.
+
+        Missing rows are created. Existing rows only get the fields each item
+        specifies, so a partial import (e.g. prices only) never resets names,
+        locations or the machine's stock counts.
+
+        Args:
+            items (dict): Catalog in the legacy JSON layout.
+        """
+        codes = [code for code in items if code.isdigit()]
+        with self.transaction():
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO items (code) VALUES (?)", [(int(code),) for code in codes]
+            )
+            for field in self.ITEM_FIELDS:
+                self.conn.executemany(
+                    f"UPDATE items SET {field} = ? WHERE code = ?",
+                    [(items[code][field], int(code)) for code in codes if field in items[code]]
+                )
+            if "admin_password" in items:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES ('admin_password', ?)",
+                    (str(items["admin_password"]),)
+                )
+
+    def get_item(self, code):
+        """
+        Fetch a single item by code.
+
+        Args:
+            code (str or int): Item code.
+
+        Returns:
+            dict or None: Item information, or None if the code does not exist.
+        """
+        row = self.conn.execute(
+            f"SELECT {', '.join(self.ITEM_FIELDS)} FROM items WHERE code = ?", (int(code),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def update_item(self, code, **fields):
+        """
+        Update selected fields of one item row.
+
+        Args:
+            code (str or int): Item code.
+            **fields: Any of ITEM_FIELDS.
+
+        Returns:
+            bool: True if the item exists and was updated.
+        """
+        unknown = set(fields) - set(self.ITEM_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown item fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return self.get_item(code) is not None
+
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.transaction():
+            cursor = self.conn.execute(
+                f"UPDATE items SET {assignments} WHERE code = ?",
+                (*fields.values(), int(code))
+            )
+        return cursor.rowcount == 1
+
+    def set_stock(self, stock_by_code):
+        """
+        Write the stock level of several slots in one transaction.
+
+        Args:
+            stock_by_code (dict): {code: stock} where stock may be None (untracked).
+        """
+        with self.transaction():
+            self.conn.executemany(
+                "UPDATE items SET stock = ? WHERE code = ?",
+                [(stock, int(code)) for code, stock in stock_by_code.items()]
+            )
+
+    def get_setting(self, key, default=None):
+        """Return a setting value, or `default` if it is not set."""
+        row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_setting(self, key, value):
+        """Store a setting value."""
+        with self.transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value))
+            )
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
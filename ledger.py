@@ -0,0 +1,250 @@
+"""
+Append-only transaction ledger.
+
+Every card pre-authorization, payment result, forwarded offline payment
+and dispense outcome is appended as one JSON line to a segment file in
+the ledger directory. Segments rotate daily (`2026-10-18.jsonl`) and
+when they grow past a size limit (`2026-10-18.1.jsonl`, ...). Records
+are buffered and written by a background thread with one fsync per
+batch (group commit), so callers on the UI thread never wait for the
+disk.
+
+A small SQLite index maps each `transaction_id` to the segment and byte
+offset of its records, so reconciliation can fetch a transaction without
+scanning the history.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class Ledger:
+    """
+    Append-only JSONL ledger with group commit, rotation and an offset index.
+    """
+
+    def __init__(self, directory="ledger", max_segment_bytes=8 * 1024 * 1024,
+                 flush_interval=0.2, batch_size=64):
+        """
+        Open the ledger and start the background writer.
+
+        Args:
+            directory (str): Directory holding the segment files and index.
+            max_segment_bytes (int): Size after which a new segment is started.
+            flush_interval (float): Longest time (seconds) a record waits in memory.
+            batch_size (int): Number of buffered records that triggers an early flush.
+        """
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._index = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS txn_index ("
+            " transaction_id TEXT NOT NULL, segment TEXT NOT NULL, offset INTEGER NOT NULL)"
+        )
+        self._index.execute(
+            "CREATE INDEX IF NOT EXISTS idx_txn_index_id ON txn_index (transaction_id)"
+        )
+        self._index.commit()
+        self._index_lock = threading.Lock()
+
+        self._segment = None   # Name of the segment currently open for writing
+        self._file = None
+        self._buffer = []
+        self._listeners = []
+        self._cond = threading.Condition()     # Guards only the buffer; never held during I/O
+        self._write_lock = threading.Lock()    # Serializes batches and the segment state
+        self._notify_lock = threading.Lock()   # Keeps listener calls in commit order
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, record):
+        """
+        Queue a record for writing. Returns immediately.
+
+        A `ts` (Unix time) field is added if missing.
+
+        Args:
+            record (dict): JSON-serializable record. Records carrying a
+                           `transaction_id` are added to the offset index.
+        """
+        record.setdefault("ts", time.time())
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Ledger is closed")
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def add_listener(self, callback):
+        """
+        Register a callable invoked with each batch of records once it is
+        durably committed. It runs on the writer thread, outside the lock
+        `append()` takes, so a slow listener never blocks callers.
+
+        Args:
+            callback (callable): Receives a list of record dicts.
+        """
+        self._listeners.append(callback)
+
+    def flush(self):
+        """Write and fsync all buffered records now, from the calling thread."""
+        self._drain()
+
+    def _run(self):
+        """Background writer: commit a batch every flush interval or when full."""
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(self.flush_interval)
+            self._drain()
+
+    def _drain(self):
+        """
+        Take the buffered records and commit them. The buffer is swapped
+        under `_cond` only, so `append()` never waits for the disk; the
+        write lock keeps batches in order, and listeners run after it is
+        released, handed over under the notify lock to keep their order.
+        """
+        with self._write_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            self._write_batch(batch)
+            self._notify_lock.acquire()
+        try:
+            for callback in self._listeners:
+                try:
+                    callback(batch)
+                except Exception as e:
+                    print(f"Ledger listener failed: {e}")
+        finally:
+            self._notify_lock.release()
+
+    def _segment_name(self, ts):
+        """Return the segment a record with timestamp `ts` belongs to."""
+        day = time.strftime("%Y-%m-%d", time.localtime(ts))
+        if self._segment and self._segment.startswith(day):
+            if self._file.tell() < self.max_segment_bytes:
+                return self._segment
+            part = int(self._segment.split(".")[1]) + 1 if self._segment.count(".") == 2 else 1
+            return f"{day}.{part}.jsonl"
+
+        # Continue the newest existing segment of the day after a restart
+        existing = sorted(
+            (name for name in os.listdir(self.directory) if name.startswith(day) and name.endswith(".jsonl")),
+            key=lambda name: int(name.split(".")[1]) if name.count(".") == 2 else 0
+        )
+        return existing[-1] if existing else f"{day}.jsonl"
+
+    def _write_batch(self, batch):
+        """Append a batch of records, fsync once, then index them (caller holds the write lock)."""
+        index_rows = []
+        for record in batch:
+            segment = self._segment_name(record["ts"])
+            if segment != self._segment:
+                if self._file:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._file.close()
+                self._file = open(os.path.join(self.directory, segment), 'a+b')
+                self._segment = segment
+                # Terminate a line torn by a power cut so it cannot swallow the next record
+                if self._file.tell() > 0:
+                    self._file.seek(-1, os.SEEK_END)
+                    if self._file.read(1) != b"\n":
+                        self._file.write(b"\n")
+
+            offset = self._file.tell()
+            self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+            if record.get("transaction_id"):
+                index_rows.append((str(record["transaction_id"]), segment, offset))
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        if index_rows:
+            with self._index_lock, self._index:
+                self._index.executemany(
+                    "INSERT INTO txn_index (transaction_id, segment, offset) VALUES (?, ?, ?)",
+                    index_rows
+                )
+
+    def find(self, transaction_id):
+        """
+        Return all committed records for a transaction ID, oldest first.
+
+        Args:
+            transaction_id (str): ID returned by the card reader.
+
+        Returns:
+            list of dict: Matching records (empty if unknown).
+        """
+        with self._index_lock:
+            rows = self._index.execute(
+                "SELECT segment, offset FROM txn_index WHERE transaction_id = ? ORDER BY rowid",
+                (str(transaction_id),)
+            ).fetchall()
+
+        records = []
+        for segment, offset in rows:
+            with open(os.path.join(self.directory, segment), 'rb') as f:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def read(self, since=None):
+        """
+        Iterate over all committed records, oldest first.
+
+        Lines that cannot be parsed (e.g. torn by a power cut) are skipped.
+
+        Args:
+            since (float, optional): Only yield records with a later `ts`.
+        """
+        for path in self.segments(since):
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or record.get("ts", 0) > since:
+                        yield record
+
+    def segments(self, since=None):
+        """
+        Return segment file paths in chronological order.
+
+        Args:
+            since (float, optional): Only return segments from the day of
+                                     this Unix time onward.
+        """
+        names = [name for name in os.listdir(self.directory) if name.endswith(".jsonl")]
+        if since is not None:
+            first_day = time.strftime("%Y-%m-%d", time.localtime(since))
+            names = [name for name in names if name[:10] >= first_day]
+        names.sort(key=lambda name: (name[:10], int(name.split(".")[1]) if name.count(".") == 2 else 0))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def close(self):
+        """Flush pending records, stop the writer and close all files."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+        self.flush()
+        with self._write_lock:
+            if self._file:
+                self._file.close()
+        self._index.close()
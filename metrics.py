@@ -0,0 +1,146 @@
+"""
+In-process latency metrics.
+
+Hardware drivers and workers record how long operations take under a
+metric name; `report()` returns count, mean, percentiles and jitter for every
+metric so they can be printed, logged or shown on an admin screen, and
+`export()` writes it to a JSON file for monitoring outside the process.
+Quantities such as a queue depth are registered as gauges instead and
+read whenever the report is taken.
+
+    with metrics.latency("relay.activate").time():
+        ...
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import utils
+
+
+class LatencyStats:
+    """
+    Rolling window of duration samples for one operation.
+    """
+
+    def __init__(self, name, window=1000):
+        """
+        Args:
+            name (str): Metric name, e.g. "relay.activate".
+            window (int): Number of most recent samples kept for percentiles.
+        """
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Add one duration sample (seconds)."""
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._samples.append(seconds)
+
+    @contextmanager
+    def time(self):
+        """Context manager recording the duration of its block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Return the statistics of this metric.
+
+        Returns:
+            dict: count, mean_ms, p50_ms, p95_ms, max_ms and jitter_ms (the
+                  standard deviation). Percentiles and jitter cover the most
+                  recent window of samples only.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self.count, self.total, self.max
+        if not samples:
+            return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0, "jitter_ms": 0.0}
+        return {
+            "count": count,
+            "mean_ms": total / count * 1000,
+            "p50_ms": samples[len(samples) // 2] * 1000,
+            "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+            "max_ms": maximum * 1000,
+            "jitter_ms": statistics.pstdev(samples) * 1000,
+        }
+
+
+class Gauge:
+    """
+    Current value of a quantity, read when the report is taken.
+    """
+
+    def __init__(self, name, read):
+        """
+        Args:
+            name (str): Metric name, e.g. "offline_queue.depth".
+            read (callable): Returns the current value.
+        """
+        self.name = name
+        self.read = read
+
+    def summary(self):
+        """Return {"value": current value}."""
+        return {"value": self.read()}
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def latency(name):
+    """Return the LatencyStats registered under `name`, creating it on first use."""
+    with _registry_lock:
+        stats = _registry.get(name)
+        if stats is None:
+            stats = _registry[name] = LatencyStats(name)
+        return stats
+
+
+def gauge(name, read):
+    """Register `read` as the gauge `name`, replacing any earlier one, and return the Gauge."""
+    with _registry_lock:
+        stats = _registry[name] = Gauge(name, read)
+        return stats
+
+
+def report():
+    """Return {metric name: summary dict} for every metric recorded so far."""
+    with _registry_lock:
+        registered = list(_registry.values())
+    return {stats.name: stats.summary() for stats in registered}
+
+
+def export(path):
+    """
+    Atomically write the report as JSON, with the time it was taken.
+
+    Args:
+        path (str): Destination file, e.g. "metrics.json".
+    """
+    utils.atomic_write_json(path, {"time": time.time(), "metrics": report()})
+
+
+def format_report():
+    """Return the report as human-readable lines, one per metric."""
+    return [
+        f"{name}: {s['value']}" if "value" in s else
+        f"{name}: n={s['count']} mean={s['mean_ms']:.2f} ms p50={s['p50_ms']:.2f} ms "
+        f"p95={s['p95_ms']:.2f} ms max={s['max_ms']:.2f} ms jitter={s['jitter_ms']:.2f} ms"
+        for name, s in sorted(report().items())
+    ]
@@ -1,19 +1,31 @@
 import random
-import time
+
+from sim_clock import REAL_CLOCK
 
 class CardReader:
-    def __init__(self):
+    def __init__(self, clock=None):
         """
         Simulated card reader for handling test payments.
+
+        Args:
+            clock (optional): Clock used for the simulated delays (see sim_clock).
+                              Defaults to real time.
         """
-        pass
+        self.clock = clock or REAL_CLOCK
+        self._holds = {}   # auth_id -> authorized amount
+        self._results = {}   # client_txn_id -> result of a charge or capture
+        self._reversed = set()   # client_txn_ids that must not (or no longer) charge
+        self.acquirer_online = True   # False simulates a dropped link to the card issuer
 
-    def charge(self, amount):
+    def charge(self, amount, client_txn_id=None):
         """
         Simulate a payment transaction.
 
         Args:
             amount (float): The amount to be charged.
+            client_txn_id (str, optional): Caller's ID of the payment. Repeating
+                                           a charge with the same ID returns the
+                                           first result instead of charging again.
 
         Returns:
             dict: A dictionary containing transaction details:
@@ -27,23 +39,150 @@ class CardReader:
             - Simulates a delay of 2 seconds to mimic real-world processing.
             - Randomly determines success or failure of the transaction.
         """
+        if client_txn_id in self._results:
+            return self._results[client_txn_id]
+
         # Simulate real-world payment delay
-        time.sleep(2)
+        self.clock.sleep(2)
+        if not self.acquirer_online:
+            # Not remembered: the same ID goes through once the link is back
+            return self._acquirer_unavailable(amount)
         
         # Randomly determine if payment succeeds or fails
         success = random.choice([True, False])
         
         if success:
-            return {
+            result = {
                 "success": True, 
                 "message": "Payment successful", 
                 "amount": amount,
                 "transaction_id": f"TXN{random.randint(10000, 99999)}"
             }
         else:
-            return {
+            result = {
                 "success": False, 
                 "message": "Payment failed: Insufficient funds", 
                 "amount": amount,
                 "error_code": "INSUFFICIENT_FUNDS"
             }
+        return self._settle(client_txn_id, result)
+
+    @staticmethod
+    def _acquirer_unavailable(amount):
+        """Failure of a card that was read while the issuer could not be reached."""
+        return {
+            "success": False,
+            "message": "Payment failed: card issuer unreachable",
+            "amount": amount,
+            "error_code": "ACQUIRER_UNAVAILABLE"
+        }
+
+    def _settle(self, client_txn_id, result):
+        """Remember the result of a payment, unless it was reversed while processing."""
+        if client_txn_id is None:
+            return result
+        if client_txn_id in self._reversed:
+            result = {
+                "success": False,
+                "message": "Payment cancelled",
+                "amount": result.get("amount"),
+                "error_code": "CANCELLED"
+            }
+        self._results[client_txn_id] = result
+        return result
+
+    def preauthorize(self, amount):
+        """
+        Simulate a card tap that reserves `amount` without charging it yet.
+
+        Args:
+            amount (float): The amount to reserve (an estimate of the final total).
+
+        Returns:
+            dict: Same layout as charge(), with `auth_id` instead of
+                  `transaction_id` for successful authorizations.
+        """
+        # The card tap and authorization take as long as a full charge
+        self.clock.sleep(2)
+        if not self.acquirer_online:
+            return self._acquirer_unavailable(amount)
+
+        if random.choice([True, False]):
+            auth_id = f"AUTH{random.randint(10000, 99999)}"
+            self._holds[auth_id] = amount
+            return {"success": True, "message": "Card authorized", "amount": amount, "auth_id": auth_id}
+        return {
+            "success": False,
+            "message": "Payment failed: Insufficient funds",
+            "amount": amount,
+            "error_code": "INSUFFICIENT_FUNDS"
+        }
+
+    def capture(self, auth_id, amount, client_txn_id=None):
+        """
+        Simulate charging the final amount against a pre-authorization.
+
+        Args:
+            auth_id (str): ID returned by preauthorize().
+            amount (float): Final amount; must not exceed the authorized one.
+            client_txn_id (str, optional): Caller's ID of the payment, see charge().
+
+        Returns:
+            dict: Same layout as charge().
+        """
+        if client_txn_id in self._results:
+            return self._results[client_txn_id]
+
+        # Capturing needs no card interaction, only a short host round trip
+        self.clock.sleep(0.2)
+
+        authorized = self._holds.pop(auth_id, None)
+        if authorized is None or amount > authorized:
+            return self._settle(client_txn_id, {
+                "success": False,
+                "message": "Payment failed: Authorization invalid",
+                "amount": amount,
+                "error_code": "AUTH_INVALID"
+            })
+        return self._settle(client_txn_id, {
+            "success": True,
+            "message": "Payment successful",
+            "amount": amount,
+            "auth_id": auth_id,
+            "transaction_id": f"TXN{random.randint(10000, 99999)}"
+        })
+
+    def void(self, auth_id):
+        """
+        Simulate releasing an unused pre-authorization.
+
+        Returns:
+            dict: {"success": bool, "message": str}
+        """
+        if self._holds.pop(auth_id, None) is None:
+            return {"success": False, "message": "Unknown authorization"}
+        return {"success": True, "message": "Authorization released"}
+
+    def reverse(self, client_txn_id):
+        """
+        Simulate cancelling a payment the caller gave up on: a charge still
+        processing fails, and a completed one is refunded.
+
+        Returns:
+            dict: {"success": bool, "message": str, "refunded": bool}
+        """
+        self._reversed.add(client_txn_id)
+        result = self._results.get(client_txn_id)
+        refunded = bool(result and result.get("success"))
+        if refunded:
+            self._results[client_txn_id] = {
+                "success": False,
+                "message": "Payment cancelled",
+                "amount": result.get("amount"),
+                "error_code": "CANCELLED"
+            }
+        return {"success": True, "message": "Payment reversed", "refunded": refunded}
+
+    def close(self):
+        """Release the (simulated) reader. Called once on application shutdown."""
+        pass
@@ -1,4 +1,7 @@
-import time
+import random
+
+import metrics
+from sim_clock import REAL_CLOCK
 
 class RelayController:
     """
@@ -6,53 +9,129 @@ class RelayController:
 
     This class abstracts the process of controlling relays used to dispense
     products in a vending machine. It relies on an external lookup function
-    to fetch item details based on item codes.
+    to fetch slot details based on item codes.
     """
 
-    def __init__(self, item_lookup_func):
+    def __init__(self, item_lookup_func, drop_time=(0.4, 1.2), drop_timeout=2.0, failure_rate=0.0,
+                 clock=None):
         """
         Initialize the relay controller.
 
         Args:
-            item_lookup_func (callable): A function that accepts an item code (str)
-                                         and returns item information (dict).
+            item_lookup_func (callable): A function that accepts an item code (int)
+                                         and returns the matching Slot, or None.
+            drop_time (tuple): Range (seconds) of the simulated time until the
+                               drop sensor sees the product fall.
+            drop_timeout (float): Longest time to wait for the drop sensor.
+            failure_rate (float): Probability that a product never falls, to
+                                  exercise the failed-vend path.
+            clock (optional): Clock used for the simulated delays (see sim_clock).
+                              Defaults to real time.
         """
         self.item_lookup_func = item_lookup_func
+        self.drop_time = drop_time
+        self.drop_timeout = drop_timeout
+        self.failure_rate = failure_rate
+        self.clock = clock or REAL_CLOCK
+        self.activate_latency = metrics.latency("relay.activate")
+        self.pulse_latency = metrics.latency("relay.pulse")
 
-    def dispense(self, selected_items, status_callback):
+    def dispense(self, selected_items, status_callback, cancel_event=None, timings=None):
         """
         Simulate dispensing items by activating relays.
 
         Args:
-            selected_items (list of dict): A list of dictionaries representing items
-                                           selected by the user. Each dict must include:
-                                           - code (str): The item code.
+            selected_items (list of Slot): The slots selected by the user.
+                                           Each Slot provides at least:
+                                           - code (int): The item code.
                                            - name (str): The item name.
             status_callback (callable): A callback function to update the UI or logs
                                         with status messages. Receives a single str argument.
+            cancel_event (threading.Event, optional): Checked before each item;
+                                                      once set, the remaining items are skipped.
+            timings (list, optional): Receives (code, seconds, dropped) for every
+                                      simulated activation, see pulse_calibration.
+
+        Returns:
+            list of Slot: The items that were dispensed. Items the simulated
+                          drop sensor did not see fall are left out.
 
         Behavior:
             - Displays a starting message.
-            - Iterates over each selected item and simulates relay activation.
+            - Iterates over each selected item and simulates relay activation
+              until the drop sensor fires or the slot's calibrated pulse limit
+              (or the drop timeout) expires.
             - If an item code cannot be found, reports an error via the callback.
             - Reports completion at the end of the dispensing process.
         """
         # Notify that dispensing has started
         status_callback("Starting dispensing process...")
-        time.sleep(1)
-        
+
+        dispensed = []
         for item in selected_items:
-            info = self.item_lookup_func(item["code"])
+            if cancel_event is not None and cancel_event.is_set():
+                status_callback("Dispensing cancelled")
+                break
+
+            info = self.item_lookup_func(item.code)
             if info:
-                location = info.get("location", "Unknown")
-                status_callback(f"Dispensing: {item['name']} from {location}...")
+                location = info.location or "Unknown"
+                status_callback(f"Dispensing: {item.name} from {location}...")
                 
                 # Simulate relay activation (placeholder for actual hardware control)
-                print(f"Activating relay for location {location} (item: {item['name']})")
-                time.sleep(2)  # Simulated delay for relay action
+                print(f"Activating relay for location {location} "
+                      f"(row {info.row}, col {info.col}, item: {item.name})")
+                self.activate_latency.record(0.0)
+
+                # Simulated relay pulse, ended by the drop sensor or the pulse limit
+                limit = min(info.pulse_ms / 1000, self.drop_timeout) if info.pulse_ms else self.drop_timeout
+                pulse = random.uniform(*self.drop_time)
+                if random.random() < self.failure_rate or pulse > limit:
+                    self.clock.sleep(limit)
+                    self.pulse_latency.record(limit)
+                    if timings is not None:
+                        timings.append((item.code, limit, False))
+                    status_callback(f"Error: No drop detected for {item.name} from {location}")
+                    continue
+                self.clock.sleep(pulse)
+                self.pulse_latency.record(pulse)
+                if timings is not None:
+                    timings.append((item.code, pulse, True))
+                dispensed.append(item)
             else:
-                status_callback(f"Error: Item code {item['code']} not found!")
-                time.sleep(1)
+                status_callback(f"Error: Item code {item.code} not found!")
 
         # Notify that dispensing has completed
-        status_callback("Dispensing completed successfully")
+        if len(dispensed) == len(selected_items):
+            status_callback("Dispensing completed successfully")
+        else:
+            status_callback("Dispensing completed with errors")
+        return dispensed
+
+    def test_relay(self, matrix, row, col, pulse):
+        """
+        Simulate one short self-test pulse (see self_test).
+
+        Returns:
+            tuple: (seconds, dropped); a product falls if the pulse outlasts
+                   the simulated drop time.
+        """
+        self.clock.sleep(pulse)
+        self.pulse_latency.record(pulse)
+        return pulse, random.uniform(*self.drop_time) <= pulse
+
+    def all_off(self):
+        """Switch every (simulated) relay off."""
+        pass
+
+    def is_ready(self):
+        """The simulated hardware is always ready."""
+        return True
+
+    def benchmark_ops(self):
+        """Return the operations timed by `hardware.py benchmark`."""
+        return {"all_off": self.all_off, "is_ready": self.is_ready}
+
+    def close(self):
+        """Release the (simulated) hardware. Called once on application shutdown."""
+        pass
@@ -0,0 +1,322 @@
+"""
+Offline approval of small card payments, with store-and-forward.
+
+When the terminal has read the card but cannot reach the card issuer it
+answers a charge with error_code ACQUIRER_UNAVAILABLE, and completes the
+charge if the same client transaction ID is submitted again later.
+Instead of losing the sale, StoreAndForwardReader approves such charges
+up to a floor limit offline and stores them in a bounded queue on disk,
+keyed by the client transaction ID. A background thread forwards the
+queue in small batches, oldest first, by submitting each charge again
+under its ID, so a charge is never taken twice however often it is
+resent.
+
+Forwarding pauses while a customer is paying and backs off while the
+issuer is still unreachable, and a full queue (by count or by total
+amount) stops offline approvals, which keeps the money at risk bounded.
+Enable it with a floor limit in the "card_reader" section of
+hardware.json:
+
+    "card_reader": {"backend": "terminal", "floor_limit": 20000,
+                    "offline_max_entries": 200, "offline_max_amount": 2000000}
+
+Queue depth and the age of the oldest entry are reported as the
+offline_queue.depth and offline_queue.age_s metrics. List the queue with:
+
+    python offline_payments.py list
+"""
+
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+
+# Result of a card that was read while the issuer could not be reached
+ACQUIRER_UNAVAILABLE = "ACQUIRER_UNAVAILABLE"
+
+# Forwarding failures that leave the entry queued for the next batch
+NOT_FORWARDED = (ACQUIRER_UNAVAILABLE, "TIMEOUT", "TERMINAL_UNAVAILABLE", "HARDWARE_UNAVAILABLE")
+
+
+def offline_transaction_id(client_txn_id):
+    """Return the transaction ID recorded for a charge approved offline."""
+    return f"OFFLINE-{client_txn_id}"
+
+
+class OfflineQueue:
+    """
+    Bounded on-disk queue of offline-approved charges.
+    """
+
+    def __init__(self, path="offline_queue.db", max_entries=200, max_amount=None):
+        """
+        Open (or create) the queue.
+
+        Args:
+            path (str): SQLite database file.
+            max_entries (int): Most charges held at once.
+            max_amount (int, optional): Largest total amount held at once.
+        """
+        self.max_entries = max_entries
+        self.max_amount = max_amount
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # An approved sale must survive a power cut until it is forwarded
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS offline_queue ("
+            " client_txn_id TEXT PRIMARY KEY, amount INTEGER NOT NULL,"
+            " queued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def add(self, client_txn_id, amount):
+        """
+        Queue a charge unless the queue is full.
+
+        Returns:
+            bool: True if the charge is queued (also if it already was).
+        """
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM offline_queue WHERE client_txn_id = ?",
+                                (client_txn_id,)).fetchone():
+                return True
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM offline_queue").fetchone()
+            if count >= self.max_entries or (self.max_amount is not None and total + amount > self.max_amount):
+                return False
+            with self._db:
+                self._db.execute("INSERT INTO offline_queue (client_txn_id, amount, queued_at) VALUES (?, ?, ?)",
+                                 (client_txn_id, amount, time.time()))
+            return True
+
+    def get(self, client_txn_id):
+        """Return (client_txn_id, amount, queued_at, attempts) of a queued charge, or None."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT client_txn_id, amount, queued_at, attempts FROM offline_queue WHERE client_txn_id = ?",
+                (client_txn_id,)
+            ).fetchone()
+
+    def batch(self, limit):
+        """Return up to `limit` queued charges as (client_txn_id, amount, queued_at, attempts), oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT client_txn_id, amount, queued_at, attempts FROM offline_queue"
+                " ORDER BY queued_at LIMIT ?", (limit,)
+            ).fetchall()
+
+    def attempted(self, client_txn_id):
+        """Count a forwarding attempt that left the charge queued."""
+        with self._lock, self._db:
+            self._db.execute("UPDATE offline_queue SET attempts = attempts + 1 WHERE client_txn_id = ?",
+                             (client_txn_id,))
+
+    def remove(self, client_txn_id):
+        """Drop a forwarded or cancelled charge. Returns True if it was queued."""
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM offline_queue WHERE client_txn_id = ?",
+                                    (client_txn_id,)).rowcount > 0
+
+    def depth(self):
+        """Return the number of queued charges."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM offline_queue").fetchone()[0]
+
+    def oldest_age(self):
+        """Return the age (seconds) of the oldest queued charge, or 0 if the queue is empty."""
+        with self._lock:
+            oldest = self._db.execute("SELECT MIN(queued_at) FROM offline_queue").fetchone()[0]
+        return 0.0 if oldest is None else round(time.time() - oldest, 1)
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+
+class StoreAndForwardReader:
+    """
+    Card reader wrapper approving small charges offline while the card
+    issuer is unreachable, and forwarding them once it is back.
+    """
+
+    def __init__(self, reader, queue, floor_limit, batch_size=20, forward_interval=30.0, max_backoff=600.0):
+        """
+        Start the forwarding thread.
+
+        Args:
+            reader: Card reader built by hardware.create_card_reader().
+            queue (OfflineQueue): Queue of the offline-approved charges.
+            floor_limit (int): Largest amount approved offline.
+            batch_size (int): Most charges forwarded in one go.
+            forward_interval (float): Pause between two batches (seconds).
+            max_backoff (float): Longest pause while the issuer stays unreachable.
+        """
+        self.reader = reader
+        self.queue = queue
+        self.floor_limit = floor_limit
+        self.batch_size = batch_size
+        self.forward_interval = forward_interval
+        self.max_backoff = max_backoff
+        self._listeners = []
+        self._reversed = deque(maxlen=256)   # Recently cancelled IDs that must not be queued
+        self._live = 0                       # Customer payments in progress
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.forward_latency = metrics.latency("offline_queue.forward")
+        metrics.gauge("offline_queue.depth", queue.depth)
+        metrics.gauge("offline_queue.age_s", queue.oldest_age)
+        self._forwarder = threading.Thread(target=self._forward_loop, name="offline-forwarder", daemon=True)
+        self._forwarder.start()
+
+    def add_listener(self, callback):
+        """
+        Register a callable invoked with the outcome of every forwarded
+        charge. It runs on the forwarding thread.
+
+        Args:
+            callback (callable): Receives a dict with client_txn_id, amount,
+                                 queued_at and the reader's result.
+        """
+        self._listeners.append(callback)
+
+    @contextmanager
+    def _live_payment(self):
+        """Mark a customer payment in progress, so forwarding yields to it."""
+        with self._lock:
+            self._live += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._live -= 1
+
+    @staticmethod
+    def _approved_offline(client_txn_id, amount):
+        return {"success": True, "message": "Payment approved offline", "amount": amount,
+                "transaction_id": offline_transaction_id(client_txn_id), "offline": True}
+
+    def charge(self, amount, client_txn_id=None):
+        """
+        Charge a card, approving it offline if the issuer is unreachable
+        and the amount is within the floor limit.
+
+        Returns:
+            dict: The reader's result, or a success with `offline` set.
+        """
+        client_txn_id = client_txn_id or uuid.uuid4().hex
+        if self.queue.get(client_txn_id):
+            # Retry of a charge that is already approved offline
+            return self._approved_offline(client_txn_id, amount)
+        with self._live_payment():
+            result = self.reader.charge(amount, client_txn_id)
+        if result.get("error_code") != ACQUIRER_UNAVAILABLE or amount > self.floor_limit:
+            return result
+        with self._lock:
+            if client_txn_id in self._reversed:
+                return result
+        if not self.queue.add(client_txn_id, amount):
+            print(f"Offline queue full, declining {amount} offline")
+            return result
+        return self._approved_offline(client_txn_id, amount)
+
+    def preauthorize(self, amount):
+        """Reserve an amount on a card; holds are never approved offline."""
+        with self._live_payment():
+            return self.reader.preauthorize(amount)
+
+    def capture(self, auth_id, amount, client_txn_id=None):
+        """Charge the final amount of a pre-authorization through the reader."""
+        with self._live_payment():
+            return self.reader.capture(auth_id, amount, client_txn_id)
+
+    def void(self, auth_id):
+        """Release an unused pre-authorization."""
+        return self.reader.void(auth_id)
+
+    def reverse(self, client_txn_id):
+        """Cancel a payment, dropping it from the queue if it was approved offline."""
+        with self._lock:
+            self._reversed.append(client_txn_id)
+        queued = self.queue.remove(client_txn_id)
+        result = self.reader.reverse(client_txn_id)
+        if queued:
+            return {"success": True, "message": "Offline payment cancelled", "refunded": True}
+        return result
+
+    def _forward_loop(self):
+        """Forward the queue batch by batch, backing off while the issuer is unreachable."""
+        wait = self.forward_interval
+        while not self._closed.wait(wait):
+            try:
+                wait = self.forward_interval if self._forward_batch() else min(wait * 2, self.max_backoff)
+            except Exception as e:
+                if self._closed.is_set():
+                    return
+                print(f"Offline forwarding failed: {e}")
+
+    def _forward_batch(self):
+        """
+        Forward one batch, stopping early for a customer payment.
+
+        Returns:
+            bool: False if the issuer was still unreachable.
+        """
+        for client_txn_id, amount, queued_at, attempts in self.queue.batch(self.batch_size):
+            if self._closed.is_set() or self._live:
+                break
+            with self.forward_latency.time():
+                result = self.reader.charge(amount, client_txn_id)
+            if result.get("error_code") in NOT_FORWARDED:
+                self.queue.attempted(client_txn_id)
+                return False
+            self.queue.remove(client_txn_id)
+            if not result.get("success"):
+                print(f"Offline payment {client_txn_id} of {amount} was declined: {result.get('message')}")
+            outcome = {"client_txn_id": client_txn_id, "amount": amount, "queued_at": queued_at, "result": result}
+            for callback in self._listeners:
+                try:
+                    callback(outcome)
+                except Exception as e:
+                    print(f"Offline forwarding listener failed: {e}")
+        return True
+
+    def close(self):
+        """Stop forwarding and close the queue and the reader."""
+        self._closed.set()
+        self._forwarder.join(timeout=5)
+        self.reader.close()
+        self.queue.close()
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Offline-approved card payments.")
+    parser.add_argument("action", choices=["list"])
+    parser.add_argument("--db", default="offline_queue.db")
+    args = parser.parse_args(argv)
+
+    queue = OfflineQueue(args.db)
+    entries = queue.batch(-1)
+    queue.close()
+    if not entries:
+        print("No offline payments waiting")
+        return 0
+    print(f"{'Queued at':<19}  {'Amount':>10}  {'Tries':>5}  Client transaction ID")
+    for client_txn_id, amount, queued_at, attempts in entries:
+        queued = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(queued_at))
+        print(f"{queued:<19}  {amount:>10}  {attempts:>5}  {client_txn_id}")
+    print(f"{len(entries)} payments, {sum(entry[1] for entry in entries)} IRR")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
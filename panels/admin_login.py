@@ -84,14 +84,7 @@ class AdminLogin(QWidget):
         On success: switch to the admin panel.
         On failure: display error and reset input after 2 seconds.
         """
-        try:
-            password = self.parent.items.get("admin_password", "1234")
-        except Exception as e:
-            self.password_display.setText("Fatal error: Items DB missing/corrupt")
-            self.setDisabled(True)
-            return
-        
-        if self.parent.current_input == self.parent.items.get("admin_password", "1234"):
+        if self.parent.current_input == self.parent.catalog.admin_password:
             self.parent.current_input = ""
             self.password_display.setText("")
             self.parent.switch_screen(self.parent.admin_panel)
@@ -3,16 +3,24 @@ from PyQt5.QtWidgets import (
     QPushButton, QLabel, QMessageBox
 )
 from PyQt5.QtCore import Qt
+import os
+
+from catalog_io import import_file, export_file
 
 
 class AdminPanel(QWidget):
     """
     Admin control panel for managing vending machine items.
-    Provides keypad input for selecting items (1–32),
+    Provides keypad input for selecting items (1 to the planogram's slot count),
     as well as actions to edit items, change password, show items,
-    return to the user panel, or exit the application.
+    restock all slots, view sales, bulk import/export the catalog,
+    run the relay self-test, return to the user panel, or exit the application.
     """
 
+    # Files picked up by "Import" (first existing one wins) and written by "Export"
+    IMPORT_FILES = ["catalog_import.csv", "catalog_import.jsonl", "catalog_import.json"]
+    EXPORT_FILE = "catalog_export.csv"
+
     def __init__(self, parent):
         """
         Initialize the AdminPanel.
@@ -22,6 +30,7 @@ class AdminPanel(QWidget):
         """
         super().__init__()
         self.parent = parent
+        self.slot_count = self.parent.planogram.slot_count
         self.setup_ui()
         self.parent.current_input = ""  # Store item code input
         self.admin_item_display.setText("")
@@ -43,7 +52,7 @@ class AdminPanel(QWidget):
         layout.addWidget(title)
 
         # Instruction label
-        instruction = QLabel("Enter the desired item number (1-32)")
+        instruction = QLabel(f"Enter the desired item number (1-{self.slot_count})")
         instruction.setAlignment(Qt.AlignCenter)
         instruction.setStyleSheet("font-size: 20px; color: #666666;")
         layout.addWidget(instruction)
@@ -90,6 +99,44 @@ class AdminPanel(QWidget):
 
         layout.addLayout(top_btn_row)
 
+        # Row for stock and sales actions
+        stock_btn_row = QHBoxLayout()
+        self.restock_btn = QPushButton("Restock All")
+        self.restock_btn.setObjectName("admin_button")
+        self.restock_btn.setFixedHeight(60)
+        self.restock_btn.clicked.connect(self.on_restock_clicked)
+        stock_btn_row.addWidget(self.restock_btn)
+
+        self.sales_btn = QPushButton("Sales")
+        self.sales_btn.setObjectName("admin_button")
+        self.sales_btn.setFixedHeight(60)
+        self.sales_btn.clicked.connect(self.on_sales_clicked)
+        stock_btn_row.addWidget(self.sales_btn)
+
+        layout.addLayout(stock_btn_row)
+
+        # Row for bulk import/export and the relay self-test
+        io_btn_row = QHBoxLayout()
+        self.import_btn = QPushButton("Import")
+        self.import_btn.setObjectName("admin_button")
+        self.import_btn.setFixedHeight(60)
+        self.import_btn.clicked.connect(self.on_import_clicked)
+        io_btn_row.addWidget(self.import_btn)
+
+        self.export_btn = QPushButton("Export")
+        self.export_btn.setObjectName("admin_button")
+        self.export_btn.setFixedHeight(60)
+        self.export_btn.clicked.connect(self.on_export_clicked)
+        io_btn_row.addWidget(self.export_btn)
+
+        self.self_test_btn = QPushButton("Self-Test")
+        self.self_test_btn.setObjectName("admin_button")
+        self.self_test_btn.setFixedHeight(60)
+        self.self_test_btn.clicked.connect(self.on_self_test_clicked)
+        io_btn_row.addWidget(self.self_test_btn)
+
+        layout.addLayout(io_btn_row)
+
         # Row for "User Panel" and "Exit"
         bottom_btn_row = QHBoxLayout()
         self.back_to_user_btn = QPushButton("User Panel")
@@ -124,9 +171,10 @@ class AdminPanel(QWidget):
                 return
             try:
                 item_code = int(self.parent.current_input)
-                if item_code < 1 or item_code > 32:
+                if item_code < 1 or item_code > self.slot_count:
                     QMessageBox.warning(
-                        self, "Invalid Input", "Please enter a number between 1 and 32."
+                        self, "Invalid Input",
+                        f"Please enter a number between 1 and {self.slot_count}."
                     )
                     self.parent.current_input = ""
                     self.admin_item_display.setText("")
@@ -145,8 +193,8 @@ class AdminPanel(QWidget):
             self.parent.switch_screen(self.parent.edit_panel)
             self.parent.current_input = ""
         else:
-            # Append digit input (max 2 digits)
-            if len(self.parent.current_input) >= 2:
+            # Append digit input (max as many digits as the highest item number)
+            if len(self.parent.current_input) >= len(str(self.slot_count)):
                 return
             self.parent.current_input += text
             self.admin_item_display.setText(self.parent.current_input)
@@ -155,6 +203,53 @@ class AdminPanel(QWidget):
         """Switch to the Change Password panel."""
         self.parent.switch_screen(self.parent.change_password_panel)
 
+    def on_restock_clicked(self):
+        """Refill every slot with a configured capacity after confirmation."""
+        reply = QMessageBox.question(
+            self, 'Confirm', 'Mark all slots as fully restocked?',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            count = self.parent.catalog.restock_all()
+            QMessageBox.information(self, "Restock", f"{count} slot(s) restocked.")
+
+    def on_import_clicked(self):
+        """Validate and apply the first available import file as one batch."""
+        path = next((p for p in self.IMPORT_FILES if os.path.exists(p)), None)
+        if path is None:
+            QMessageBox.warning(
+                self, "Import", f"No import file found ({', '.join(self.IMPORT_FILES)})."
+            )
+            return
+        try:
+            changed, errors = import_file(path, self.parent.catalog)
+        except Exception as e:
+            QMessageBox.warning(self, "Import", f"Failed to import {path}: {e}")
+            return
+        if errors:
+            QMessageBox.warning(
+                self, "Import", f"{path} was not imported:\n" + "\n".join(errors[:5])
+            )
+        else:
+            QMessageBox.information(self, "Import", f"{changed} slot(s) updated from {path}.")
+
+    def on_export_clicked(self):
+        """Export the whole catalog to the export file."""
+        try:
+            count = export_file(self.EXPORT_FILE, self.parent.catalog)
+            QMessageBox.information(self, "Export", f"{count} slot(s) exported to {self.EXPORT_FILE}.")
+        except Exception as e:
+            QMessageBox.warning(self, "Export", f"Failed to export: {e}")
+
+    def on_sales_clicked(self):
+        """Load the sales rollups and display them in the Sales panel."""
+        self.parent.sales_panel.load_sales()
+        self.parent.switch_screen(self.parent.sales_panel)
+
+    def on_self_test_clicked(self):
+        """Switch to the relay Self-Test panel."""
+        self.parent.switch_screen(self.parent.self_test_panel)
+
     def on_show_items_clicked(self):
         """Load and display the list of items in the Items List panel."""
         self.parent.items_list_panel.load_items()
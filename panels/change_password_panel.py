@@ -3,7 +3,6 @@ from PyQt5.QtWidgets import (
     QPushButton, QLabel, QMessageBox
 )
 from PyQt5.QtCore import Qt
-import json
 
 
 class ChangePasswordPanel(QWidget):
@@ -13,17 +12,15 @@ class ChangePasswordPanel(QWidget):
     and logic for verifying the old password before setting a new one.
     """
 
-    def __init__(self, parent, items_file="vending_items.json"):
+    def __init__(self, parent):
         """
         Initialize the ChangePasswordPanel.
 
         Args:
             parent: The parent widget or main controller.
-            items_file (str): Path to the JSON file containing items and admin password.
         """
         super().__init__()
         self.parent = parent
-        self.items_file = items_file
         self.state = "enter_old"  # State can be "enter_old" or "enter_new"
         self.current_input = ""   # Stores keypad input
         self.setup_ui()
@@ -115,10 +112,7 @@ class ChangePasswordPanel(QWidget):
     def check_old_password(self):
         """Verify that the entered password matches the stored admin password."""
         try:
-            with open(self.parent.items_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            current_pass = str(data.get("admin_password", ""))
+            current_pass = self.parent.catalog.admin_password
             if self.current_input == current_pass:
                 # Switch to new password entry mode
                 self.state = "enter_new"
@@ -133,7 +127,7 @@ class ChangePasswordPanel(QWidget):
             QMessageBox.critical(self, "Error", "Unable to read password file.")
 
     def change_password(self):
-        """Validate and update the admin password in the JSON file."""
+        """Validate and update the admin password in the item store."""
         new_pass = self.current_input.strip()
 
         if not new_pass or not new_pass.isdigit():
@@ -141,15 +135,9 @@ class ChangePasswordPanel(QWidget):
             return
 
         try:
-            with open(self.parent.items_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            data["admin_password"] = new_pass
-            with open(self.items_file, "w") as f:
-                json.dump(data, f, indent=4)
+            self.parent.catalog.set_admin_password(new_pass)
 
             QMessageBox.information(self, "Success", "Password changed successfully.")
-            self.parent.load_items()
             self.parent.switch_screen(self.parent.admin_panel)
         except Exception as e:
             QMessageBox.critical(self, "Error", str(e))
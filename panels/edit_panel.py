@@ -1,4 +1,3 @@
-import json
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QLineEdit, QPushButton, QMessageBox
@@ -6,12 +5,14 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt
 from PyQt5 import QtGui
 
+import slot_health
+
 
 class EditPanel(QWidget):
     """
     Panel for editing vending machine items.
     Allows admin to view, update, or delete an item's information.
-    Provides fields for name, price, and location (read-only).
+    Provides fields for name, price, capacity, and location and stock (read-only).
     """
 
     def __init__(self, parent):
@@ -74,6 +75,16 @@ class EditPanel(QWidget):
         self.price_edit.mousePressEvent = lambda event: self.show_keyboard(self.price_edit)
         layout.addWidget(self.price_edit)
 
+        # Spiral capacity field (0 = stock not tracked)
+        self.capacity_label = QLabel("Capacity:")
+        layout.addWidget(self.capacity_label)
+
+        self.capacity_edit = QLineEdit()
+        self.capacity_edit.setReadOnly(True)
+        self.capacity_edit.setValidator(QtGui.QIntValidator(0, 999))
+        self.capacity_edit.mousePressEvent = lambda event: self.show_keyboard(self.capacity_edit)
+        layout.addWidget(self.capacity_edit)
+
         # Item location display (read-only)
         self.location_label = QLabel("Location:")
         layout.addWidget(self.location_label)
@@ -88,6 +99,24 @@ class EditPanel(QWidget):
         """)
         layout.addWidget(self.location_display)
 
+        # Current stock display (read-only)
+        self.stock_display = QLabel("")
+        self.stock_display.setAlignment(Qt.AlignCenter)
+        self.stock_display.setStyleSheet("font-size: 20px; color: #666666;")
+        layout.addWidget(self.stock_display)
+
+        # Vend health display (read-only) and jam recovery
+        self.health_display = QLabel("")
+        self.health_display.setAlignment(Qt.AlignCenter)
+        self.health_display.setStyleSheet("font-size: 20px; color: #666666;")
+        layout.addWidget(self.health_display)
+
+        self.in_service_btn = QPushButton("Return to Service")
+        self.in_service_btn.setObjectName("action_button")
+        self.in_service_btn.clicked.connect(self.on_return_to_service)
+        self.in_service_btn.hide()
+        layout.addWidget(self.in_service_btn)
+
         # Action buttons (Back, Delete, Save)
         btn_layout = QHBoxLayout()
 
@@ -115,13 +144,47 @@ class EditPanel(QWidget):
         Update the location label with a given code.
 
         Args:
-            location_code (str): Location code (should be 2 characters).
+            location_code (str): Location code such as 'C2' or 'K12'.
         """
-        if location_code and len(location_code) == 2:
+        if location_code:
             self.location_display.setText(location_code)
         else:
             self.location_display.setText("")
 
+    def update_stock_display(self, item):
+        """
+        Update the stock label for a given slot.
+
+        Args:
+            item (Slot or None): The slot being edited.
+        """
+        if item is None:
+            self.stock_display.setText("")
+        elif item.stock is None:
+            self.stock_display.setText("Stock: not tracked")
+        else:
+            self.stock_display.setText(f"Stock: {item.stock} / {item.capacity}")
+
+    def update_health_display(self, item):
+        """
+        Update the vend health label and the return-to-service button.
+
+        Args:
+            item (Slot or None): The slot being edited.
+        """
+        out_of_service = item is not None and item.out_of_service
+        self.in_service_btn.setVisible(out_of_service)
+        rate = slot_health.success_rate(item) if item is not None else None
+        if rate is None:
+            self.health_display.setText("OUT OF SERVICE" if out_of_service else "")
+            return
+        text = f"Vends: {item.attempts} - OK: {rate * 100:.0f}% - Timeouts: {item.timeouts}"
+        if item.avg_pulse_ms is not None:
+            text += f" - Pulse: {item.avg_pulse_ms} ms"
+        if out_of_service:
+            text = f"OUT OF SERVICE\n{text}"
+        self.health_display.setText(text)
+
     def show_keyboard(self, target_field):
         """
         Show the on-screen keyboard to edit a given field.
@@ -140,26 +203,31 @@ class EditPanel(QWidget):
             item_code (str): Item code string.
         """
         try:
-            with open(self.parent.items_file, 'r', encoding='utf-8') as f:
-                items = json.load(f)
+            item = self.parent.catalog.get(int(item_code))
 
             self.item_code_display.setText(item_code)
 
-            if item_code in items:
-                item = items[item_code]
-                self.name_edit.setText(item["name"])
-                self.price_edit.setText(str(item["price"]))
-                self.update_location_display(item["location"])
+            if item:
+                self.name_edit.setText(item.name)
+                self.price_edit.setText(str(item.price))
+                self.capacity_edit.setText(str(item.capacity))
+                self.update_location_display(item.location)
             else:
                 self.name_edit.setText("")
                 self.price_edit.setText("")
+                self.capacity_edit.setText("")
                 self.update_location_display("")
+            self.update_stock_display(item)
+            self.update_health_display(item)
         except Exception as e:
             print(f"Error loading item data: {e}")
             self.item_code_display.setText("")
             self.name_edit.setText("")
             self.price_edit.setText("")
+            self.capacity_edit.setText("")
             self.update_location_display("")
+            self.update_stock_display(None)
+            self.update_health_display(None)
 
     def on_save_item(self):
         """
@@ -174,30 +242,56 @@ class EditPanel(QWidget):
         if reply == QMessageBox.Yes:
             item_code = self.item_code_display.text()
             try:
-                with open(self.parent.items_file, 'r') as f:
-                    items = json.load(f)
-
-                if item_code not in items:
-                    QMessageBox.warning(self, "Error", "Invalid item code")
-                    return
-
-                # Update only name and price
-                items[item_code]["name"] = self.name_edit.text()
                 price_str = self.price_edit.text()
                 try:
                     price = int(price_str)
                 except ValueError:
                     price = 0
-                items[item_code]["price"] = price
+                try:
+                    capacity = int(self.capacity_edit.text())
+                except ValueError:
+                    capacity = 0
+
+                item = self.parent.catalog.get(int(item_code))
+                if item is None:
+                    QMessageBox.warning(self, "Error", "Invalid item code")
+                    return
+
+                fields = {"name": self.name_edit.text(), "price": price, "capacity": capacity}
+                if capacity == 0:
+                    # No capacity means the stock is no longer tracked
+                    fields["stock"] = None
+                elif item.stock is None:
+                    # Start tracking a newly configured slot as full
+                    fields["stock"] = capacity
+                elif item.stock > capacity:
+                    fields["stock"] = capacity
 
-                with open(self.parent.items_file, 'w') as f:
-                    json.dump(items, f, indent=4)
+                # Update only this one row
+                self.parent.catalog.update_item(int(item_code), **fields)
 
-                self.parent.load_items()
                 self.parent.switch_screen(self.parent.admin_panel)
             except Exception as e:
                 QMessageBox.warning(self, "Error", f"Failed to save item: {str(e)}")
 
+    def on_return_to_service(self):
+        """
+        Allow a slot taken out of service to be sold again, once its jam
+        has been cleared.
+        """
+        reply = QMessageBox.question(
+            self, 'Confirm', 'Has the jam been cleared? Return this slot to service?',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            item_code = self.item_code_display.text()
+            try:
+                self.parent.catalog.set_in_service(int(item_code))
+                self.update_health_display(self.parent.catalog.get(int(item_code)))
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Failed to update item: {str(e)}")
+
     def on_delete_item(self):
         """
         Clear the current item (reset its name and price).
@@ -211,18 +305,9 @@ class EditPanel(QWidget):
         if reply == QMessageBox.Yes:
             item_code = self.item_code_display.text()
             try:
-                with open(self.parent.items_file, 'r') as f:
-                    items = json.load(f)
-
-                if item_code in items:
-                    # Reset only name and price, keep location unchanged
-                    items[item_code]["name"] = ""
-                    items[item_code]["price"] = 0
-
-                    with open(self.parent.items_file, 'w') as f:
-                        json.dump(items, f, indent=4)
+                # Reset only name and price, keep location unchanged
+                self.parent.catalog.update_item(int(item_code), name="", price=0)
 
-                self.parent.load_items()
                 self.parent.switch_screen(self.parent.admin_panel)
             except Exception as e:
                 QMessageBox.warning(self, "Error", f"Failed to clear item: {str(e)}")
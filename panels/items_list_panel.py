@@ -1,29 +1,32 @@
+import bisect
+
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QListWidget, QListWidgetItem, QPushButton
 )
-import json
 
 
 class ItemsListPanel(QWidget):
     """
     Panel for displaying the list of items available in the vending machine.
-    Reads item data from a JSON file and displays them in a QListWidget.
+    Reads item data from the shared catalog and displays them in a QListWidget.
     Provides a back button to return to the admin panel.
     """
 
-    def __init__(self, parent, items_file="vending_items.json"):
+    def __init__(self, parent):
         """
         Initialize the ItemsListPanel.
 
         Args:
             parent: The parent widget (application main controller).
-            items_file (str): Path to the items JSON file.
         """
         super().__init__()
         self.parent = parent
-        self.items_file = items_file
+        self._rows = {}   # code -> QListWidgetItem of every listed slot
         self.setup_ui()
 
+        # Refresh the changed rows in place whenever the catalog changes
+        self.parent.catalog.changed.connect(self.on_catalog_changed)
+
     def setup_ui(self):
         """Build and configure the panel layout and UI components."""
         layout = QVBoxLayout(self)
@@ -44,32 +47,59 @@ class ItemsListPanel(QWidget):
 
     def load_items(self):
         """
-        Load items from the JSON file and populate the list widget.
+        Load items from the catalog and populate the list widget.
         Only items with a valid name and price > 0 are shown.
         If an error occurs, display the error in the list.
         """
         self.list_widget.clear()
+        self._rows = {}
         try:
-            with open(self.parent.items_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            # Filter keys that represent item codes
-            keys = [k for k in data.keys() if k.isdigit()]
-
-            for key in sorted(keys, key=int):
-                if key == "admin_password":
-                    continue
-                item = data[key]
+            catalog = self.parent.catalog
+            for key in catalog.codes():
+                item = catalog.get(key)
 
                 # Only display items with valid data
-                if item.get("name") and item.get("price", 0) > 0:
-                    display = (
-                        f'#{key}: {item["name"]} - '
-                        f'Price: {item["price"]} - '
-                        f'Location: {item["location"]}'
-                    )
-                    QListWidgetItem(display, self.list_widget)
+                if item.is_available():
+                    self._rows[key] = QListWidgetItem(self.row_text(item), self.list_widget)
 
         except Exception as e:
             # Show error message in the list if loading fails
             QListWidgetItem(f"Error loading items: {e}", self.list_widget)
+
+    def on_catalog_changed(self, version, changed):
+        """
+        Update, add or remove only the rows of the changed slots.
+
+        Args:
+            version (int): Catalog version after the change.
+            changed (dict): {code: Slot, or None if the slot was removed}.
+        """
+        for code, item in changed.items():
+            row = self._rows.get(code)
+            if item is None or not item.is_available():
+                if row is not None:
+                    self.list_widget.takeItem(self.list_widget.row(row))
+                    del self._rows[code]
+            elif row is not None:
+                row.setText(self.row_text(item))
+            else:
+                # Keep the list in code order
+                position = bisect.bisect(sorted(self._rows), code)
+                self._rows[code] = row = QListWidgetItem(self.row_text(item))
+                self.list_widget.insertItem(position, row)
+
+    @staticmethod
+    def row_text(item):
+        """Return the list text of one slot."""
+        display = (
+            f'#{item.code}: {item.name} - '
+            f'Price: {item.price} - '
+            f'Location: {item.location}'
+        )
+        if item.stock is not None:
+            display += f' - Stock: {item.stock}/{item.capacity}'
+        if item.pulse_ms is not None:
+            display += f' - Pulse: {item.pulse_ms} ms'
+        if item.out_of_service:
+            display += ' - OUT OF SERVICE'
+        return display
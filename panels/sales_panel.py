@@ -0,0 +1,93 @@
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QPushButton
+)
+import time
+
+
+class SalesPanel(QWidget):
+    """
+    Panel for displaying sales figures from the incremental rollups.
+    Shows per-item and per-hour units and revenue for a selectable window.
+    Provides a back button to return to the admin panel.
+    """
+
+    # Selectable windows: (button label, length in hours)
+    WINDOWS = [("24 h", 24), ("7 days", 24 * 7), ("30 days", 24 * 30)]
+
+    def __init__(self, parent):
+        """
+        Initialize the SalesPanel.
+
+        Args:
+            parent: The parent widget (application main controller).
+        """
+        super().__init__()
+        self.parent = parent
+        self.window_hours = self.WINDOWS[0][1]
+        self.setup_ui()
+
+    def setup_ui(self):
+        """Build and configure the panel layout and UI components."""
+        layout = QVBoxLayout(self)
+
+        # Title label
+        layout.addWidget(QLabel("Sales"))
+
+        # Window selection buttons
+        window_row = QHBoxLayout()
+        for label, hours in self.WINDOWS:
+            button = QPushButton(label)
+            button.setObjectName("admin_button")
+            button.clicked.connect(lambda _, h=hours: self.load_sales(h))
+            window_row.addWidget(button)
+        layout.addLayout(window_row)
+
+        # Per-item totals
+        self.total_label = QLabel("")
+        self.total_label.setStyleSheet("font-size: 20px;")
+        layout.addWidget(self.total_label)
+
+        self.items_list = QListWidget()
+        layout.addWidget(self.items_list)
+
+        # Per-hour totals
+        layout.addWidget(QLabel("By hour"))
+        self.hours_list = QListWidget()
+        layout.addWidget(self.hours_list)
+
+        # Back button (returns to admin panel)
+        back_btn = QPushButton("Back")
+        back_btn.clicked.connect(lambda: self.parent.switch_screen(self.parent.admin_panel))
+        layout.addWidget(back_btn)
+
+        self.setLayout(layout)
+
+    def load_sales(self, window_hours=None):
+        """
+        Query the rollups for the selected window and populate both lists.
+
+        Args:
+            window_hours (int, optional): Window length; keeps the current one if omitted.
+        """
+        if window_hours is not None:
+            self.window_hours = window_hours
+        start = time.time() - self.window_hours * 3600
+
+        self.items_list.clear()
+        self.hours_list.clear()
+        try:
+            rollup = self.parent.sales_rollup
+            total_units = total_revenue = 0
+            for code, name, units, revenue in rollup.by_item(start):
+                total_units += units
+                total_revenue += revenue
+                QListWidgetItem(f"#{code}: {name} - {units} sold - {revenue} IRR", self.items_list)
+
+            for hour, units, revenue in rollup.by_hour(start):
+                label = time.strftime("%m-%d %H:00", time.localtime(hour))
+                QListWidgetItem(f"{label} - {units} sold - {revenue} IRR", self.hours_list)
+
+            self.total_label.setText(f"Total: {total_units} sold - {total_revenue} IRR")
+        except Exception as e:
+            # Show error message in the list if the query fails
+            QListWidgetItem(f"Error loading sales: {e}", self.items_list)
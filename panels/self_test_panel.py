@@ -0,0 +1,122 @@
+import threading
+
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QLabel, QListWidget, QListWidgetItem, QPushButton
+)
+from PyQt5.QtCore import pyqtSignal, QObject
+
+import self_test
+
+
+class SelfTestWorker(QObject):
+    """
+    Worker class that runs the relay self-test sweep as a task on the
+    dispense queue's hardware thread, so it never drives the relays at the
+    same time as a purchase. Emits a status message per slot and the list
+    of results at the end.
+    """
+    status = pyqtSignal(str)       # Signal for progress messages
+    finished = pyqtSignal(list)    # Signal for the self_test.sweep results
+
+    def __init__(self, relay_controller, planogram, pulse):
+        super().__init__()
+        self.relay_controller = relay_controller
+        self.planogram = planogram
+        self.pulse = pulse
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        """Execute the sweep."""
+        try:
+            results = self_test.sweep(self.relay_controller, self.planogram, self.pulse,
+                                      status_callback=self.status.emit,
+                                      cancel_event=self.cancel_event)
+        except Exception as e:
+            results = []
+            self.status.emit(f"Self-test failed: {e}")
+        self.finished.emit(results)
+
+
+class SelfTestPanel(QWidget):
+    """
+    Panel for the relay self-test after a service visit.
+    Pulses every relay once and lists the per-slot timing and pass/fail result.
+    Provides a back button to return to the admin panel.
+    """
+
+    def __init__(self, parent):
+        """
+        Initialize the SelfTestPanel.
+
+        Args:
+            parent: The parent widget (application main controller).
+        """
+        super().__init__()
+        self.parent = parent
+        self.pulse = self_test.configured_pulse(parent.hardware_config)
+        self._worker = None
+        self.setup_ui()
+
+    def setup_ui(self):
+        """Build and configure the panel layout and UI components."""
+        layout = QVBoxLayout(self)
+
+        # Title label
+        layout.addWidget(QLabel("Relay Self-Test"))
+
+        # Progress and summary
+        self.status_label = QLabel(f"Pulse per relay: {self.pulse:.2f} s")
+        self.status_label.setStyleSheet("font-size: 20px;")
+        layout.addWidget(self.status_label)
+
+        # Per-slot results
+        self.results_list = QListWidget()
+        self.results_list.setStyleSheet("font-family: monospace; font-size: 18px;")
+        layout.addWidget(self.results_list)
+
+        self.run_btn = QPushButton("Run Self-Test")
+        self.run_btn.setObjectName("action_button")
+        self.run_btn.clicked.connect(self.run_self_test)
+        layout.addWidget(self.run_btn)
+
+        # Back button (returns to admin panel)
+        self.back_btn = QPushButton("Back")
+        self.back_btn.clicked.connect(lambda: self.parent.switch_screen(self.parent.admin_panel))
+        layout.addWidget(self.back_btn)
+
+        self.setLayout(layout)
+
+    def run_self_test(self):
+        """Queue the sweep on the hardware thread, unless the relays are still dispensing."""
+        user_panel = self.parent.user_panel
+        if user_panel.dispense_queue.pending():
+            self.status_label.setText("Relays busy dispensing, try again shortly")
+            return
+
+        self.results_list.clear()
+        self.run_btn.setEnabled(False)
+        self.back_btn.setEnabled(False)
+
+        # The worker stays on the UI thread; its signals are queued back here
+        self._worker = SelfTestWorker(user_panel.relay_controller, self.parent.planogram, self.pulse)
+        self._worker.status.connect(self.status_label.setText)
+        self._worker.finished.connect(self._on_finished)
+        user_panel.dispense_queue.run_task(self._worker.run)
+
+    def _on_finished(self, results):
+        """Show the result table and re-enable the buttons."""
+        self._worker = None
+        lines = self_test.format_table(results)
+        for line in lines[:-1]:
+            QListWidgetItem(line, self.results_list)
+        self.status_label.setText(lines[-1])
+        self.run_btn.setEnabled(True)
+        self.back_btn.setEnabled(True)
+
+    def stop(self):
+        """
+        Stop a queued or running sweep after the current slot (application
+        shutdown); the dispense queue's thread finishes it.
+        """
+        if self._worker:
+            self._worker.cancel_event.set()
@@ -2,12 +2,12 @@ from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QGridLayout, QPushButton, QLabel,
     QHBoxLayout, QDialog, QScrollArea
 )
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QObject
-import json
-import os
+from PyQt5.QtCore import Qt, QTimer
 
-from mock_card_reader import CardReader
-from mock_relay_controller import RelayController
+import hardware
+from dispense_queue import DispenseQueue
+from offline_payments import StoreAndForwardReader, offline_transaction_id
+from payment_queue import PaymentJob, PaymentQueue
 
 
 class ConfirmDialog(QDialog):
@@ -57,7 +57,7 @@ class ConfirmDialog(QDialog):
 
         # Add item labels to the scroll view
         for item in items:
-            lbl = QLabel(f"{item['name']} - {item['price']} IRR")
+            lbl = QLabel(f"{item.name} - {item.price} IRR")
             lbl.setAlignment(Qt.AlignLeft)
             scroll_layout.addWidget(lbl)
 
@@ -84,64 +84,26 @@ class ConfirmDialog(QDialog):
         layout.addLayout(btn_box)
 
 
-class PaymentWorker(QObject):
-    """
-    Worker class that runs card payment logic in a separate thread.
-    Emits status messages during the process and a final result dict.
-    """
-    status = pyqtSignal(str)       # Signal for status messages
-    finished = pyqtSignal(dict)    # Signal for the result of card_reader.charge
-
-    def __init__(self, card_reader, amount):
-        super().__init__()
-        self.card_reader = card_reader
-        self.amount = amount
-
-    def run(self):
-        """Execute the payment process."""
-        self.status.emit("Processing payment...")
-        result = self.card_reader.charge(self.amount)
-        if isinstance(result, dict):
-            self.finished.emit(result)
-        else:
-            # Wrap unexpected results into a failure dict
-            self.finished.emit({"success": False, "message": str(result)})
-
-
-class DispenseWorker(QObject):
-    """
-    Worker class for controlling the relay (dispensing mechanism).
-    Runs in a separate thread to avoid blocking the UI.
-    """
-    status = pyqtSignal(str)    # Signal for relay status messages
-    finished = pyqtSignal()     # Signal emitted when dispensing completes
-
-    def __init__(self, relay_controller, selected_items):
-        super().__init__()
-        self.relay_controller = relay_controller
-        # Make a copy to avoid race conditions with mutable data
-        self.selected_items = [dict(i) for i in selected_items]
-
-    def run(self):
-        """Execute the dispensing process via relay controller."""
-
-        def status_callback(msg):
-            self.status.emit(msg)
-
-        self.relay_controller.dispense(self.selected_items, status_callback)
-        self.finished.emit()
-
-
 class UserPanel(QWidget):
     """
     Main user interface panel for the vending machine.
     Handles keypad input, item selection, payment, and dispensing.
+
+    The first item added to a cart wakes the card reader and reserves an
+    estimate of the total (PREAUTH_ITEMS times the item's price, or the
+    configured "preauth_amount" if higher), so at Pay only the final
+    amount has to be captured.
     """
+
+    # Items the pre-authorization hold should cover
+    PREAUTH_ITEMS = 3
+
     def __init__(self, parent):
         super().__init__()
         self.parent = parent
-        self.card_reader = CardReader()
-        self.items = {}
+        self.card_reader = hardware.create_card_reader(parent.hardware_config, parent.clock)
+        if isinstance(self.card_reader, StoreAndForwardReader):
+            self.card_reader.add_listener(self.record_offline_forward)
         self.selected_items = []
         self.total_price = 0
         self.current_input = ""
@@ -149,7 +111,23 @@ class UserPanel(QWidget):
 
         self.setup_ui()
         self.load_items()
-        self.relay_controller = RelayController(self.item_lookup)
+        self.relay_controller = hardware.create_relay_controller(
+            parent.hardware_config, self.item_lookup, parent.planogram, parent.clock
+        )
+
+        # Single owner of the relay hardware; paid carts are dispensed in order
+        # while the panel already serves the next customer
+        self.dispense_queue = DispenseQueue(self.relay_controller, self)
+        self.dispense_queue.job_status.connect(self._on_dispense_status)
+        self.dispense_queue.job_finished.connect(self._on_dispense_finished)
+
+        # One long-lived thread for every card reader operation
+        self.payment_queue = PaymentQueue(self.card_reader, self)
+        self.payment_queue.job_status.connect(self._on_payment_status)
+        self.payment_queue.job_finished.connect(self._on_payment_job_finished)
+
+        # Keep the cart and availability in sync with admin edits
+        self.parent.catalog.changed.connect(self.on_catalog_changed)
 
         # Auto-reset after 30 seconds of inactivity
         self.inactivity_timer = QTimer(self)
@@ -157,11 +135,18 @@ class UserPanel(QWidget):
         self.inactivity_timer.timeout.connect(self.reset_to_initial)
         self.inactivity_timer.start()
 
-        # Thread/worker references (kept alive during execution)
-        self._payment_thread = None
-        self._payment_worker = None
-        self._dispense_thread = None
-        self._dispense_worker = None
+        # Payment job in progress
+        self._payment_job = None
+
+        # Ledger context of the payment in progress
+        self._transaction_id = None
+
+        # Card pre-authorization of the current cart
+        self._preauth = None                # Reader's answer, once it arrived
+        self._preauth_job = None            # Pre-authorization job still at the reader
+        self._preauth_abandoned = False     # Cart was cleared while authorizing
+        self._pay_when_authorized = False   # Pay was confirmed while authorizing
+        self._capturing = None              # auth_id being captured
 
     def setup_ui(self):
         """Build and configure the UI layout."""
@@ -242,26 +227,64 @@ class UserPanel(QWidget):
 
     def reset_to_initial(self):
         """Reset the state and display due to inactivity or user action."""
+        if not self.confirm_pay_btn.isEnabled():
+            return   # Never drop a cart that is being paid for
+        self.clear_cart()
+        self.set_initial_display()
+
+    def clear_cart(self):
+        """Release the stock and card hold reserved by the cart and empty it."""
+        self.release_preauth()
+        self.parent.catalog.release(self.selected_items)
         self.selected_items = []
         self.total_price = 0
         self.current_input = ""
-        self.set_initial_display()
 
     def load_items(self):
-        """Load item database (JSON) from the file defined in parent."""
-        try:
-            with open(self.parent.items_file, 'r', encoding='utf-8') as f:
-                self.items = json.load(f)
+        """Check that the shared catalog holds items and enable the panel accordingly."""
+        if self.parent.catalog.codes():
             self.json_error = False
-        except Exception:
-            self.items = {}
+            self.setDisabled(False)
+        else:
             self.json_error = True
             self.display_label.setText("Fatal error: Items DB missing/corrupt")
             self.setDisabled(True)
 
     def item_lookup(self, code):
-        """Return item information by item code."""
-        return self.items.get(str(code), None)
+        """Return the Slot for an integer item code, or None."""
+        return self.parent.catalog.get(code)
+
+    def on_catalog_changed(self, version, changed):
+        """
+        Apply catalog changes in place: refresh names and prices of items
+        already in the cart and drop the ones that are no longer sold or
+        were taken out of service.
+        """
+        if self.json_error:
+            self.load_items()
+            if not self.json_error:
+                self.set_initial_display()
+
+        # Never touch a cart that is already being paid for or dispensed
+        if not self.confirm_pay_btn.isEnabled():
+            return
+        if not any(slot.code in changed for slot in self.selected_items):
+            return
+
+        # Slots are updated in place, so only removed or emptied ones need dropping
+        keep = [
+            slot for slot in self.selected_items
+            if self.item_lookup(slot.code) is slot and slot.is_available() and not slot.out_of_service
+        ]
+        self.parent.catalog.release([slot for slot in self.selected_items if slot not in keep])
+        self.selected_items = keep
+        self.total_price = sum(slot.price for slot in self.selected_items)
+        if self.selected_items:
+            self.update_selection_display()
+        else:
+            # The hold belongs to this cart; the next one gets its own
+            self.release_preauth()
+            self.set_initial_display()
 
     def on_keypad_clicked(self, text):
         """
@@ -274,6 +297,12 @@ class UserPanel(QWidget):
             self.display_label.setText("Cannot operate: Items DB error")
             return
 
+        if not self.confirm_pay_btn.isEnabled():
+            # The cart is being paid for; ↵ cancels the payment, other keys wait
+            if text == '↵':
+                self.cancel_payment()
+            return
+
         if text == '↵':
             # Handle 'enter' / remove functionality
             if self.current_input:
@@ -284,10 +313,12 @@ class UserPanel(QWidget):
                     self.set_initial_display()
             elif self.selected_items:
                 removed_item = self.selected_items.pop()
-                self.total_price -= removed_item['price']
+                self.parent.catalog.release([removed_item])
+                self.total_price -= removed_item.price
                 if self.selected_items:
                     self.update_selection_display()
                 else:
+                    self.release_preauth()
                     self.set_initial_display()
             else:
                 self.set_initial_display()
@@ -304,17 +335,21 @@ class UserPanel(QWidget):
                 )
                 return
 
-            item = self.item_lookup(self.current_input)
-            if item and item.get('name') and item.get('price', 0) > 0:
-                self.selected_items.append({
-                    "code": self.current_input,
-                    "name": item["name"],
-                    "price": item["price"],
-                    "location": item["location"]
-                })
-                self.total_price += item["price"]
+            item = self.item_lookup(int(self.current_input))
+            if item and item.is_available() and item.out_of_service:
+                # Jammed slot (see slot_health); never take money for it
+                self.display_label.setText(f"Item {self.current_input} is out of service")
+                self.current_input = ""
+            elif item and item.is_available() and not self.parent.catalog.reserve(item.code):
+                self.display_label.setText(f"Item {self.current_input} is sold out")
+                self.current_input = ""
+            elif item and item.is_available():
+                self.selected_items.append(item)
+                self.total_price += item.price
                 self.update_selection_display()
                 self.current_input = ""
+                if self._preauth is None and self._preauth_job is None:
+                    self.start_preauth(item.price)
             else:
                 self.display_label.setText(f"Item {self.current_input} not available")
                 self.current_input = ""
@@ -335,7 +370,7 @@ class UserPanel(QWidget):
         selected_display = ""
         for i in self.selected_items:
             selected_display += (
-                f"<div style='font-size:24px;'><b>{i['name']}</b> - {i['price']} IRR</div>"
+                f"<div style='font-size:24px;'><b>{i.name}</b> - {i.price} IRR</div>"
             )
 
         instructions = (
@@ -365,50 +400,142 @@ class UserPanel(QWidget):
             return
 
         invalid_items = [
-            item["code"] for item in self.selected_items
-            if not self.item_lookup(item["code"]) or not self.item_lookup(item["code"]).get('name')
+            str(item.code) for item in self.selected_items
+            if self.item_lookup(item.code) is not item or not item.name
         ]
         if invalid_items:
             self.display_label.setText(f"Items {', '.join(invalid_items)} not available")
             return
 
+        # No inactivity reset behind the dialog; payment restarts the timer when done
+        self.inactivity_timer.stop()
         dlg = ConfirmDialog(self.selected_items, self.total_price, self)
         if dlg.exec_() == QDialog.Accepted:
             self.display_label.setText(f"Proceeding to payment\nTotal: {self.total_price} IRR")
             self.process_payment()
         else:
-            self.selected_items = []
-            self.total_price = 0
-            self.current_input = ""
+            self.clear_cart()
             self.set_initial_display()
+            self.inactivity_timer.start()
 
-    def process_payment(self):
-        """Start payment in a worker thread and update UI via signals."""
-        self.confirm_pay_btn.setEnabled(False)
-
-        # Create worker and thread
-        self._payment_worker = PaymentWorker(self.card_reader, self.total_price)
-        self._payment_thread = QThread()
-        self._payment_worker.moveToThread(self._payment_thread)
+    def start_preauth(self, price):
+        """
+        Wake the card reader and reserve an estimated amount on the payment
+        queue while the customer keeps selecting.
 
-        # Connect signals
-        self._payment_thread.started.connect(self._payment_worker.run)
-        self._payment_worker.status.connect(lambda msg: self.display_label.setText(msg))
-        self._payment_worker.finished.connect(self._on_payment_finished)
+        Args:
+            price (int): Price of the first item of the cart.
+        """
+        config = self.parent.hardware_config["card_reader"]
+        amount = max(price * self.PREAUTH_ITEMS, int(config.get("preauth_amount", 0)))
+        self._preauth_abandoned = False
+        self._preauth_job = self.payment_queue.submit(
+            PaymentJob.PREAUTHORIZE, amount, deadline=float(config.get("payment_deadline", 60))
+        )
 
-        # Ensure cleanup when done
-        def _cleanup_payment():
-            if self._payment_thread:
-                self._payment_thread.quit()
-                self._payment_thread.wait()
-            self._payment_worker = None
-            self._payment_thread = None
+    def _on_payment_job_finished(self, job, result):
+        """Dispatch a finished card reader job (UI thread)."""
+        if job is self._preauth_job:
+            self._preauth_job = None
+            self._on_preauth_finished(result)
+        elif job is self._payment_job:
+            self._payment_job = None
+            self._on_payment_finished(result)
+
+    def _on_payment_status(self, job_id, msg):
+        """Show progress of the payment in progress."""
+        if self._payment_job is not None and self._payment_job.id == job_id:
+            self.show_payment_status(msg)
+
+    def _on_preauth_finished(self, result):
+        """Keep the hold for the cart, or release it if the cart is already gone."""
+        self.parent.ledger.append({
+            "type": "preauth",
+            "success": bool(result.get("success")),
+            "auth_id": result.get("auth_id"),
+            "amount": result.get("amount"),
+            "error_code": result.get("error_code"),
+            "message": result.get("message", "")
+        })
+        if self._preauth_abandoned:
+            self._preauth_abandoned = False
+            if result.get("success"):
+                self.void_preauth(result["auth_id"])
+            return
+        self._preauth = result
+        if self._pay_when_authorized:
+            self._pay_when_authorized = False
+            self._start_payment()
+
+    def release_preauth(self):
+        """Void the card hold of an abandoned cart, once the reader has answered."""
+        if self._preauth_job is not None:
+            self._preauth_abandoned = True
+            self._pay_when_authorized = False
+        elif self._preauth and self._preauth.get("success"):
+            self.void_preauth(self._preauth["auth_id"])
+        self._preauth = None
+
+    def void_preauth(self, auth_id):
+        """Release a card hold in the background."""
+        def _void():
+            try:
+                self.card_reader.void(auth_id)
+            except Exception as e:
+                print(f"Failed to release authorization {auth_id}: {e}")
+        self.payment_queue.run_in_background(_void)
 
-        self._payment_worker.finished.connect(_cleanup_payment)
-        self._payment_thread.start()
+    def process_payment(self):
+        """
+        Start payment on the payment queue and update UI via signals. If the
+        card is still being pre-authorized, the payment starts as soon as
+        the reader has answered. Until the payment finishes the inactivity
+        reset is off and ↵ cancels it.
+        """
+        self.confirm_pay_btn.setEnabled(False)
+        self.inactivity_timer.stop()
+        if self._preauth_job is not None:
+            self._pay_when_authorized = True
+            self.show_payment_status("Processing payment...")
+            return
+        self._start_payment()
+
+    def show_payment_status(self, msg):
+        """Show a payment progress message with the cancel hint."""
+        self.display_label.setText(f"{msg}\nPress ↵ to cancel")
+
+    def cancel_payment(self):
+        """Cancel the payment in progress; a reader that already charged is reversed."""
+        if self._pay_when_authorized:
+            # Nothing was charged yet; the hold stays with the cart
+            self._pay_when_authorized = False
+            self.display_label.setText("Payment cancelled")
+            self.confirm_pay_btn.setEnabled(True)
+            self.inactivity_timer.start()
+        elif self._payment_job is not None:
+            self.payment_queue.cancel(self._payment_job.id)
+            self.display_label.setText("Cancelling payment...")
+
+    def _start_payment(self):
+        """Capture the total from the cart's hold if it covers it, otherwise charge it."""
+        auth = self._preauth if self._preauth and self._preauth.get("success") else None
+        self._preauth = None
+        if auth and self.total_price > auth["amount"]:
+            # The cart outgrew the hold; charge the total instead
+            self.void_preauth(auth["auth_id"])
+            auth = None
+        self._capturing = auth["auth_id"] if auth else None
+
+        config = self.parent.hardware_config["card_reader"]
+        self._payment_job = self.payment_queue.submit(
+            PaymentJob.CAPTURE if auth else PaymentJob.CHARGE, self.total_price,
+            auth_id=self._capturing,
+            deadline=float(config.get("payment_deadline", 60)),
+            retries=int(config.get("payment_retries", 2))
+        )
 
     def _on_payment_finished(self, result):
-        """Handle result from PaymentWorker."""
+        """Handle the result of the payment job."""
         msg = result.get("message", "")
         if msg:
             self.display_label.setText(msg)
@@ -416,41 +543,104 @@ class UserPanel(QWidget):
 
     def handle_payment_result(self, result):
         """Process payment outcome and proceed accordingly."""
+        self.record_payment(result)
+        if self._capturing and not result.get("success"):
+            # Never leave a failed capture's hold on the card; the retry charges
+            self.void_preauth(self._capturing)
+        self._capturing = None
+        self.inactivity_timer.start()
         if result.get("success"):
             self.display_label.setText("Payment successful\nPreparing to dispense items...")
             self.start_dispensing()
+        elif result.get("error_code") == "CANCELLED":
+            self.display_label.setText("Payment cancelled")
+            self.confirm_pay_btn.setEnabled(True)
         else:
             self.display_label.setText("Payment failed\nPlease try again")
             self.confirm_pay_btn.setEnabled(True)
 
-    def start_dispensing(self):
-        """Start dispensing in a worker thread and stream status updates."""
-        self.confirm_pay_btn.setEnabled(False)
-
-        self._dispense_worker = DispenseWorker(self.relay_controller, self.selected_items)
-        self._dispense_thread = QThread()
-        self._dispense_worker.moveToThread(self._dispense_thread)
-
-        self._dispense_thread.started.connect(self._dispense_worker.run)
-        self._dispense_worker.status.connect(lambda msg: self.display_label.setText(msg))
-        self._dispense_worker.finished.connect(self._on_dispense_finished)
-
-        def _cleanup_dispense():
-            if self._dispense_thread:
-                self._dispense_thread.quit()
-                self._dispense_thread.wait()
-            self._dispense_worker = None
-            self._dispense_thread = None
-
-        self._dispense_worker.finished.connect(_cleanup_dispense)
-        self._dispense_thread.start()
+    def record_payment(self, result):
+        """Append the payment outcome to the transaction ledger."""
+        self._transaction_id = result.get("transaction_id")
+        self.parent.ledger.append({
+            "type": "payment",
+            "success": bool(result.get("success")),
+            "transaction_id": self._transaction_id,
+            "client_txn_id": result.get("client_txn_id"),
+            "auth_id": result.get("auth_id"),
+            "amount": result.get("amount", self.total_price),
+            "offline": bool(result.get("offline")),
+            "error_code": result.get("error_code"),
+            "message": result.get("message", ""),
+            "items": [slot.code for slot in self.selected_items]
+        })
+
+    def record_offline_forward(self, outcome):
+        """
+        Append the outcome of an offline-approved payment, once forwarded,
+        to the ledger (runs on the forwarding thread).
+        """
+        result = outcome["result"]
+        self.parent.ledger.append({
+            "type": "offline_forward",
+            "success": bool(result.get("success")),
+            "transaction_id": offline_transaction_id(outcome["client_txn_id"]),
+            "client_txn_id": outcome["client_txn_id"],
+            "forwarded_transaction_id": result.get("transaction_id"),
+            "amount": outcome["amount"],
+            "queued_at": outcome["queued_at"],
+            "error_code": result.get("error_code"),
+            "message": result.get("message", "")
+        })
 
-    def _on_dispense_finished(self):
-        """Reset state after dispensing finishes successfully."""
-        self.display_label.setText("All items were successfully dispensed")
+    def start_dispensing(self):
+        """
+        Hand the paid cart to the dispense queue and free the panel for
+        the next customer. The cart's reservations are settled when the
+        job finishes.
+        """
+        job = self.dispense_queue.submit(self.selected_items, self._transaction_id)
+        self._transaction_id = None
         self.selected_items = []
         self.total_price = 0
         self.current_input = ""
-        self.set_initial_display()
+        self.display_label.setText(f"Payment successful\nDispensing order #{job.id}...")
         self.confirm_pay_btn.setText("Pay")
         self.confirm_pay_btn.setEnabled(True)
+
+    def is_idle(self):
+        """True when no customer is selecting items or paying."""
+        return not self.selected_items and not self.current_input and self.confirm_pay_btn.isEnabled()
+
+    def _on_dispense_status(self, job_id, msg):
+        """Show relay status messages unless the next customer is using the panel."""
+        if self.is_idle():
+            self.display_label.setText(msg)
+
+    def _on_dispense_finished(self, job_id, selected, dispensed):
+        """Record the dispensed stock and the outcome of a finished job."""
+        job = self.dispense_queue.jobs[job_id]
+        # One store write for the whole purchase, however many items it had
+        self.parent.catalog.commit_dispensed(selected, dispensed, job.timings,
+                                             self.relay_controller.drop_timeout)
+        self.parent.ledger.append({
+            "type": "dispense",
+            "transaction_id": job.transaction_id,
+            "job_id": job.id,
+            "items": job.receipt,
+            "dispensed": [slot.code for slot in dispensed],
+            "cancelled": job.state == job.CANCELLED,
+            "errors": job.errors
+        })
+        if not self.is_idle():
+            return
+        if len(dispensed) == len(selected):
+            self.display_label.setText("All items were successfully dispensed")
+        else:
+            self.display_label.setText(f"{len(selected) - len(dispensed)} item(s) could not be dispensed")
+        QTimer.singleShot(3000, self._restore_initial_display)
+
+    def _restore_initial_display(self):
+        """Return to the READY screen after a dispense result, if still idle."""
+        if self.is_idle() and not self.dispense_queue.pending():
+            self.set_initial_display()
@@ -0,0 +1,332 @@
+"""
+Card payment job queue.
+
+A single `PaymentQueue` serves every card reader operation of the user
+panel. Pre-authorizations, charges and captures are submitted as jobs and
+run one at a time, in submission order, on one long-lived worker thread;
+the reader calls themselves run on a small fixed pool of threads, so a
+job can give up on a reader that stopped answering without waiting for
+it. A call given up on while it runs keeps its thread, and later jobs
+move on to a fresh pool, so a hung reader never holds up the next
+customer. Otherwise nothing but the job itself is created per
+transaction, and the time
+each job waited before it started is recorded as the payment.queue_wait
+metric.
+
+Every payment job has a deadline and can be cancelled; a payment given
+up on is reversed in the background. Failures that never reached a
+decision (timeouts, unreachable terminal) are retried with exponential
+backoff under the same client transaction ID, so the reader charges it
+once.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PyQt5.QtCore import QCoreApplication, QObject, QThread, pyqtSignal
+
+import metrics
+
+
+class PaymentJob:
+    """
+    One card reader operation waiting for, or going through, the worker.
+    """
+
+    PREAUTHORIZE = "preauthorize"
+    CHARGE = "charge"
+    CAPTURE = "capture"
+
+    def __init__(self, job_id, kind, amount, auth_id=None, client_txn_id=None, deadline=60.0, retries=0,
+                 backoff=0.5):
+        """
+        Args:
+            job_id (int): Sequential job ID.
+            kind (str): PREAUTHORIZE, CHARGE or CAPTURE.
+            amount (int): Amount to reserve, charge or capture.
+            auth_id (str, optional): Pre-authorization to capture from.
+            client_txn_id (str, optional): Idempotency key; generated if not given.
+            deadline (float): Seconds after which the job is given up.
+            retries (int): Extra attempts after a retryable failure.
+            backoff (float): Wait before the first retry, doubled for each further one.
+        """
+        self.id = job_id
+        self.kind = kind
+        self.amount = amount
+        self.auth_id = auth_id
+        self.client_txn_id = client_txn_id or uuid.uuid4().hex
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.submitted_at = time.monotonic()
+        self.cancel_event = threading.Event()
+
+
+class PaymentWorker(QObject):
+    """
+    Worker that runs payment jobs on the payment thread.
+    """
+    status = pyqtSignal(int, str)     # Job ID and status message
+    finished = pyqtSignal(int, dict)  # Job ID and the reader's (or the abandoned job's) result
+
+    # Failures after which the card may not have been asked at all
+    RETRYABLE = ("TIMEOUT", "TERMINAL_UNAVAILABLE", "HARDWARE_UNAVAILABLE")
+
+    def __init__(self, card_reader, reader_threads=2):
+        """
+        Args:
+            card_reader: Card reader built by hardware.create_card_reader().
+            reader_threads (int): Threads the reader calls run on.
+        """
+        super().__init__()
+        self.card_reader = card_reader
+        self.reader_threads = reader_threads
+        self._executor_lock = threading.Lock()
+        self.executor = self._new_executor()
+        self.releasing = set()   # Events set once an abandoned hold's late result was handled
+        self.queue_wait = metrics.latency("payment.queue_wait")
+
+    def run(self, job):
+        """Execute one job, retrying it while allowed; None stops the thread."""
+        if job is None:
+            QThread.currentThread().quit()
+            return
+        start = time.monotonic()
+        self.queue_wait.record(start - job.submitted_at)
+        give_up = start + job.deadline
+        attempt = 0
+        while True:
+            if job.cancel_event.is_set() and not attempt:
+                # Cancelled while queued; the reader was never asked
+                result = self._failure(job, "CANCELLED")
+                break
+            result = self._attempt(job, give_up)
+            if (result.get("success") or result.get("error_code") not in self.RETRYABLE
+                    or attempt >= job.retries or job.cancel_event.is_set()):
+                break
+            delay = job.backoff * 2 ** attempt
+            if time.monotonic() + delay >= give_up:
+                break
+            attempt += 1
+            metrics.latency("payment.retry").record(delay)
+            self.status.emit(job.id, f"Card reader not responding, retrying ({attempt}/{job.retries})...")
+            if job.cancel_event.wait(delay):
+                result = self._abandon(job, "CANCELLED")
+                break
+        if job.kind != PaymentJob.PREAUTHORIZE:
+            metrics.latency("payment.total").record(time.monotonic() - start)
+            result["client_txn_id"] = job.client_txn_id
+        self.finished.emit(job.id, result)
+
+    def _new_executor(self):
+        """Return a pool for the reader calls."""
+        return ThreadPoolExecutor(max_workers=self.reader_threads, thread_name_prefix="card-reader")
+
+    def submit(self, func, *args):
+        """Run a reader call on the current pool (any thread)."""
+        with self._executor_lock:
+            return self.executor.submit(func, *args)
+
+    def _replace_executor(self):
+        """Leave the current pool to a call that was given up on and start a fresh one."""
+        with self._executor_lock:
+            retired, self.executor = self.executor, self._new_executor()
+        # The abandoned call and anything queued behind it still finish there
+        retired.shutdown(wait=False)
+
+    def shutdown(self):
+        """Stop taking reader calls; calls already running are left to finish."""
+        with self._executor_lock:
+            self.executor.shutdown(wait=False)
+
+    def _call(self, job):
+        """Run the job's reader operation (on a pool thread)."""
+        if job.kind == PaymentJob.PREAUTHORIZE:
+            return self.card_reader.preauthorize(job.amount)
+        if job.kind == PaymentJob.CAPTURE:
+            return self.card_reader.capture(job.auth_id, job.amount, job.client_txn_id)
+        return self.card_reader.charge(job.amount, job.client_txn_id)
+
+    def _attempt(self, job, give_up):
+        """
+        Run one reader operation and wait for it until the deadline or a cancel.
+
+        Returns:
+            dict: The reader's result, or the failure of an abandoned attempt.
+        """
+        if job.kind != PaymentJob.PREAUTHORIZE:
+            self.status.emit(job.id, "Completing payment..." if job.kind == PaymentJob.CAPTURE
+                             else "Processing payment...")
+        future = self.submit(self._call, job)
+        started = time.monotonic()
+        while not wait([future], timeout=0.05).done:
+            if job.cancel_event.is_set():
+                return self._abandon(job, "CANCELLED", future)
+            if time.monotonic() >= give_up:
+                metrics.latency("payment.timeout").record(time.monotonic() - started)
+                return self._abandon(job, "TIMEOUT", future)
+        try:
+            result = future.result()
+        except Exception as e:
+            result = str(e)
+        if isinstance(result, dict):
+            return result
+        # Wrap unexpected results into a failure dict
+        return {"success": False, "message": str(result)}
+
+    def _abandon(self, job, error_code, future=None):
+        """
+        Give up on a job.
+
+        A reader call that has not started yet is cancelled and never
+        reaches the reader. One that is already running keeps its thread
+        and is undone once it returns: a payment is reversed and a hold is
+        voided, so the reversal never races the payment it undoes.
+
+        Args:
+            job (PaymentJob): The job given up on.
+            error_code (str): CANCELLED or TIMEOUT.
+            future (Future, optional): The job's reader call, if one is outstanding.
+        """
+        if future is None:
+            # Given up between two attempts; the last one may still have reached the card
+            if job.kind != PaymentJob.PREAUTHORIZE:
+                self.submit(self._reverse, job.client_txn_id)
+        elif not future.cancel():
+            if not future.done():
+                self._replace_executor()
+            if job.kind == PaymentJob.PREAUTHORIZE:
+                released = threading.Event()
+                self.releasing.add(released)
+                future.add_done_callback(lambda late: self._release(late, released))
+            else:
+                future.add_done_callback(lambda late: self._reverse(job.client_txn_id))
+        return self._failure(job, error_code)
+
+    @staticmethod
+    def _failure(job, error_code):
+        """Result of a job that was cancelled or ran out of time."""
+        if error_code == "CANCELLED":
+            message = "Payment cancelled"
+        else:
+            message = "Payment failed: card reader did not answer in time"
+        return {"success": False, "message": message, "amount": job.amount, "error_code": error_code}
+
+    def _release(self, future, released):
+        """Void a hold approved after its job was given up (on a pool thread)."""
+        try:
+            result = future.result()
+            if isinstance(result, dict) and result.get("success") and result.get("auth_id"):
+                self.card_reader.void(result["auth_id"])
+        except Exception as e:
+            print(f"Failed to release authorization: {e}")
+        finally:
+            self.releasing.discard(released)
+            released.set()
+
+    def _reverse(self, client_txn_id):
+        try:
+            self.card_reader.reverse(client_txn_id)
+        except Exception as e:
+            print(f"Failed to reverse payment {client_txn_id}: {e}")
+
+
+class PaymentQueue(QObject):
+    """
+    FIFO queue of card reader jobs served by one long-lived payment thread.
+    """
+    job_requested = pyqtSignal(object)
+    job_status = pyqtSignal(int, str)        # Job ID and status message
+    job_finished = pyqtSignal(object, dict)  # PaymentJob and its result
+
+    def __init__(self, card_reader, parent=None, reader_threads=2):
+        """
+        Start the payment thread.
+
+        Args:
+            card_reader: Card reader built by hardware.create_card_reader().
+            parent (QObject, optional): Qt parent object.
+            reader_threads (int): Threads for reader calls; a call still running
+                                  after its job gave up keeps its own.
+        """
+        super().__init__(parent)
+        self.card_reader = card_reader
+        self.jobs = {}   # Job ID -> PaymentJob, until the job has finished
+        self._ids = itertools.count(1)
+
+        # Jobs are delivered to the worker through its thread's event queue,
+        # which runs them one at a time in submission order
+        self._thread = QThread()
+        self._worker = PaymentWorker(card_reader, reader_threads)
+        self._worker.moveToThread(self._thread)
+        self.job_requested.connect(self._worker.run)
+        self._worker.status.connect(self.job_status)
+        self._worker.finished.connect(self._on_finished)
+        self._thread.start()
+
+    def submit(self, kind, amount, **options):
+        """
+        Queue a card reader operation.
+
+        Args:
+            kind (str): PaymentJob.PREAUTHORIZE, CHARGE or CAPTURE.
+            amount (int): Amount to reserve, charge or capture.
+            **options: Further PaymentJob arguments (auth_id, deadline, retries, ...).
+
+        Returns:
+            PaymentJob: The queued job.
+        """
+        job = PaymentJob(next(self._ids), kind, amount, **options)
+        self.jobs[job.id] = job
+        self.job_requested.emit(job)
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a job; one already at the reader is given up and reversed.
+
+        Returns:
+            bool: False if the job is unknown or already finished.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def pending(self):
+        """Return the unfinished jobs, oldest first."""
+        return sorted(self.jobs.values(), key=lambda job: job.id)
+
+    def run_in_background(self, func, *args):
+        """Run a fire-and-forget reader call (e.g. releasing a hold) on the reader threads."""
+        self._worker.submit(func, *args)
+
+    def _on_finished(self, job_id, result):
+        """Forget the finished job and forward the result (UI thread)."""
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            self.job_finished.emit(job, result)
+
+    def stop(self, release_timeout=5.0):
+        """
+        Cancel the queued and running jobs and stop the payment thread.
+
+        A running pre-authorization is abandoned like any cancelled one, so
+        a hold the reader approves late is still voided; stop() waits up to
+        `release_timeout` seconds for that before the reader is closed.
+        """
+        for job in self.jobs.values():
+            job.cancel_event.set()
+        # The sentinel is queued behind the pending jobs
+        self.job_requested.emit(None)
+        self._thread.wait()
+        # Deliver the results of the cancelled jobs before the caller shuts down
+        QCoreApplication.sendPostedEvents()
+        give_up = time.monotonic() + release_timeout
+        for released in list(self._worker.releasing):
+            released.wait(max(0.0, give_up - time.monotonic()))
+        self._worker.shutdown()
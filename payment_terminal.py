@@ -0,0 +1,456 @@
+"""
+Payment terminal client with one long-lived session, and a local emulator.
+
+The client opens the terminal connection (TCP or serial) once, performs
+the handshake once and keeps the session alive with periodic pings, so a
+sale only costs the charge round trip itself. A dropped connection is
+re-established in the background by the keepalive, and the handshake
+resumes the cached session instead of starting a new one. Every charge
+has a deadline.
+
+Wire format: one JSON object per line in each direction.
+
+    request    {"id": 3, "op": "charge", "args": {"amount": 25000}}
+    response   {"id": 3, "ok": true, "result": {"success": true, ...}}
+
+Operations: hello (handshake, optionally resuming a session), ping,
+charge, the pre-authorization steps preauthorize, capture and void, and
+reverse. A charge or capture may carry a "client_txn_id"; the terminal
+answers a repeated ID with the first result instead of charging twice,
+so a payment can safely be retried, and reverse cancels (or refunds) the
+payment with that ID. A terminal that read the card but cannot reach the
+card issuer answers with error_code ACQUIRER_UNAVAILABLE and completes
+the charge when the same ID is submitted again later (see
+offline_payments).
+Addresses are "tcp://host:port" or "serial:///dev/ttyUSB0?baud=115200"
+(the latter needs pyserial).
+
+Run the emulator and measure the charge round trip offline with:
+
+    python payment_terminal.py emulate --port 7000 --delay 0.05
+    python payment_terminal.py emulate --port 7000 --acquirer-down
+    python payment_terminal.py bench --address tcp://127.0.0.1:7000 -n 100
+"""
+
+import argparse
+import itertools
+import json
+import random
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+
+try:
+    import serial
+except ImportError:
+    # Only needed for terminals on a serial port
+    serial = None
+
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:7000"
+
+
+class _TcpTransport:
+    """Line-based TCP connection to the terminal."""
+
+    def __init__(self, host, port, connect_timeout):
+        self._sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+
+    def send(self, data):
+        self._sock.sendall(data)
+
+    def readline(self, timeout):
+        self._sock.settimeout(timeout)
+        try:
+            return self._file.readline()
+        except socket.timeout:
+            raise TimeoutError("Payment terminal did not answer in time") from None
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class _SerialTransport:
+    """Line-based serial connection to the terminal."""
+
+    def __init__(self, port, baudrate, connect_timeout):
+        if serial is None:
+            raise ConnectionError("pyserial is not installed")
+        self._port = serial.Serial(port, baudrate, timeout=connect_timeout)
+
+    def send(self, data):
+        self._port.write(data)
+
+    def readline(self, timeout):
+        self._port.timeout = timeout
+        line = self._port.readline()
+        if not line.endswith(b"\n"):
+            raise TimeoutError("Payment terminal did not answer in time")
+        return line
+
+    def close(self):
+        self._port.close()
+
+
+def open_transport(address, connect_timeout=3.0):
+    """
+    Connect to a terminal address.
+
+    Args:
+        address (str): "tcp://host:port" or "serial:///dev/ttyX?baud=N".
+        connect_timeout (float): Longest wait for the connection (seconds).
+
+    Raises:
+        ValueError: If the address scheme is unknown.
+        OSError: If the connection fails.
+    """
+    url = urlparse(address)
+    if url.scheme == "tcp":
+        return _TcpTransport(url.hostname, url.port, connect_timeout)
+    if url.scheme == "serial":
+        baud = int(parse_qs(url.query).get("baud", ["115200"])[0])
+        return _SerialTransport(url.path, baud, connect_timeout)
+    raise ValueError(f"Unknown payment terminal address {address!r}")
+
+
+class TerminalClient:
+    """
+    Card reader backend keeping one session to a payment terminal.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=30.0, keepalive=15.0, connect_timeout=3.0):
+        """
+        Start the keepalive thread, which opens the session in the background.
+
+        Args:
+            address (str): Terminal address, see open_transport().
+            timeout (float): Deadline of a charge (seconds).
+            keepalive (float): Idle time between two pings (seconds); the
+                               keepalive also reconnects a dropped session.
+            connect_timeout (float): Deadline of the connection and handshake.
+        """
+        self.address = address
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.session = None   # Cached session ID, resumed after a reconnect
+        self._transport = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()   # One exchange with the terminal at a time
+        self._closed = threading.Event()
+        self.charge_latency = metrics.latency("payment.charge")
+        self.handshake_latency = metrics.latency("payment.handshake")
+        threading.Thread(target=self._keepalive_loop, name="payment-keepalive", daemon=True).start()
+
+    def _connect(self):
+        """Open the transport and perform (or resume) the handshake (caller holds the lock)."""
+        with self.handshake_latency.time():
+            self._transport = open_transport(self.address, self.connect_timeout)
+            try:
+                result = self._exchange("hello", {"resume": self.session}, self.connect_timeout)
+            except Exception:
+                self._drop()
+                raise
+        self.session = result["session"]
+
+    def _drop(self):
+        """Close a broken connection; the next exchange reconnects."""
+        if self._transport is not None:
+            try:
+                self._transport.close()
+            except OSError:
+                pass
+            self._transport = None
+
+    def _exchange(self, op, args, timeout):
+        """Send one request on the open transport and wait for its response."""
+        request_id = next(self._ids)
+        self._transport.send((json.dumps({"id": request_id, "op": op, "args": args}) + "\n").encode("utf-8"))
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Payment terminal did not answer in time")
+            line = self._transport.readline(remaining)
+            if not line:
+                raise ConnectionError("Payment terminal closed the connection")
+            response = json.loads(line)
+            if response.get("id") != request_id:
+                continue   # Late answer to an abandoned request
+            if not response.get("ok"):
+                raise RuntimeError(response.get("error"))
+            return response.get("result")
+
+    def _request(self, op, args, timeout):
+        """Exchange one request, reconnecting first if needed (caller holds the lock)."""
+        if self._transport is None:
+            self._connect()
+        try:
+            return self._exchange(op, args, timeout)
+        except (OSError, ValueError):
+            # TimeoutError and ConnectionError included: the session state is unknown
+            self._drop()
+            raise
+
+    def _payment(self, op, args, amount):
+        """Run one payment operation, turning transport failures into a failed result."""
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                return self._request(op, args, self.timeout)
+            except TimeoutError:
+                return {"success": False, "message": "Payment failed: terminal timed out",
+                        "amount": amount, "error_code": "TIMEOUT"}
+            except (OSError, ValueError, RuntimeError) as e:
+                return {"success": False, "message": f"Payment failed: {e}",
+                        "amount": amount, "error_code": "TERMINAL_UNAVAILABLE"}
+            finally:
+                self.charge_latency.record(time.perf_counter() - start)
+
+    def charge(self, amount, client_txn_id=None):
+        """
+        Charge a card on the terminal.
+
+        Args:
+            amount (int): The amount to be charged.
+            client_txn_id (str, optional): Idempotency key of the payment.
+
+        Returns:
+            dict: The terminal's result (see mock_card_reader.CardReader.charge),
+                  or a failure with error_code TIMEOUT or TERMINAL_UNAVAILABLE.
+        """
+        return self._payment("charge", {"amount": amount, "client_txn_id": client_txn_id}, amount)
+
+    def preauthorize(self, amount):
+        """Reserve an amount on a card; see mock_card_reader.CardReader.preauthorize."""
+        return self._payment("preauthorize", {"amount": amount}, amount)
+
+    def capture(self, auth_id, amount, client_txn_id=None):
+        """Charge the final amount of a pre-authorization; see mock_card_reader.CardReader.capture."""
+        return self._payment("capture", {"auth_id": auth_id, "amount": amount, "client_txn_id": client_txn_id},
+                             amount)
+
+    def void(self, auth_id):
+        """Release an unused pre-authorization; see mock_card_reader.CardReader.void."""
+        return self._payment("void", {"auth_id": auth_id}, 0)
+
+    def reverse(self, client_txn_id):
+        """Cancel or refund the payment with this ID; see mock_card_reader.CardReader.reverse."""
+        return self._payment("reverse", {"client_txn_id": client_txn_id}, 0)
+
+    def ping(self):
+        """Check the session, reconnecting if it dropped."""
+        with self._lock:
+            self._request("ping", {}, self.connect_timeout)
+
+    def _keepalive_loop(self):
+        """
+        Open the session before the first sale, then ping it whenever it is
+        idle, which also re-opens it after a drop.
+        """
+        reachable = True
+        while not self._closed.is_set():
+            # Never delay a payment; a charge in progress proves the session anyway
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._request("ping", {}, self.connect_timeout)
+                    reachable = True
+                except Exception as e:
+                    if reachable:
+                        print(f"Payment terminal unreachable: {e}")
+                    reachable = False
+                finally:
+                    self._lock.release()
+            self._closed.wait(self.keepalive)
+
+    def close(self):
+        """Stop the keepalive and close the session."""
+        self._closed.set()
+        with self._lock:
+            self._drop()
+
+
+class TerminalEmulator(socketserver.ThreadingTCPServer):
+    """
+    Local stand-in for the payment terminal, speaking the same protocol.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, delay=2.0, handshake_delay=0.3, approve_rate=0.5):
+        """
+        Args:
+            address (tuple): (host, port) to listen on.
+            delay (float): Processing time of a charge (seconds).
+            handshake_delay (float): Cost of a new session; resumed sessions skip it.
+            approve_rate (float): Probability that a charge is approved.
+
+        Set `acquirer_online` to False to emulate a dropped link to the card issuer.
+        """
+        super().__init__(address, _EmulatorHandler)
+        self.delay = delay
+        self.handshake_delay = handshake_delay
+        self.approve_rate = approve_rate
+        self.acquirer_online = True
+        self.sessions = set()
+        self.holds = {}   # auth_id -> authorized amount
+        self.results = {}   # client_txn_id -> result of a charge or capture
+        self.reversed = set()   # client_txn_ids that must not (or no longer) charge
+        self._in_flight = {}   # client_txn_id -> (Event set when its first request finishes, [result])
+        self._lock = threading.Lock()
+
+    def handle_request_message(self, op, args):
+        """Return the result of one request."""
+        if op == "hello":
+            if args.get("resume") in self.sessions:
+                return {"session": args["resume"], "resumed": True}
+            time.sleep(self.handshake_delay)
+            session = uuid.uuid4().hex
+            self.sessions.add(session)
+            return {"session": session, "resumed": False}
+        if op == "ping":
+            return "pong"
+        if op in ("charge", "capture") and args.get("client_txn_id") is not None:
+            return self._idempotent(op, args)
+        if op == "void":
+            if self.holds.pop(args["auth_id"], None) is None:
+                return {"success": False, "message": "Unknown authorization"}
+            return {"success": True, "message": "Authorization released"}
+        if op == "reverse":
+            with self._lock:
+                self.reversed.add(args["client_txn_id"])
+                result = self.results.get(args["client_txn_id"])
+                refunded = bool(result and result.get("success"))
+                if refunded:
+                    self.results[args["client_txn_id"]] = self._cancelled(result.get("amount"))
+            return {"success": True, "message": "Payment reversed", "refunded": refunded}
+        return self._process(op, args)
+
+    def _idempotent(self, op, args):
+        """Process a charge or capture once per client_txn_id; repeats wait for and share its result."""
+        txn = args["client_txn_id"]
+        with self._lock:
+            if txn in self.results:
+                return self.results[txn]
+            first = self._in_flight.get(txn)
+            if first is None:
+                self._in_flight[txn] = (threading.Event(), [])
+        if first is not None:
+            done, shared = first
+            done.wait()
+            return shared[0]
+        try:
+            result = self._process(op, args)
+        except Exception as e:
+            result = {"success": False, "message": f"Payment failed: {e}", "amount": args.get("amount"),
+                      "error_code": "TERMINAL_UNAVAILABLE"}
+        with self._lock:
+            if txn in self.reversed:
+                result = self._cancelled(args.get("amount"))
+            if result.get("error_code") != "ACQUIRER_UNAVAILABLE":
+                # An unreachable issuer is not final: the same ID is submitted again later
+                self.results[txn] = result
+            done, shared = self._in_flight.pop(txn)
+            shared.append(result)
+            done.set()
+        return result
+
+    @staticmethod
+    def _cancelled(amount):
+        return {"success": False, "message": "Payment cancelled", "amount": amount, "error_code": "CANCELLED"}
+
+    def _process(self, op, args):
+        """Return the result of a charge, preauthorize or capture."""
+        if op in ("charge", "preauthorize"):
+            time.sleep(self.delay)
+            amount = args["amount"]
+            if not self.acquirer_online:
+                return {"success": False, "message": "Payment failed: card issuer unreachable", "amount": amount,
+                        "error_code": "ACQUIRER_UNAVAILABLE"}
+            if random.random() >= self.approve_rate:
+                return {"success": False, "message": "Payment failed: Insufficient funds", "amount": amount,
+                        "error_code": "INSUFFICIENT_FUNDS"}
+            if op == "preauthorize":
+                auth_id = f"AUTH{random.randint(10000, 99999)}"
+                self.holds[auth_id] = amount
+                return {"success": True, "message": "Card authorized", "amount": amount, "auth_id": auth_id}
+            return {"success": True, "message": "Payment successful", "amount": amount,
+                    "transaction_id": f"TXN{random.randint(10000, 99999)}"}
+        if op == "capture":
+            amount = args["amount"]
+            authorized = self.holds.pop(args["auth_id"], None)
+            if authorized is None or amount > authorized:
+                return {"success": False, "message": "Payment failed: Authorization invalid", "amount": amount,
+                        "error_code": "AUTH_INVALID"}
+            return {"success": True, "message": "Payment successful", "amount": amount,
+                    "auth_id": args["auth_id"], "transaction_id": f"TXN{random.randint(10000, 99999)}"}
+        raise ValueError(f"Unknown operation {op!r}")
+
+
+class _EmulatorHandler(socketserver.StreamRequestHandler):
+    """One terminal connection of the emulator."""
+
+    def handle(self):
+        for line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(line)
+                result = self.server.handle_request_message(request.get("op"), request.get("args") or {})
+                response = {"id": request.get("id"), "ok": True, "result": result}
+            except Exception as e:
+                response = {"id": request.get("id"), "ok": False, "error": str(e)}
+            try:
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            except OSError:
+                return
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Payment terminal client and emulator.")
+    parser.add_argument("action", choices=["emulate", "bench"])
+    parser.add_argument("--host", default="127.0.0.1", help="Emulator listen address")
+    parser.add_argument("--port", type=int, default=7000, help="Emulator listen port")
+    parser.add_argument("--delay", type=float, default=2.0, help="Emulated charge processing time (s)")
+    parser.add_argument("--handshake-delay", type=float, default=0.3)
+    parser.add_argument("--approve-rate", type=float, default=0.5)
+    parser.add_argument("--acquirer-down", action="store_true", help="Emulate an unreachable card issuer")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Terminal to benchmark")
+    parser.add_argument("-n", "--charges", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.action == "emulate":
+        server = TerminalEmulator((args.host, args.port), args.delay, args.handshake_delay, args.approve_rate)
+        server.acquirer_online = not args.acquirer_down
+        print(f"Payment terminal emulator listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    client = TerminalClient(args.address)
+    failures = 0
+    for _ in range(args.charges):
+        if client.charge(1).get("error_code") in ("TIMEOUT", "TERMINAL_UNAVAILABLE"):
+            failures += 1
+    client.close()
+    for line in metrics.format_report():
+        print(line)
+    print(f"{failures} of {args.charges} charges did not reach the terminal")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Planogram: the physical slot layout of the vending machine.
+
+A planogram is a list of relay matrices. Each matrix has its own row labels
+and number of columns, and a location is a row label followed by a
+(possibly multi-digit) column number, e.g. 'C2' or 'K12'. Item codes are
+numbered from 1 across all matrices in row-major order.
+
+The layout is read from `planogram.json` if present:
+
+    {
+        "matrices": [
+            {"rows": ["A", "B", "C", "D", "E", "F", "G", "H"], "cols": 4},
+            {"rows": ["J", "K", "L", "M"], "cols": 10}
+        ]
+    }
+
+Without that file the classic single 8x4 (32-slot) grid is used.
+"""
+
+import json
+import os
+
+
+class Planogram:
+    """
+    Slot layout with O(1) lookups between item codes, locations and
+    (matrix, row, col) relay coordinates.
+    """
+
+    DEFAULT_MATRICES = [{"rows": ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H'], "cols": 4}]
+
+    def __init__(self, matrices=None):
+        """
+        Build the lookup tables for a layout.
+
+        Args:
+            matrices (list of dict, optional): One {"rows": [...], "cols": int}
+                                               entry per relay matrix.
+
+        Raises:
+            ValueError: If the layout is empty or row labels are invalid or repeated.
+        """
+        matrices = matrices or self.DEFAULT_MATRICES
+        self.shapes = []      # (row count, col count) per matrix
+        self._locations = []  # code - 1 -> location
+        self._coords = {}     # location -> (matrix, row, col)
+
+        for m, spec in enumerate(matrices):
+            rows = [str(label).upper() for label in spec["rows"]]
+            cols = int(spec["cols"])
+            if not rows or cols < 1:
+                raise ValueError(f"Matrix {m} must have at least one row and one column")
+
+            for r, label in enumerate(rows):
+                if not label.isalpha():
+                    raise ValueError(f"Invalid row label: {label!r}")
+                for c in range(cols):
+                    location = f"{label}{c + 1}"
+                    if location in self._coords:
+                        raise ValueError(f"Row label {label!r} is used more than once")
+                    self._coords[location] = (m, r, c)
+                    self._locations.append(location)
+            self.shapes.append((len(rows), cols))
+
+    @classmethod
+    def load(cls, path="planogram.json"):
+        """
+        Load a planogram from a JSON file, or the default layout if it does not exist.
+
+        Args:
+            path (str): Path to the planogram definition.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)["matrices"])
+
+    @property
+    def slot_count(self):
+        """Total number of slots across all matrices."""
+        return len(self._locations)
+
+    def coords(self, location):
+        """
+        Return the (matrix, row, col) relay coordinates of a location, or None.
+
+        Args:
+            location (str): Location code such as 'C2'.
+        """
+        return self._coords.get(location)
+
+    def location_for_code(self, code):
+        """Return the location assigned to an item code, or None if out of range."""
+        if 1 <= code <= len(self._locations):
+            return self._locations[code - 1]
+        return None
+
+    def default_items(self):
+        """Return an empty catalog for this layout in the legacy JSON layout."""
+        return {
+            str(code): {"name": "", "price": 0, "location": location}
+            for code, location in enumerate(self._locations, start=1)
+        }
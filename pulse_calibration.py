@@ -0,0 +1,123 @@
+"""
+Adaptive per-slot relay pulse calibration.
+
+Every confirmed vend reports how long the product took to break the drop
+sensor beam. Each slot keeps a smoothed drop time and its mean deviation
+(the same estimator TCP uses for round-trip times) and its pulse limit is
+set to the drop time plus four deviations (and at least a quarter above
+the drop time): short for light snacks, long for heavy bottles, and only
+as long as the slot reliably needs. A vend that times out backs the limit
+off by half again and widens the deviation to match, so an under-pulsed
+slot recovers on its next sale and stays recovered. The limit never goes
+above the relay controller's drop timeout, the longest a coil may stay
+energised.
+
+The learned profile is stored with the slot in the item database
+(`pulse_ms`, `drop_ms`, `drop_dev_ms`). Print the per-slot timing with:
+
+    python pulse_calibration.py report
+"""
+
+import argparse
+import sys
+
+
+# Estimator gains, as in RFC 6298
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+
+# First deviation as a share of the first drop time; RFC 6298 starts at
+# a half, which would put the first limit at three times the drop time
+INITIAL_DEV = 1 / 8
+
+# Pulse limits (milliseconds), used when the controller's drop timeout is
+# unknown, smallest margin over the drop time and growth factor after a
+# failed vend
+MIN_PULSE_MS = 150
+MAX_PULSE_MS = 4000
+MIN_MARGIN = 1.25
+BACKOFF = 1.5
+
+
+def update_profile(drop_ms, drop_dev_ms, pulse_ms, seconds, dropped, max_pulse_ms=MAX_PULSE_MS):
+    """
+    Fold one vend into a slot's pulse profile.
+
+    Args:
+        drop_ms (int or None): Smoothed drop time so far.
+        drop_dev_ms (int or None): Smoothed deviation of the drop time so far.
+        pulse_ms (int or None): Current pulse limit.
+        seconds (float): Time until the drop, or the pulse length used if
+                         nothing dropped.
+        dropped (bool): Whether the drop sensor confirmed the vend.
+        max_pulse_ms (int): Longest allowed limit, the controller's drop timeout.
+
+    Returns:
+        tuple: New (drop_ms, drop_dev_ms, pulse_ms), as integers.
+    """
+    observed = seconds * 1000
+    if not dropped:
+        pulse = min(max_pulse_ms, max(pulse_ms or 0, observed) * BACKOFF)
+        if drop_ms is not None:
+            drop_dev_ms = max(drop_dev_ms or 0, round((pulse - drop_ms) / K))
+        return drop_ms, drop_dev_ms, round(pulse)
+
+    if drop_ms is None:
+        drop, dev = observed, observed * INITIAL_DEV
+    else:
+        dev = (1 - BETA) * (drop_dev_ms or 0) + BETA * abs(drop_ms - observed)
+        drop = (1 - ALPHA) * drop_ms + ALPHA * observed
+    pulse = min(max_pulse_ms, max(MIN_PULSE_MS, drop * MIN_MARGIN, drop + K * dev))
+    return round(drop), round(dev), round(pulse)
+
+
+def report(catalog):
+    """
+    Return the per-slot timing of every calibrated slot.
+
+    Args:
+        catalog (Catalog): Catalog holding the profiles.
+
+    Returns:
+        list of tuple: (code, location, name, drop_ms, drop_dev_ms, pulse_ms),
+                       slowest slot first.
+    """
+    rows = [
+        (slot.code, slot.location, slot.name, slot.drop_ms, slot.drop_dev_ms, slot.pulse_ms)
+        for slot in map(catalog.get, catalog.codes())
+        if slot.pulse_ms is not None
+    ]
+    return sorted(rows, key=lambda row: row[5], reverse=True)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    from catalog import Catalog
+    from item_store import ItemStore
+    from planogram import Planogram
+
+    parser = argparse.ArgumentParser(description="Per-slot relay pulse calibration.")
+    parser.add_argument("action", choices=["report"])
+    parser.add_argument("--db", default="vending_items.db")
+    parser.add_argument("--planogram", default="planogram.json")
+    args = parser.parse_args(argv)
+
+    store = ItemStore(args.db)
+    catalog = Catalog(store, Planogram.load(args.planogram))
+    catalog.reload()
+    store.close()
+
+    rows = report(catalog)
+    if not rows:
+        print("No slot has been calibrated yet")
+        return 0
+    print(f"{'Code':>4}  {'Loc':<4}  {'Drop ms':>7}  {'+/- ms':>6}  {'Pulse ms':>8}  Name")
+    for code, location, name, drop, dev, pulse in rows:
+        print(f"{code:>4}  {location:<4}  {drop if drop is not None else '-':>7}  "
+              f"{dev if dev is not None else '-':>6}  {pulse:>8}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
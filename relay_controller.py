@@ -3,73 +3,216 @@
 -------------------------------------------------
 این ماژول جایگزین mock_relay_controller می‌شود و به صورت واقعی
 GPIO های Raspberry Pi را برای آزادسازی آیتم‌ها کنترل می‌کند.
+
+دسترسی به پین‌ها در متدهای setup / is_ready / _output / cleanup متمرکز است
+تا backend های دیگر (مثلاً gpiod_relay_controller) فقط همین‌ها را بازنویسی کنند.
 """
 
-import RPi.GPIO as GPIO
+import threading
 import time
 
+import metrics
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # روی سیستم‌هایی که فقط backend مبتنی بر gpiod دارند
+    GPIO = None
+
+
+class DropSensor:
+    """
+    سنسور سقوط محصول (پرتو مادون قرمز) در مسیر خروجی دستگاه.
+
+    با قطع شدن پرتو توسط محصول، روی پین ورودی یک لبه‌ی پایین‌رونده ایجاد
+    می‌شود که از طریق وقفه‌ی GPIO (بدون polling) گزارش می‌شود.
+    """
+
+    def __init__(self, pin, bouncetime_ms=20):
+        """
+        پارامترها:
+            pin: پین GPIO خروجی گیرنده‌ی IR (در حالت عادی HIGH)
+            bouncetime_ms: زمان نادیده گرفتن لرزش سیگنال (میلی‌ثانیه)
+        """
+        self.pin = pin
+        self.bouncetime_ms = bouncetime_ms
+        self._dropped = threading.Event()
+        self.setup()
+
+    def setup(self):
+        """پیکربندی پین ورودی و ثبت وقفه‌ی لبه‌ی پایین‌رونده (قابل تکرار)"""
+        GPIO.setmode(GPIO.BCM)
+        try:
+            GPIO.remove_event_detect(self.pin)
+        except (RuntimeError, ValueError):
+            pass
+        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.add_event_detect(self.pin, GPIO.FALLING, callback=self._on_edge, bouncetime=self.bouncetime_ms)
+
+    def is_ready(self):
+        """آیا پین هنوز به عنوان ورودی پیکربندی شده است؟"""
+        return GPIO.gpio_function(self.pin) == GPIO.IN
+
+    def _on_edge(self, channel):
+        """فراخوانی از نخ وقفه‌ی RPi.GPIO هنگام قطع شدن پرتو"""
+        self._dropped.set()
+
+    def arm(self):
+        """پاک کردن رخداد قبلی، درست پیش از روشن کردن رله"""
+        self._dropped.clear()
+
+    def wait(self, timeout):
+        """
+        انتظار برای سقوط محصول.
+
+        خروجی:
+            True اگر پرتو در مدت timeout قطع شد، در غیر این صورت False
+        """
+        return self._dropped.wait(timeout)
+
+    def cleanup(self):
+        """حذف وقفه و آزادسازی پین سنسور"""
+        try:
+            GPIO.remove_event_detect(self.pin)
+        except (RuntimeError, ValueError):
+            pass
+        GPIO.cleanup(self.pin)
+
 
 class RelayMatrix:
     """
     کلاس سطح پایین برای کنترل مستقیم ماتریس رله‌ها.
     """
 
-    def __init__(self, row_pins, col_pins, pulse_time=0.5):
+    def __init__(self, row_pins, col_pins, pulse_time=0.5, drop_sensor=None, drop_timeout=2.0):
         """
         پارامترها:
             row_pins: لیست پین‌های GPIO مربوط به ردیف‌ها (A تا H)
             col_pins: لیست پین‌های GPIO مربوط به ستون‌ها (1 تا 4)
-            pulse_time: مدت زمان فعال بودن هر رله (بر حسب ثانیه)
+            pulse_time: مدت زمان فعال بودن هر رله وقتی سنسور سقوط نداریم (ثانیه)
+            drop_sensor: سنسور سقوط (DropSensor) یا None
+            drop_timeout: حداکثر مدت روشن ماندن رله در انتظار سقوط محصول (ثانیه)
         """
         self.row_pins = row_pins
         self.col_pins = col_pins
         self.pulse_time = pulse_time
+        self.drop_sensor = drop_sensor
+        self.drop_timeout = drop_timeout
+
+        # تاخیر درایور (از فراخوانی activate تا روشن شدن رله) و مدت پالس
+        self.activate_latency = metrics.latency("relay.activate")
+        self.pulse_latency = metrics.latency("relay.pulse")
 
-        # تنظیم GPIO ها
+        # پین‌ها فقط یک بار هنگام راه‌اندازی تنظیم می‌شوند و بین تراکنش‌ها آماده می‌مانند
+        self.setup()
+
+    def setup(self):
+        """پیکربندی (یا پیکربندی دوباره‌ی) پین‌های خروجی و خاموش کردن همه‌ی آن‌ها"""
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
 
-        for pin in self.row_pins + self.col_pins:
-            GPIO.setup(pin, GPIO.OUT)
-            GPIO.output(pin, GPIO.LOW)
+        pins = self.row_pins + self.col_pins
+        GPIO.setup(pins, GPIO.OUT, initial=GPIO.LOW)
+        # آخرین مقدار نوشته‌شده روی هر پین (0 یا 1)
+        self._levels = dict.fromkeys(pins, 0)
 
-    def _reset(self):
-        """خاموش کردن همه‌ی ردیف‌ها و ستون‌ها"""
-        for pin in self.row_pins + self.col_pins:
-            GPIO.output(pin, GPIO.LOW)
+    def is_ready(self):
+        """آیا همه‌ی پین‌ها هنوز به عنوان خروجی پیکربندی شده‌اند؟"""
+        return all(GPIO.gpio_function(pin) == GPIO.OUT for pin in self.row_pins + self.col_pins)
 
-    def activate(self, row, col, status_callback=None):
+    def ensure_ready(self):
         """
-        فعال‌سازی یک رله مشخص با توجه به شماره ردیف و ستون.
+        بررسی وضعیت درایور پیش از هر فعال‌سازی و راه‌اندازی دوباره در
+        صورت خرابی (مثلاً اگر بخش دیگری از برنامه GPIO.cleanup را صدا زده باشد).
         """
-        if not (0 <= row < len(self.row_pins)) or not (0 <= col < len(self.col_pins)):
-            raise ValueError("Row or column index out of range")
+        if not self.is_ready():
+            print("Relay GPIO pins lost their configuration, re-initialising")
+            self.setup()
+        if self.drop_sensor and not self.drop_sensor.is_ready():
+            print("Drop sensor pin lost its configuration, re-initialising")
+            self.drop_sensor.setup()
 
-        self._reset()
-        GPIO.output(self.row_pins[row], GPIO.HIGH)
-        GPIO.output(self.col_pins[col], GPIO.HIGH)
+    def _output(self, levels):
+        """نوشتن مقدار چند پین با یک فراخوانی (levels: {pin: 0 یا 1})"""
+        GPIO.output(list(levels), list(levels.values()))
 
-        if status_callback:
-            status_callback(f"Dispensing from row {row}, col {col}...")
+    def _write(self, levels):
+        """
+        فقط پین‌هایی که مقدارشان با آخرین مقدار نوشته‌شده فرق دارد،
+        یک‌جا نوشته می‌شوند.
+        """
+        changed = {pin: level for pin, level in levels.items() if self._levels.get(pin) != level}
+        if changed:
+            self._output(changed)
+            self._levels.update(changed)
 
-        time.sleep(self.pulse_time)
-        self._reset()
+    def _reset(self, force=False):
+        """
+        خاموش کردن همه‌ی ردیف‌ها و ستون‌ها.
+        با force همه‌ی پین‌ها بدون توجه به مقدار قبلی دوباره نوشته می‌شوند.
+        """
+        if force:
+            self._levels = {}
+        self._write(dict.fromkeys(self.row_pins + self.col_pins, 0))
+
+    def _energize(self, row, col):
+        """روشن کردن ردیف و ستون یک رله با یک نوشتن"""
+        self._write({self.row_pins[row]: 1, self.col_pins[col]: 1})
 
-    def activate_by_index(self, index, status_callback=None):
+    def activate(self, row, col, status_callback=None, max_pulse=None):
         """
-        فعال‌سازی یک رله بر اساس اندیس عددی (0 تا 31).
+        فعال‌سازی یک رله مشخص با توجه به شماره ردیف و ستون.
+
+        با سنسور سقوط، رله تا لحظه‌ی قطع شدن پرتو (حداکثر drop_timeout)
+        روشن می‌ماند؛ بدون سنسور، به مدت ثابت pulse_time.
+        max_pulse (ثانیه، اختیاری) پروفایل پالس کالیبره‌شده‌ی همین اسلات
+        است و به جای هر دو مقدار پیش‌فرض استفاده می‌شود، ولی هرگز بیشتر
+        از drop_timeout نمی‌شود.
+
+        خروجی:
+            مدت زمان تا سقوط محصول (ثانیه)، یا None اگر در مهلت مقرر
+            سقوطی تشخیص داده نشد
         """
-        total_items = len(self.row_pins) * len(self.col_pins)
-        if not (0 <= index < total_items):
-            raise ValueError("Item index out of range (0–31)")
+        if not (0 <= row < len(self.row_pins)) or not (0 <= col < len(self.col_pins)):
+            raise ValueError("Row or column index out of range")
+
+        called = time.perf_counter()
+        try:
+            self.ensure_ready()
+            self._reset()
+        except (RuntimeError, OSError):
+            # پین‌ها در وضعیت نامعتبر هستند؛ یک بار دوباره راه‌اندازی می‌کنیم
+            self.setup()
+            self._reset()
+        failed = True
+        try:
+            if self.drop_sensor:
+                self.drop_sensor.arm()
+            self._energize(row, col)
+            start = time.perf_counter()
+            self.activate_latency.record(start - called)
+
+            if status_callback:
+                status_callback(f"Dispensing from row {row}, col {col}...")
 
-        row = index // len(self.col_pins)
-        col = index % len(self.col_pins)
-        self.activate(row, col, status_callback)
+            if self.drop_sensor:
+                dropped = self.drop_sensor.wait(min(max_pulse or self.drop_timeout, self.drop_timeout))
+            else:
+                time.sleep(max_pulse or self.pulse_time)
+                dropped = True
+            failed = False
+        finally:
+            # اگر نوشتن نیمه‌کاره مانده باشد، حافظه‌ی پین‌ها قابل اعتماد نیست؛
+            # پس همه‌ی پین‌ها دوباره نوشته می‌شوند تا هیچ سیم‌پیچی روشن نماند
+            self._reset(force=failed)
+        elapsed = time.perf_counter() - start
+        self.pulse_latency.record(elapsed)
+        return elapsed if dropped else None
 
     def cleanup(self):
-        """آزادسازی منابع GPIO"""
-        GPIO.cleanup()
+        """آزادسازی پین‌های این ماتریس (فقط هنگام خاموش شدن برنامه)"""
+        self._reset(force=True)
+        GPIO.cleanup(self.row_pins + self.col_pins)
 
 
 class RelayController:
@@ -77,63 +220,147 @@ class RelayController:
     کنترلر سطح بالا برای آزادسازی آیتم‌ها در وندینگ ماشین.
     """
 
-    def __init__(self, item_lookup_func):
+    # ⚠️ توجه: شماره پین‌ها باید متناسب با سیم‌کشی واقعی تغییر یابد
+    DEFAULT_MATRIX_PINS = [
+        ([17, 27, 22, 23, 24, 25, 8, 7],   # A تا H
+         [5, 6, 13, 19]),                  # 1 تا 4
+    ]
+
+    # مکث بین دو آیتم وقتی سنسور سقوط نداریم (فرصت برای ایستادن فنر)
+    SETTLE_TIME = 0.5
+
+    def __init__(self, item_lookup_func, matrix_pins=None, sensor_pin=None,
+                 pulse_time=1, drop_timeout=2.0):
         """
         پارامترها:
-            item_lookup_func: تابعی برای دریافت اطلاعات آیتم بر اساس کد آن.
+            item_lookup_func: تابعی برای دریافت Slot بر اساس کد عددی آیتم.
+            matrix_pins: لیست (row_pins, col_pins) برای هر ماتریس رله،
+                         به همان ترتیب ماتریس‌های planogram
+            sensor_pin: پین GPIO سنسور سقوط مشترک محفظه‌ی خروجی، یا None
+                        برای حالت قدیمی با پالس زمانی ثابت
+            pulse_time: مدت پالس هر رله وقتی سنسور سقوط نداریم (ثانیه)
+            drop_timeout: حداکثر زمان انتظار برای سقوط هر محصول (ثانیه)
         """
         self.item_lookup_func = item_lookup_func
+        self.drop_timeout = drop_timeout
+
+        self.drop_sensor = self._make_sensor(sensor_pin) if sensor_pin is not None else None
+        self.matrices = [
+            self._make_matrix(row_pins, col_pins, pulse_time=pulse_time,
+                              drop_sensor=self.drop_sensor, drop_timeout=drop_timeout)
+            for row_pins, col_pins in (matrix_pins or self.DEFAULT_MATRIX_PINS)
+        ]
+        # سازگاری با کد قدیمی که فقط یک ماتریس داشت
+        self.matrix = self.matrices[0]
+        self.row_pins = self.matrix.row_pins
+        self.col_pins = self.matrix.col_pins
+
+    def _make_sensor(self, pin):
+        """ساخت سنسور سقوط (در backend های دیگر بازنویسی می‌شود)"""
+        return DropSensor(pin)
 
-        # ⚠️ توجه: شماره پین‌ها باید متناسب با سیم‌کشی واقعی تغییر یابد
-        self.row_pins = [17, 27, 22, 23, 24, 25, 8, 7]   # A تا H
-        self.col_pins = [5, 6, 13, 19]                   # 1 تا 4
+    def _make_matrix(self, row_pins, col_pins, **kwargs):
+        """ساخت ماتریس رله (در backend های دیگر بازنویسی می‌شود)"""
+        return RelayMatrix(row_pins, col_pins, **kwargs)
 
-        self.matrix = RelayMatrix(self.row_pins, self.col_pins, pulse_time=1)
+    def all_off(self):
+        """خاموش کردن همه‌ی رله‌ها (بدون فعال‌سازی؛ برای توقف اضطراری و بنچمارک)"""
+        for matrix in self.matrices:
+            matrix._reset(force=True)
 
-    def location_to_index(self, location: str):
+    def benchmark_ops(self):
         """
-        تبدیل location مثل 'C2' به اندیس عددی (0 تا 31).
+        عملیات بی‌خطر درایور برای بنچمارک (hardware.py benchmark):
+        خاموش کردن کامل، بررسی آمادگی، و یک چرخه‌ی روشن/خاموش که فقط پین
+        ستون را تغییر می‌دهد؛ بدون روشن شدن ردیف، هیچ سیم‌پیچی برق نمی‌گیرد.
         """
-        if not location or len(location) < 2:
-            raise ValueError(f"Invalid location: {location}")
+        matrix = self.matrix
 
-        row_letter = location[0].upper()
-        col_number = int(location[1])  # ستون (1 تا 4)
+        def column_cycle():
+            matrix._write({matrix.col_pins[0]: 1})
+            matrix._write({matrix.col_pins[0]: 0})
 
-        row_index = ord(row_letter) - ord('A')  # A=0 … H=7
-        col_index = col_number - 1              # 1=0 … 4=3
+        return {"all_off": self.all_off, "is_ready": self.is_ready, "column_cycle": column_cycle}
 
-        return row_index * len(self.col_pins) + col_index
+    def test_relay(self, matrix, row, col, pulse):
+        """
+        یک پالس کوتاه روی یک رله برای تست سخت‌افزار (self_test).
 
-    def dispense(self, selected_items, status_callback):
+        خروجی:
+            (مدت فعال‌سازی به ثانیه، افتاد؟)؛ بدون سنسور سقوط مقدار دوم None است
+        """
+        start = time.perf_counter()
+        elapsed = self.matrices[matrix].activate(row, col, max_pulse=pulse)
+        seconds = time.perf_counter() - start
+        if not self.drop_sensor:
+            return seconds, None
+        return seconds, elapsed is not None
+
+    def is_ready(self):
+        """آیا همه‌ی پین‌های رله و سنسور هنوز پیکربندی شده‌اند؟"""
+        return (all(matrix.is_ready() for matrix in self.matrices)
+                and (self.drop_sensor is None or self.drop_sensor.is_ready()))
+
+    def dispense(self, selected_items, status_callback, cancel_event=None, timings=None):
         """
         آزادسازی لیست آیتم‌ها.
 
         پارامترها:
-            selected_items: لیستی از آیتم‌های انتخاب‌شده توسط کاربر
+            selected_items: لیستی از اسلات‌های (Slot) انتخاب‌شده توسط کاربر
             status_callback: تابعی برای ارسال پیام وضعیت به UI
+            cancel_event: رخداد (threading.Event) لغو؛ پیش از هر آیتم بررسی می‌شود
+            timings: لیستی که (کد، زمان به ثانیه، افتاد؟) هر فعال‌سازی تأییدشده
+                     با سنسور سقوط به آن اضافه می‌شود (برای pulse_calibration)
+
+        خروجی:
+            لیست آیتم‌هایی که با موفقیت آزاد شدند؛ با سنسور سقوط، آیتمی
+            که در مهلت مقرر نیفتاده است در این لیست نمی‌آید
         """
         status_callback("Starting dispensing process...")
-        time.sleep(1)
 
+        dispensed = []
         for item in selected_items:
-            info = self.item_lookup_func(item["code"])
-            if not info:
-                status_callback(f"Error: Item code {item['code']} not found!")
+            if cancel_event is not None and cancel_event.is_set():
+                status_callback("Dispensing cancelled")
+                break
+
+            slot = self.item_lookup_func(item.code)
+            if not slot:
+                status_callback(f"Error: Item code {item.code} not found!")
                 continue
 
-            loc = info.get("location")
-            if not loc:
-                status_callback(f"Error: Item {item['code']} has no location info")
+            # مختصات رله هنگام بارگذاری کاتالوگ از روی planogram محاسبه شده است
+            if slot.matrix is None or slot.matrix >= len(self.matrices):
+                status_callback(f"Error: Item {item.code} has no location info")
                 continue
 
             try:
-                index = self.location_to_index(loc)
-                self.matrix.activate_by_index(index, status_callback)
-                status_callback(f"Dispensed: {item['name']} from {loc}")
-                time.sleep(0.5)
+                matrix = self.matrices[slot.matrix]
+                max_pulse = min(slot.pulse_ms / 1000, matrix.drop_timeout) if slot.pulse_ms else None
+                elapsed = matrix.activate(slot.row, slot.col, status_callback, max_pulse)
+                if timings is not None and self.drop_sensor:
+                    timings.append((item.code, elapsed or max_pulse or matrix.drop_timeout, elapsed is not None))
+                if elapsed is None:
+                    status_callback(f"Error: No drop detected for {item.name} from {slot.location}")
+                    continue
+                status_callback(f"Dispensed: {item.name} from {slot.location}")
+                dispensed.append(item)
+                if not self.drop_sensor:
+                    time.sleep(self.SETTLE_TIME)
             except Exception as e:
-                status_callback(f"Error dispensing {item['name']}: {e}")
+                status_callback(f"Error dispensing {item.name}: {e}")
 
-        self.matrix.cleanup()
-        status_callback("Dispensing completed successfully")
+        if len(dispensed) == len(selected_items):
+            status_callback("Dispensing completed successfully")
+        else:
+            status_callback("Dispensing completed with errors")
+        return dispensed
+
+    def close(self):
+        """
+        آزادسازی همه‌ی منابع GPIO؛ فقط یک بار هنگام خروج از برنامه صدا زده شود.
+        """
+        for matrix in self.matrices:
+            matrix.cleanup()
+        if self.drop_sensor:
+            self.drop_sensor.cleanup()
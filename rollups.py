@@ -0,0 +1,186 @@
+"""
+Incremental sales rollups computed from the transaction ledger.
+
+`SalesRollup` keeps per-item, per-hour unit and revenue counters in a
+small SQLite table keyed by (hour, code). It is updated with every batch
+the ledger commits, so the admin screen can query any time window with an
+indexed range scan instead of rescanning the ledger history.
+"""
+
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+
+def hour_bucket(ts):
+    """Return the start of the hour (Unix time) containing `ts`."""
+    return int(ts) // 3600 * 3600
+
+
+class SalesRollup:
+    """
+    Time-bucketed sales counters fed from dispense records of the ledger.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sales_hourly (
+            hour    INTEGER NOT NULL,
+            code    INTEGER NOT NULL,
+            name    TEXT    NOT NULL DEFAULT '',
+            units   INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, code)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    UPSERT = (
+        "INSERT INTO sales_hourly (hour, code, name, units, revenue) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (hour, code) DO UPDATE SET "
+        "name = excluded.name, units = units + excluded.units, revenue = revenue + excluded.revenue"
+    )
+
+    def __init__(self, db_file, ledger=None):
+        """
+        Open the rollup store and, if a ledger is given, catch up with it
+        and subscribe to its commits.
+
+        Args:
+            db_file (str): Path to the rollup SQLite database.
+            ledger (Ledger, optional): Ledger to follow.
+        """
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+        if ledger is not None:
+            self.catch_up(ledger)
+            ledger.add_listener(self.apply)
+
+    @staticmethod
+    def _aggregate(records):
+        """
+        Fold dispense records into {(hour, code): [name, units, revenue]} and
+        return it together with the newest record time seen.
+        """
+        buckets = defaultdict(lambda: ["", 0, 0])
+        last_ts = None
+        for record in records:
+            last_ts = max(last_ts or 0, record.get("ts", 0))
+            if record.get("type") != "dispense":
+                continue
+            hour = hour_bucket(record["ts"])
+            prices = {item["code"]: item for item in record.get("items", [])}
+            for code in record.get("dispensed", []):
+                item = prices.get(code, {})
+                bucket = buckets[(hour, code)]
+                bucket[0] = item.get("name", "")
+                bucket[1] += 1
+                bucket[2] += int(item.get("price", 0))
+        return buckets, last_ts
+
+    def _write(self, buckets, last_ts, replace=False):
+        """Write aggregated buckets and the high-water mark in one transaction."""
+        rows = [(hour, code, name, units, revenue)
+                for (hour, code), (name, units, revenue) in buckets.items()]
+        with self._lock, self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM sales_hourly")
+            self.conn.executemany(self.UPSERT, rows)
+            if last_ts is not None:
+                # Never move the high-water mark back, whatever order batches arrive in
+                self.conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('applied_through', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value "
+                    "WHERE ? OR CAST(excluded.value AS REAL) > CAST(value AS REAL)",
+                    (repr(last_ts), replace)
+                )
+
+    def apply(self, records):
+        """
+        Add a batch of committed ledger records to the counters.
+
+        Registered as a ledger listener: it runs on the ledger's writer
+        thread after the batch is committed and outside the lock taken by
+        Ledger.append(), so its SQLite commit never delays the UI thread.
+
+        Args:
+            records (list of dict): Ledger records, oldest first.
+        """
+        buckets, last_ts = self._aggregate(records)
+        self._write(buckets, last_ts)
+
+    def applied_through(self):
+        """Return the `ts` of the newest ledger record already counted, or None."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'applied_through'").fetchone()
+        return float(row[0]) if row else None
+
+    def catch_up(self, ledger):
+        """
+        Count ledger records committed after the last applied one, e.g. after
+        a crash between a ledger commit and the rollup update. Only the
+        segments from that day onward are read.
+        """
+        since = self.applied_through()
+        if since is None:
+            self.rebuild(ledger)
+        else:
+            buckets, last_ts = self._aggregate(ledger.read(since))
+            self._write(buckets, last_ts)
+
+    def rebuild(self, ledger):
+        """
+        Recompute all counters from the full ledger.
+
+        The whole history is folded in one streaming pass into in-memory
+        buckets and written back with a single bulk insert.
+        """
+        buckets, last_ts = self._aggregate(ledger.read())
+        self._write(buckets, last_ts, replace=True)
+
+    def by_item(self, start, end=None):
+        """
+        Return per-item totals for a time window.
+
+        Args:
+            start (float): Window start (Unix time).
+            end (float, optional): Window end (Unix time), defaults to now.
+
+        Returns:
+            list of tuple: (code, name, units, revenue), highest revenue first.
+        """
+        end = time.time() if end is None else end
+        with self._lock:
+            return self.conn.execute(
+                "SELECT code, MAX(name), SUM(units), SUM(revenue) FROM sales_hourly "
+                "WHERE hour >= ? AND hour <= ? GROUP BY code ORDER BY SUM(revenue) DESC",
+                (hour_bucket(start), end)
+            ).fetchall()
+
+    def by_hour(self, start, end=None):
+        """
+        Return per-hour totals for a time window.
+
+        Args:
+            start (float): Window start (Unix time).
+            end (float, optional): Window end (Unix time), defaults to now.
+
+        Returns:
+            list of tuple: (hour, units, revenue), oldest hour first.
+        """
+        end = time.time() if end is None else end
+        with self._lock:
+            return self.conn.execute(
+                "SELECT hour, SUM(units), SUM(revenue) FROM sales_hourly "
+                "WHERE hour >= ? AND hour <= ? GROUP BY hour ORDER BY hour",
+                (hour_bucket(start), end)
+            ).fetchall()
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
@@ -0,0 +1,114 @@
+"""
+Relay self-test sweep.
+
+After a service visit every relay of the planogram is pulsed once, in
+slot order, with a short pulse that clicks the relay without turning a
+spiral far enough to vend ("self_test_pulse" in the "relay" section of
+hardware.json, 0.1 s by default). Each slot reports the time its
+activation took and, where a drop sensor is fitted, whether the sensor
+saw a product fall (which means the pulse was long enough to vend). A
+slot fails if its relay could not be driven.
+
+The sweep runs from the admin panel or headless against any relay backend:
+
+    python self_test.py --backend mock --pulse 0.1
+    python self_test.py --backend gpiod --only A1 --only B3
+"""
+
+import argparse
+import sys
+
+import hardware
+from planogram import Planogram
+
+
+DEFAULT_PULSE = 0.1
+
+
+def configured_pulse(config):
+    """Return the self-test pulse from the "relay" section of the hardware configuration."""
+    return float(config["relay"].get("self_test_pulse", DEFAULT_PULSE))
+
+
+def sweep(controller, planogram, pulse=DEFAULT_PULSE, locations=None, status_callback=None,
+          cancel_event=None):
+    """
+    Pulse every relay of the planogram once, one after the other.
+
+    Args:
+        controller: Relay controller built by hardware.create_relay_controller().
+        planogram (Planogram): Layout giving the (matrix, row, col) of each slot.
+        pulse (float): Pulse length per relay, in seconds.
+        locations (list of str, optional): Only test these slots.
+        status_callback (callable, optional): Receives a progress message per slot.
+        cancel_event (threading.Event, optional): Stops the sweep before the next slot.
+
+    Returns:
+        list of tuple: (location, seconds, dropped, error) per tested slot, where
+                       `dropped` is None without a drop sensor and `error` is
+                       None if the relay was driven.
+    """
+    results = []
+    try:
+        for code in range(1, planogram.slot_count + 1):
+            location = planogram.location_for_code(code)
+            if locations and location not in locations:
+                continue
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if status_callback:
+                status_callback(f"Testing {location}...")
+            try:
+                seconds, dropped = controller.test_relay(*planogram.coords(location), pulse)
+                results.append((location, seconds, dropped, None))
+            except Exception as e:
+                results.append((location, None, None, str(e)))
+    finally:
+        controller.all_off()
+    return results
+
+
+def format_table(results):
+    """Return the sweep results as table lines, with a pass/fail summary last."""
+    lines = [f"{'Slot':<5} {'Time s':>7}  {'Drop':<4}  Result"]
+    for location, seconds, dropped, error in results:
+        drop = "-" if dropped is None else ("yes" if dropped else "no")
+        time_s = f"{seconds:.3f}" if seconds is not None else "-"
+        lines.append(f"{location:<5} {time_s:>7}  {drop:<4}  {'FAIL: ' + error if error else 'pass'}")
+    failed = sum(1 for result in results if result[3])
+    lines.append(f"{len(results) - failed} passed, {failed} failed")
+    return lines
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Pulse every relay once and report the timings.")
+    parser.add_argument("--config", default="hardware.json")
+    parser.add_argument("--planogram", default="planogram.json")
+    parser.add_argument("--backend", help="Relay backend to test; defaults to the configured one")
+    parser.add_argument("--pulse", type=float, help="Pulse length per relay (s); defaults to the configured one")
+    parser.add_argument("--only", action="append", help="Test only this slot (repeatable)")
+    args = parser.parse_args(argv)
+
+    config = hardware.load_config(args.config)
+    if args.backend:
+        config["relay"]["backend"] = args.backend
+    planogram = Planogram.load(args.planogram)
+    locations = [location.upper() for location in args.only or []]
+    unknown = [location for location in locations if planogram.coords(location) is None]
+    if unknown:
+        parser.error(f"Unknown slot(s): {', '.join(unknown)}")
+    controller = hardware.create_relay_controller(
+        config, lambda code: None, planogram, hardware.create_clock(config)
+    )
+    try:
+        results = sweep(controller, planogram, args.pulse or configured_pulse(config), locations)
+    finally:
+        controller.close()
+    for line in format_table(results):
+        print(line)
+    return 1 if any(result[3] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Injectable clocks for the simulated hardware and payment terminal.
+
+The mock relay controller and card reader never call `time.sleep`
+directly; they ask their clock. Three clocks are available:
+
+    RealClock       real time (the default)
+    ScaledClock     every delay runs N times faster
+    SteppedClock    delays take no real time; virtual time jumps to the
+                    next pending wake-up, so sleepers always wake in
+                    deadline order, exactly as they would in real time
+
+A headless soak test drives the mocks through many transactions:
+
+    python sim_clock.py soak -n 1000 --clock stepped
+"""
+
+import argparse
+import contextlib
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+
+class RealClock:
+    """Wall-clock time."""
+
+    def now(self):
+        """Return monotonic time in seconds."""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """Block for `seconds` of real time."""
+        time.sleep(seconds)
+
+
+class ScaledClock:
+    """
+    Time running `speed` times faster than real time.
+    """
+
+    def __init__(self, speed):
+        """
+        Args:
+            speed (float): Speed-up factor, e.g. 50 turns a 2 s delay into 40 ms.
+        """
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.speed = speed
+        self._start = time.monotonic()
+
+    def now(self):
+        """Return the virtual time in seconds since the clock was created."""
+        return (time.monotonic() - self._start) * self.speed
+
+    def sleep(self, seconds):
+        """Block for `seconds` of virtual time."""
+        time.sleep(seconds / self.speed)
+
+
+class SteppedClock:
+    """
+    Discrete-event clock: virtual time only moves when it is stepped.
+
+    Each `sleep` registers a deadline and blocks until virtual time
+    reaches it. `step()` advances time to the earliest pending deadline
+    and wakes its sleepers, so threads wake in the same order as with a
+    real clock without any real waiting. With `auto_step` a background
+    thread steps whenever a sleeper is pending and no other thread has
+    registered a sleep for `quiescence` seconds of real time.
+    """
+
+    def __init__(self, start=0.0, auto_step=True, quiescence=0.002):
+        """
+        Args:
+            start (float): Initial virtual time.
+            auto_step (bool): Step automatically instead of by the caller.
+            quiescence (float): Real time to wait for other threads to
+                                register their sleeps before stepping.
+        """
+        self._now = start
+        self._waiters = []   # Heap of (deadline, sequence number)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.quiescence = quiescence
+        if auto_step:
+            threading.Thread(target=self._run, name="stepped-clock", daemon=True).start()
+
+    def now(self):
+        """Return the current virtual time in seconds."""
+        with self._cond:
+            return self._now
+
+    def sleep(self, seconds):
+        """Block until virtual time has advanced by `seconds`."""
+        with self._cond:
+            entry = (self._now + max(0.0, seconds), next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            self._cond.notify_all()
+            while self._now < entry[0] and not self._closed:
+                self._cond.wait()
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    def pending(self):
+        """Return the number of threads waiting for a future deadline."""
+        with self._cond:
+            return sum(1 for deadline, _ in self._waiters if deadline > self._now)
+
+    def advance(self, seconds):
+        """Move virtual time forward and wake every sleeper now due."""
+        with self._cond:
+            self._now += seconds
+            self._cond.notify_all()
+
+    def step(self):
+        """
+        Advance to the earliest pending deadline.
+
+        Returns:
+            bool: False if no thread was waiting.
+        """
+        with self._cond:
+            future = [deadline for deadline, _ in self._waiters if deadline > self._now]
+            if not future:
+                return False
+            self._now = min(future)
+            self._cond.notify_all()
+            return True
+
+    def _run(self):
+        """Auto-stepper: step once the sleeping threads have settled."""
+        while True:
+            with self._cond:
+                while not self._closed and not any(d > self._now for d, _ in self._waiters):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                registered = len(self._waiters)
+            time.sleep(self.quiescence)
+            with self._cond:
+                # Another thread just went to sleep; give the rest a chance too
+                if len(self._waiters) != registered:
+                    continue
+            self.step()
+
+    def close(self):
+        """Stop the auto-stepper and release every sleeper."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+REAL_CLOCK = RealClock()
+
+
+def create_clock(name="real", speed=1.0):
+    """
+    Build a clock by name.
+
+    Args:
+        name (str): "real", "scaled" or "stepped".
+        speed (float): Speed-up factor of the scaled clock.
+
+    Raises:
+        ValueError: If the name is unknown.
+    """
+    if name == "real":
+        return REAL_CLOCK
+    if name == "scaled":
+        return ScaledClock(speed)
+    if name == "stepped":
+        return SteppedClock()
+    raise ValueError(f"Unknown clock {name!r} (available: real, scaled, stepped)")
+
+
+class _SoakSlot:
+    """Minimal stand-in for a catalog Slot."""
+
+    def __init__(self, code):
+        self.code = code
+        self.name = f"Item {code}"
+        self.price = 10000
+        self.location = f"A{code}"
+        self.row = 0
+        self.col = code - 1
+        self.pulse_ms = None
+
+
+def soak(transactions, clock, seed=None, failure_rate=0.0):
+    """
+    Run payments and dispenses through the mock hardware.
+
+    Args:
+        transactions (int): Number of purchases.
+        clock: Clock injected into the mocks.
+        seed (int, optional): Seed for the simulated outcomes.
+        failure_rate (float): Probability of a failed vend per item.
+
+    Returns:
+        dict: Counters plus virtual and wall-clock duration.
+    """
+    from mock_card_reader import CardReader
+    from mock_relay_controller import RelayController
+
+    if seed is not None:
+        random.seed(seed)
+    slots = {code: _SoakSlot(code) for code in range(1, 5)}
+    reader = CardReader(clock=clock)
+    relay = RelayController(slots.get, failure_rate=failure_rate, clock=clock)
+
+    totals = {"transactions": transactions, "paid": 0, "items": 0, "dispensed": 0}
+    started, wall = clock.now(), time.perf_counter()
+    for _ in range(transactions):
+        cart = random.sample(list(slots.values()), random.randint(1, 3))
+        result = reader.charge(sum(slot.price for slot in cart))
+        if not result.get("success"):
+            continue
+        totals["paid"] += 1
+        totals["items"] += len(cart)
+        totals["dispensed"] += len(relay.dispense(cart, lambda msg: None))
+    totals["virtual_seconds"] = clock.now() - started
+    totals["wall_seconds"] = time.perf_counter() - wall
+    return totals
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Simulated hardware soak test.")
+    parser.add_argument("action", choices=["soak"])
+    parser.add_argument("-n", "--transactions", type=int, default=1000)
+    parser.add_argument("--clock", choices=["real", "scaled", "stepped"], default="stepped")
+    parser.add_argument("--speed", type=float, default=100.0, help="Speed-up factor of the scaled clock")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    clock = create_clock(args.clock, args.speed)
+    # Keep the mocks' per-item relay messages out of the summary
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        totals = soak(args.transactions, clock, args.seed, args.failure_rate)
+    for key, value in totals.items():
+        print(f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
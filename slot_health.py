@@ -0,0 +1,114 @@
+"""
+Per-slot vend health and automatic out-of-service marking.
+
+Every relay activation checked by the drop sensor counts towards its
+slot's health: the number of attempts, the sensor timeouts (nothing fell)
+and a moving average of the pulse time. A slot whose spiral jams keeps
+timing out; after FAILURE_LIMIT timeouts in a row it is marked out of
+service, so the user panel stops selling it until an admin has cleared
+the jam and put it back in service. Without a drop sensor a jam cannot
+be detected and the counters stay at zero.
+
+The counters are stored with the slot in the item database. Print them
+with:
+
+    python slot_health.py report
+"""
+
+import argparse
+import sys
+
+
+# Consecutive sensor timeouts after which a slot is taken out of service
+FAILURE_LIMIT = 3
+
+# Weight of the newest sample in the moving average of the pulse time
+ALPHA = 1 / 8
+
+
+def update_health(attempts, timeouts, fail_streak, avg_pulse_ms, seconds, dropped):
+    """
+    Fold one relay activation into a slot's health counters.
+
+    Args:
+        attempts (int): Activations counted so far.
+        timeouts (int): Activations the drop sensor never confirmed.
+        fail_streak (int): Timeouts since the last confirmed vend.
+        avg_pulse_ms (int or None): Moving average of the pulse time.
+        seconds (float): Time until the drop, or the pulse length used if
+                         nothing dropped.
+        dropped (bool): Whether the drop sensor confirmed the vend.
+
+    Returns:
+        tuple: New (attempts, timeouts, fail_streak, avg_pulse_ms, failing),
+               where `failing` is True once the streak reaches FAILURE_LIMIT.
+    """
+    observed = seconds * 1000
+    if avg_pulse_ms is not None:
+        observed = (1 - ALPHA) * avg_pulse_ms + ALPHA * observed
+    if dropped:
+        fail_streak = 0
+    else:
+        timeouts += 1
+        fail_streak += 1
+    return attempts + 1, timeouts, fail_streak, round(observed), fail_streak >= FAILURE_LIMIT
+
+
+def success_rate(slot):
+    """Return the share of confirmed vends of a slot (0..1), or None if never activated."""
+    if not slot.attempts:
+        return None
+    return (slot.attempts - slot.timeouts) / slot.attempts
+
+
+def report(catalog):
+    """
+    Return the health of every slot that has been activated.
+
+    Args:
+        catalog (Catalog): Catalog holding the counters.
+
+    Returns:
+        list of tuple: (code, location, name, attempts, success_rate, timeouts,
+                       avg_pulse_ms, out_of_service), least reliable slot first.
+    """
+    rows = [
+        (slot.code, slot.location, slot.name, slot.attempts, success_rate(slot), slot.timeouts,
+         slot.avg_pulse_ms, slot.out_of_service)
+        for slot in map(catalog.get, catalog.codes())
+        if slot.attempts
+    ]
+    return sorted(rows, key=lambda row: (not row[7], row[4]))
+
+
+def main(argv=None):
+    """Command line entry point."""
+    from catalog import Catalog
+    from item_store import ItemStore
+    from planogram import Planogram
+
+    parser = argparse.ArgumentParser(description="Per-slot vend health.")
+    parser.add_argument("action", choices=["report"])
+    parser.add_argument("--db", default="vending_items.db")
+    parser.add_argument("--planogram", default="planogram.json")
+    args = parser.parse_args(argv)
+
+    store = ItemStore(args.db)
+    catalog = Catalog(store, Planogram.load(args.planogram))
+    catalog.reload()
+    store.close()
+
+    rows = report(catalog)
+    if not rows:
+        print("No slot has been activated with a drop sensor yet")
+        return 0
+    print(f"{'Code':>4}  {'Loc':<4}  {'Vends':>5}  {'OK %':>5}  {'Timeouts':>8}  {'Pulse ms':>8}  Status   Name")
+    for code, location, name, attempts, rate, timeouts, pulse, out_of_service in rows:
+        status = "DISABLED" if out_of_service else "ok"
+        print(f"{code:>4}  {location:<4}  {attempts:>5}  {rate * 100:>5.1f}  {timeouts:>8}  "
+              f"{pulse if pulse is not None else '-':>8}  {status:<8} {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
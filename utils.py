@@ -0,0 +1,51 @@
+"""
+Small helpers shared across the vending machine modules.
+"""
+
+import json
+import os
+
+
+def fsync_dir(path):
+    """
+    Flush a directory entry to disk so a rename inside it survives a power cut.
+
+    Args:
+        path (str): Directory path.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_replace(tmp_path, path):
+    """
+    Durably move a fully written temporary file over `path`.
+
+    The temp file is fsynced before the rename and the directory after it,
+    so readers only ever see the old file or the complete new one.
+
+    Args:
+        tmp_path (str): Path of the completely written temporary file.
+        path (str): Final destination path.
+    """
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def atomic_write_json(path, data):
+    """
+    Write JSON data to `path` using temp-file-plus-rename.
+
+    Args:
+        path (str): Destination file.
+        data: JSON-serializable object.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    fsync_replace(tmp_path, path)